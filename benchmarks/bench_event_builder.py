@@ -0,0 +1,65 @@
+"""
+Compares how many events per second can be stamped, hashed, signed and
+serialized into EVENT messages by the original ClientManager path and by
+EventBuilder.
+
+Run from the repository root:
+    $ python benchmarks/bench_event_builder.py
+"""
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+
+from constants import ClientMessageType
+from event import BaseEvent, TextEvent
+from event_builder import EventBuilder
+from key_pair import KeyPair
+
+EVENT_COUNT = 5000
+
+
+def original_path(keys, event):
+    (timestamp, serialized_event) = event.stamped_event()
+    id_of_event = BaseEvent.get_id_from_stamped_event(serialized_event)
+    signature = keys.sign_bytes(bytes.fromhex(id_of_event))
+    return json.dumps([
+        ClientMessageType.EVENT,
+        {
+            "id": id_of_event,
+            "pubkey": event.author,
+            "created_at": timestamp,
+            "kind": event.get_kind(),
+            "tags": event.tags,
+            "content": event.content,
+            "sig": signature
+        }
+    ])
+
+
+def events_per_second(build, events):
+    start = time.perf_counter()
+    for event in events:
+        build(event)
+    return len(events) / (time.perf_counter() - start)
+
+
+def main():
+    keys = KeyPair.create_new_key_pair()
+    events = []
+    for i in range(EVENT_COUNT):
+        event = TextEvent(keys.pubkey_hex_string(), f"Benchmark note number {i}")
+        event.tag_user(keys.pubkey_hex_string())
+        events.append(event)
+    builder = EventBuilder(keys)
+
+    before = events_per_second(lambda event: original_path(keys, event), events)
+    after = events_per_second(builder.build, events)
+    print(f"original path: {before:10.0f} events/s")
+    print(f"EventBuilder:  {after:10.0f} events/s ({after / before:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
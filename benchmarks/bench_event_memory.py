@@ -0,0 +1,71 @@
+"""
+Measures how many bytes each event takes when holding many of them in memory,
+as the dicts relays send and as CompactEvents.
+
+Run from the repository root:
+    $ python benchmarks/bench_event_memory.py
+    $ python benchmarks/bench_event_memory.py --count 100000
+"""
+import argparse
+import gc
+import os
+import random
+import sys
+import tracemalloc
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+
+from compact_event import CompactEvent
+
+EVENT_COUNT = 1000000
+AUTHOR_COUNT = 1000
+
+
+def random_hex(rng, byte_count):
+    return rng.getrandbits(byte_count * 8).to_bytes(byte_count, "big").hex()
+
+
+def make_events(count):
+    """
+    Makes text notes from a limited set of authors, each replying to an event and mentioning a user.
+    The hex strings are created for every event, as they would be when parsed from relay messages.
+    """
+    rng = random.Random(0)
+    authors = [random_hex(rng, 32) for _ in range(AUTHOR_COUNT)]
+    for i in range(count):
+        author = rng.choice(authors)
+        yield {
+            "id": random_hex(rng, 32),
+            "pubkey": bytes.fromhex(author).hex(),
+            "created_at": 1700000000 + i,
+            "kind": 1,
+            "tags": [["e", random_hex(rng, 32)], ["p", bytes.fromhex(rng.choice(authors)).hex()]],
+            "content": f"Note number {i}, a typical short text note.",
+            "sig": random_hex(rng, 64),
+        }
+
+
+def bytes_per_event(count, convert):
+    gc.collect()
+    tracemalloc.start()
+    events = [convert(event) for event in make_events(count)]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del events
+    return size / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the memory used per event held in memory.")
+    parser.add_argument("--count", type=int, default=EVENT_COUNT, help="number of events to hold")
+    args = parser.parse_args()
+
+    as_dicts = bytes_per_event(args.count, lambda event: event)
+    compact = bytes_per_event(args.count, CompactEvent.from_dict)
+    print(f"{args.count} events")
+    print(f"dict:         {as_dicts:8.0f} bytes/event")
+    print(f"CompactEvent: {compact:8.0f} bytes/event ({as_dicts / compact:.2f}x smaller)")
+
+
+if __name__ == "__main__":
+    main()
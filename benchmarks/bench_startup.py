@@ -0,0 +1,103 @@
+"""
+Measures how long a fresh process takes to start publishing: the time to
+import the client, and the time until its first event has been accepted by
+a relay. Short-lived workers pay this on every run.
+
+Run from the repository root:
+    $ python benchmarks/bench_startup.py
+    $ python benchmarks/bench_startup.py --runs 20
+"""
+import time
+
+_STARTED = time.perf_counter()
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+
+SRC_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src")
+sys.path.append(SRC_FOLDER)
+
+RUN_COUNT = 10
+# Modules that are slow to import and should only be loaded once they are needed.
+HEAVY_MODULES = ["secp256k1", "cryptography", "websockets"]
+
+
+def worker(relay_url, secret_hex):
+    """
+    Runs in the measured process: imports the client and publishes one note,
+    then prints the timings as JSON.
+    """
+    from event import TextEvent
+    from headless_client import HeadlessClient
+    from key_pair import KeyPair
+    imported = time.perf_counter()
+    loaded_after_import = [name for name in HEAVY_MODULES if name in sys.modules]
+
+    async def publish():
+        keys = KeyPair.from_secret_bytes(bytes.fromhex(secret_hex))
+        async with HeadlessClient(keys, [relay_url]) as client:
+            return await client.publish([TextEvent(keys.pubkey_hex_string(), "startup")])
+
+    report = asyncio.run(publish())
+    published = time.perf_counter()
+    print(json.dumps({
+        "import_ms": (imported - _STARTED) * 1e3,
+        "first_publish_ms": (published - _STARTED) * 1e3,
+        "accepted": len(report.accepted_events()),
+        "loaded_after_import": loaded_after_import,
+    }))
+
+
+def run_worker(relay_url, secret_hex):
+    start = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, __file__, "--worker", relay_url, secret_hex], capture_output=True, text=True, check=True
+    ).stdout
+    result = json.loads(output)
+    result["process_ms"] = (time.perf_counter() - start) * 1e3
+    return result
+
+
+def summarize(results, key):
+    values = [result[key] for result in results]
+    return {"mean_ms": statistics.mean(values), "best_ms": min(values)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the time from starting a process to its first publish.")
+    parser.add_argument("--runs", type=int, default=RUN_COUNT, help="number of processes to start")
+    parser.add_argument("--worker", nargs=2, metavar=("RELAY_URL", "SECRET"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        worker(*args.worker)
+        return
+
+    from mock_relay import MockRelay
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    relay = MockRelay()
+    relay_url = asyncio.run_coroutine_threadsafe(relay.start(), loop).result()
+    secret_hex = os.urandom(32).hex()
+    try:
+        results = [run_worker(relay_url, secret_hex) for _ in range(args.runs)]
+    finally:
+        asyncio.run_coroutine_threadsafe(relay.stop(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+    print(json.dumps({
+        "runs": args.runs,
+        "import": summarize(results, "import_ms"),
+        "first_publish": summarize(results, "first_publish_ms"),
+        "whole_process": summarize(results, "process_ms"),
+        "accepted": all(result["accepted"] == 1 for result in results),
+        "loaded_after_import": results[0]["loaded_after_import"],
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
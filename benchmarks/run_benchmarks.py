@@ -0,0 +1,184 @@
+"""
+Benchmarks the hot paths of the client and prints the results as JSON, so
+that runs from different releases can be compared.
+
+Run from the repository root:
+    $ python benchmarks/run_benchmarks.py --output bench_output.json
+    $ python benchmarks/run_benchmarks.py --only sign --only verify
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src"))
+
+from event import BaseEvent, TextEvent
+from event_builder import EventBuilder
+from filters import FilterIndex
+from key_pair import KeyPair
+from mock_relay import MockRelay
+from relay_pool import RelayPool
+from request import Request
+
+RELAY_BENCHMARKS = ["publish_event_round_trip", "publish_many_2000_events", "subscribe_2000_events_until_eose"]
+
+
+def measure(func, iterations, repeat):
+    """
+    Calls func iterations times, repeat times over, and summarizes the time per call.
+    """
+    per_call = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        per_call.append((time.perf_counter() - start) / iterations)
+    best = min(per_call)
+    return {
+        "iterations": iterations,
+        "repeat": repeat,
+        "mean_us": statistics.mean(per_call) * 1e6,
+        "best_us": best * 1e6,
+        "ops_per_sec": 1 / best,
+    }
+
+
+def filter_index_benchmark():
+    """
+    Routes random events through a FilterIndex holding 500 subscriptions.
+    """
+    rng = random.Random(0)
+    authors = ["%064x" % rng.getrandbits(256) for _ in range(1000)]
+    index = FilterIndex()
+    for i in range(500):
+        if i % 3 == 0:
+            index.add(i, {"authors": rng.sample(authors, 5), "kinds": [1]})
+        elif i % 3 == 1:
+            index.add(i, {"#p": rng.sample(authors, 2)})
+        else:
+            index.add(i, {"authors": rng.sample(authors, 20), "since": 1000})
+    events = [{
+        "id": "%064x" % rng.getrandbits(256),
+        "pubkey": rng.choice(authors),
+        "created_at": rng.randint(0, 2000),
+        "kind": rng.randint(0, 2),
+        "tags": [["p", rng.choice(authors)], ["e", "%064x" % rng.getrandbits(256)]],
+        "content": "",
+    } for _ in range(1000)]
+    events_iterator = itertools.cycle(events)
+    return lambda: index.match(next(events_iterator))
+
+
+def micro_benchmarks(keys):
+    event = TextEvent(keys.pubkey_hex_string(), "Benchmark note")
+    event.tag_user(keys.pubkey_hex_string())
+    _, serialized_event = event.stamped_event()
+    event_id = bytes.fromhex(BaseEvent.get_id_from_stamped_event(serialized_event))
+    signature = keys.sign_bytes(event_id)
+    builder = EventBuilder(keys)
+    subscription_params = {"authors": [keys.pubkey_hex_string()], "kinds": [1], "limit": 10}
+    return {
+        "stamped_event": (event.stamped_event, 20000),
+        "get_id_from_stamped_event": (lambda: BaseEvent.get_id_from_stamped_event(serialized_event), 50000),
+        "sign_bytes": (lambda: keys.sign_bytes(event_id), 5000),
+        "verify_signature": (lambda: keys.verify_signature(event_id.hex(), signature), 5000),
+        "get_subscription_id": (
+            lambda: Request.get_subscription_id(keys.pubkey_hex_string(), subscription_params), 20000
+        ),
+        "event_builder_build": (lambda: builder.build(event), 5000),
+        "filter_index_match_500_subscriptions": (filter_index_benchmark(), 20000),
+    }
+
+
+async def drain_until_eose(pool, request):
+    subscription = await pool.subscribe(request)
+    await subscription.wait_for_eose()
+    await subscription.close()
+    count = 0
+    async for _ in subscription:
+        count += 1
+    return count
+
+
+def relay_benchmarks(keys, repeat):
+    """
+    Publishes and subscribes through a RelayPool connected to an in-process relay.
+    """
+    builder = EventBuilder(keys)
+    batch = [TextEvent(keys.pubkey_hex_string(), f"note {i}") for i in range(2000)]
+    stored_events = [json.loads(message)[1] for _, message in builder.build_many(batch)]
+    relay = MockRelay()
+    relay.events = {event["id"]: event for event in stored_events}
+    pool = RelayPool([])
+    pool.start()
+    pool.add_relays([pool.run(relay.start())])
+    try:
+        def publish_one():
+            event_id, message = builder.build(TextEvent(keys.pubkey_hex_string(), "note"))
+            pool.run(pool.publish_event(event_id, message))
+
+        def publish_batch():
+            pool.run(pool.publish_many(builder.build_many(batch)))
+
+        request = Request.setup_subscription_with_params(
+            keys.pubkey_hex_string(), authors=[keys.pubkey_hex_string()], limit=len(stored_events))
+
+        def subscribe():
+            assert pool.run(drain_until_eose(pool, request)) == len(stored_events)
+
+        results = {
+            "publish_event_round_trip": measure(publish_one, 200, repeat),
+            "publish_many_2000_events": measure(publish_batch, 1, repeat),
+            "subscribe_2000_events_until_eose": measure(subscribe, 1, repeat),
+        }
+        for name in ["publish_many_2000_events", "subscribe_2000_events_until_eose"]:
+            results[name]["events_per_sec"] = len(batch) * results[name]["ops_per_sec"]
+        return results
+    finally:
+        pool.run(relay.stop())
+        pool.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", help="file to write the JSON results to (defaults to stdout)")
+    parser.add_argument("--repeat", type=int, default=5, help="number of times to repeat each benchmark")
+    parser.add_argument("--only", action="append", default=[],
+                        help="only run benchmarks whose name contains this (can be repeated)")
+    parser.add_argument("--no-relay", action="store_true", help="skip the publish/subscribe benchmarks")
+    args = parser.parse_args()
+
+    def selected(name):
+        return not args.only or any(part in name for part in args.only)
+
+    keys = KeyPair.create_new_key_pair()
+    results = {}
+    for name, (func, iterations) in micro_benchmarks(keys).items():
+        if selected(name):
+            results[name] = measure(func, iterations, args.repeat)
+    if not args.no_relay and any(selected(name) for name in RELAY_BENCHMARKS):
+        results.update({
+            name: result for name, result in relay_benchmarks(keys, args.repeat).items() if selected(name)
+        })
+
+    report = json.dumps({
+        "timestamp": int(time.time()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+    else:
+        print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+import codec
+import instrumentation
+from constants import (
+    DEFAULT_BACKFILL_WINDOW,
+    DEFAULT_CLI_BATCH_SIZE,
+    DEFAULT_PUBLISH_WINDOW,
+    KEY_PASSWORD_ENV,
+    LOG_LEVEL_ENV,
+    MAX_EVENT_KIND,
+    SYNC_STATE_FILE,
+)
+from event import BaseEvent, EventKinds
+from event_store import EventStore
+from headless_client import HeadlessClient
+from key_agent import AgentKeyPair, KeyAgentError, default_socket_path
+from key_pair import KeyPair, decrypt_private_key
+from request import Request
+from sync import SyncState, Synchronizer
+
+_CLIENT_FOLDER = os.path.abspath(os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir))
+
+
+class CliError(Exception):
+    """
+    Raised for bad arguments or input; the message is printed to stderr.
+    """
+
+
+def read_relay_file(file_name):
+    """
+    Returns the relay urls in the file, one per line.
+    """
+    with open(file_name, "r") as f:
+        return list(dict.fromkeys(line.strip() for line in f if line.strip()))
+
+
+def load_keys(args):
+    """
+    Gets the signing keys without prompting: from the key agent if one is
+    running, otherwise from the key file with the password in the environment.
+
+    Raises:
+        CliError: if neither is available
+    """
+    socket_path = args.agent_socket or default_socket_path(_CLIENT_FOLDER)
+    if os.path.exists(socket_path):
+        try:
+            return AgentKeyPair(socket_path)
+        except KeyAgentError:
+            if not args.key_file:
+                raise
+    if not args.key_file:
+        raise CliError("No key agent is running; pass --key-file or start the agent")
+    password = os.environ.get(KEY_PASSWORD_ENV)
+    if password is None:
+        raise CliError(f"Set {KEY_PASSWORD_ENV} to unlock {args.key_file}")
+    from cryptography.fernet import InvalidToken
+    with open(args.key_file, "rb") as f:
+        try:
+            secret_bytes = decrypt_private_key(f.read(), password)
+        except InvalidToken:
+            raise CliError(f"Wrong password for {args.key_file}")
+    return KeyPair.from_secret_bytes(secret_bytes, args.key_file)
+
+
+def relay_urls(args):
+    urls = list(args.relay or [])
+    if args.relay_file:
+        urls += read_relay_file(args.relay_file)
+    if not urls:
+        raise CliError("No relays given; pass --relay or --relay-file")
+    return list(dict.fromkeys(urls))
+
+
+def build_request(args, subscriber_id):
+    """
+    Builds the request from the filter arguments. --filter gives a whole
+    filter as JSON, which the other arguments are added to.
+    """
+    request = Request.setup_subscription_with_params(
+        subscriber_id,
+        event_ids=args.id or [],
+        authors=args.author or [],
+        event_kinds=args.kind or [],
+        referenced_event_ids=args.e or [],
+        referenced_event_authors=args.p or [],
+        since=args.since,
+        until=args.until,
+        limit=args.limit,
+    )
+    if args.filter:
+        subscription_filter = json.loads(args.filter)
+        if not isinstance(subscription_filter, dict):
+            raise CliError("--filter must be a JSON object")
+        request = Request(subscriber_id, {**subscription_filter, **request.subscription_params})
+    return request
+
+
+def _write(output, value):
+    output.write(codec.dumps(value))
+    output.write("\n")
+
+
+async def run_query(args, output):
+    # Reading doesn't need keys, so none are loaded.
+    request = build_request(args, "cli")
+    store = EventStore(args.store) if args.store else None
+    try:
+        async with HeadlessClient(None, relay_urls(args), store) as client:
+            if args.stream:
+                events = client.stream(request)
+            else:
+                events = client.query(request, args.timeout)
+            async for relay_url, event in events:
+                _write(output, {"relay": relay_url, "event": event} if args.with_relay else event)
+                output.flush()
+    finally:
+        if store is not None:
+            store.close()
+
+
+async def run_sync(args, output):
+    """
+    Returns:
+        int: the number of relays that didn't send everything in time
+    """
+    subscription_filter = build_request(args, "cli").subscription_params
+    store = EventStore(args.store)
+    state = SyncState(args.state or os.path.join(_CLIENT_FOLDER, SYNC_STATE_FILE))
+
+    def write_event(relay_url, event):
+        _write(output, {"relay": relay_url, "event": event} if args.with_relay else event)
+
+    try:
+        async with HeadlessClient(None, relay_urls(args), store) as client:
+            synchronizer = Synchronizer(client.pool, state, store, args.window, args.timeout, write_event)
+            if args.backfill:
+                results = await synchronizer.backfill("cli", subscription_filter)
+            elif args.reconcile:
+                results = await synchronizer.reconcile("cli", subscription_filter)
+            else:
+                results = await synchronizer.sync("cli", subscription_filter)
+    finally:
+        state.close()
+        store.close()
+    output.flush()
+    return sum(1 for _, complete in results.values() if not complete)
+
+
+def _event_from_line(line, author, ndjson_input):
+    if not ndjson_input:
+        return BaseEvent(author, line, EventKinds.TEXT_NOTE)
+    value = json.loads(line)
+    if not isinstance(value, dict) or not isinstance(value.get("content"), str):
+        raise CliError(f"Expected an object with a content string: {line}")
+    kind = value.get("kind", EventKinds.TEXT_NOTE.value)
+    if type(kind) is not int or not 0 <= kind <= MAX_EVENT_KIND:
+        raise CliError(f"Unsupported kind in: {line}")
+    tags = value.get("tags", [])
+    if not isinstance(tags, list) or not all(
+            isinstance(tag, list) and all(isinstance(item, str) for item in tag) for tag in tags):
+        raise CliError(f"Expected tags to be a list of lists of strings in: {line}")
+    event = BaseEvent(author, value["content"], kind)
+    event.tags = [list(tag) for tag in tags]
+    return event
+
+
+def _batches(lines, size):
+    batch = []
+    for line in lines:
+        line = line.rstrip("\n")
+        if not line:
+            continue
+        batch.append(line)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def run_publish(args, input_lines, output):
+    keys = load_keys(args)
+    author = keys.pubkey_hex_string()
+    if args.content is not None:
+        input_lines = [args.content]
+    failed = 0
+    async with HeadlessClient(keys, relay_urls(args), publish_timeout=args.timeout) as client:
+        for batch in _batches(input_lines, args.batch_size):
+            events = [_event_from_line(line, author, args.ndjson_input) for line in batch]
+            report = await client.publish(events, window=args.window)
+            for event_id, results in report.results.items():
+                accepted = any(result.accepted for result in results.values())
+                failed += not accepted
+                _write(output, {
+                    "id": event_id,
+                    "accepted": accepted,
+                    "results": [result.to_dict() for result in results.values()],
+                })
+            output.flush()
+    return failed
+
+
+def make_parser():
+    parser = argparse.ArgumentParser(
+        description="Query and publish Nostr events without prompts. Output is one JSON object per line."
+    )
+    parser.add_argument("--relay", action="append", help="relay url (can be repeated)")
+    parser.add_argument("--relay-file", help="file with one relay url per line")
+    parser.add_argument("--key-file", help=f"encrypted key file, unlocked with ${KEY_PASSWORD_ENV}")
+    parser.add_argument("--agent-socket", help="socket of a running key agent")
+    parser.add_argument("--timeout", type=float, default=5, help="seconds to wait for the relays")
+    parser.add_argument("--log-level", default=os.environ.get(LOG_LEVEL_ENV),
+                        help=f"print log messages from this level (e.g. debug) to stderr as JSON, "
+                             f"by default from ${LOG_LEVEL_ENV}")
+    parser.add_argument("--metrics-file", help="write metrics in the Prometheus text format to this file when done")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    query = commands.add_parser("query", help="print the events matching a filter")
+    _add_filter_arguments(query)
+    query.add_argument("--limit", type=int, help="maximum number of stored events per relay")
+    query.add_argument("--stream", action="store_true", help="keep printing new events after the stored ones")
+    query.add_argument("--store", help="also keep the events in this event store")
+
+    sync = commands.add_parser("sync", help="print the events matching a filter that weren't fetched before")
+    _add_filter_arguments(sync)
+    sync.add_argument("--store", required=True, help="the event store to keep the events in")
+    sync.add_argument("--state", help=f"where to keep the sync state (default: {SYNC_STATE_FILE})")
+    sync.add_argument("--backfill", action="store_true",
+                      help="fetch the whole history instead, carrying on from where an earlier backfill stopped")
+    sync.add_argument("--reconcile", action="store_true",
+                      help="compare the stored events with each relay's (NIP-77) and fetch only the missing ones")
+    sync.add_argument("--window", type=int, default=DEFAULT_BACKFILL_WINDOW, help="events asked for at a time")
+    sync.set_defaults(limit=None)
+
+    publish = commands.add_parser("publish", help="sign and publish notes given as arguments or stdin lines")
+    publish.add_argument("--content", help="publish this note instead of reading stdin")
+    publish.add_argument("--ndjson-input", action="store_true",
+                         help="read {content, kind, tags} objects instead of plain lines")
+    publish.add_argument("--batch-size", type=int, default=DEFAULT_CLI_BATCH_SIZE, help="lines published together")
+    publish.add_argument("--window", type=int, default=DEFAULT_PUBLISH_WINDOW, help="unacknowledged events allowed per relay")
+
+    commands.add_parser("pubkey", help="print the public key being used")
+    return parser
+
+
+def _add_filter_arguments(parser):
+    parser.add_argument("--id", action="append", help="event id or prefix")
+    parser.add_argument("--author", action="append", help="author public key or prefix")
+    parser.add_argument("--kind", action="append", type=int, help="event kind")
+    parser.add_argument("--e", action="append", help="referenced event id")
+    parser.add_argument("--p", action="append", help="referenced public key")
+    parser.add_argument("--since", type=int, help="unix timestamp")
+    parser.add_argument("--until", type=int, help="unix timestamp")
+    parser.add_argument("--filter", help="a whole filter as a JSON object")
+    parser.add_argument("--with-relay", action="store_true", help="print {relay, event} objects")
+
+
+def main(argv=None, stdin=None, stdout=None):
+    """
+    Runs the CLI and returns the exit code: 0 on success, 1 if some events
+    weren't accepted by any relay or some relays didn't finish syncing, 2 on
+    bad arguments or input.
+    """
+    stdin = stdin or sys.stdin
+    stdout = stdout or sys.stdout
+    args = make_parser().parse_args(argv)
+    instrumentation.configure_logging(args.log_level)
+    if args.metrics_file:
+        metrics = instrumentation.PrometheusRecorder()
+        previous_recorder = instrumentation.set_recorder(metrics)
+    try:
+        if args.command == "pubkey":
+            _write(stdout, {"pubkey": load_keys(args).pubkey_hex_string()})
+            return 0
+        if args.command == "query":
+            asyncio.run(run_query(args, stdout))
+            return 0
+        if args.command == "sync":
+            return 1 if asyncio.run(run_sync(args, stdout)) else 0
+        failed = asyncio.run(run_publish(args, stdin, stdout))
+        return 1 if failed else 0
+    except (CliError, KeyAgentError, OSError, ValueError) as error:
+        sys.stderr.write(f"Error: {error}\n")
+        return 2
+    finally:
+        if args.metrics_file:
+            instrumentation.set_recorder(previous_recorder)
+            with open(args.metrics_file, "w") as f:
+                f.write(metrics.render())
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,66 @@
+import os
+
+from base_interface import BaseInterface
+from config import UserConfig
+from constants import EVENT_STORE_FILE
+from event_store import EventStore
+from key_pair import KeyPair
+from relays import Relays
+
+
+class ClientContext:
+    """
+    Everything the client is set up with: its configuration, how it talks to
+    the user, and the relays, keys and event store that come from the
+    configuration. Each of these is only loaded when first used, so a process
+    that only publishes never opens the event store, and one that is handed
+    its keys never reads the key file.
+    """
+    def __init__(self, configs=None, interface=None, relays=None, keys=None, store=None):
+        """
+        Args:
+            configs (UserConfig, optional): the configuration. Defaults to the client's config file.
+            interface (BaseInterface, optional): used for prompts. Defaults to the terminal.
+            relays (Relays, optional): overrides the relay file in the configuration
+            keys (KeyPair, optional): overrides the key file in the configuration
+            store (EventStore, optional): overrides the event store in the client's folder
+        """
+        self._configs = configs
+        self.interface = interface or BaseInterface()
+        self._relays = relays
+        self._keys = keys
+        self._store = store
+
+    @property
+    def configs(self):
+        if self._configs is None:
+            self._configs = UserConfig()
+        return self._configs
+
+    @property
+    def relays(self):
+        if self._relays is None:
+            self._relays = Relays.get_relays(self.configs, self.interface)
+        return self._relays
+
+    @property
+    def keys(self):
+        if self._keys is None:
+            self._keys = KeyPair.get_user_keys(self.configs, self.interface)
+        return self._keys
+
+    @property
+    def store(self):
+        if self._store is None:
+            self._store = EventStore(os.path.join(self.configs.prepath, EVENT_STORE_FILE))
+        return self._store
+
+    def close(self):
+        """
+        Saves and closes whatever was loaded.
+        """
+        if self._store is not None:
+            self._store.close()
+            self._store = None
+        if self._relays is not None:
+            self._relays.save_health()
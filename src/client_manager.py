@@ -1,27 +1,39 @@
 # import asyncio
 import json
-import time
+import os
 from hashlib import sha256
-from threading import Thread
 
-from websocket import create_connection
-
-from base_interface import BaseInterface
-from constants import ClientMessageType
-from event import BaseEvent, TextEvent
-from key_pair import KeyPair
-from relays import Relays
+import instrumentation
+from client_context import ClientContext
+from constants import (
+    DEFAULT_PUBLISH_WINDOW,
+    LOG_LEVEL_ENV,
+    READ_RELAY_COUNT,
+    WRITE_RELAY_COUNT,
+)
+from event import TextEvent
+from event_builder import EventBuilder
+from key_agent import KeyAgentError
+from relay_pool import RelayPool
 from request import Request
 
-from config import UserConfig
-
 class ClientManager:
-    def __init__(self) -> None:
-        configs=UserConfig()
-        self.interface = BaseInterface()
-        self.relays = Relays.get_relays(configs, self.interface)
-        self.keys = KeyPair.get_user_keys(configs, self.interface)
+    def __init__(self, context=None) -> None:
+        """
+        Args:
+            context (ClientContext, optional): where the configuration, relays and keys
+                come from. Defaults to the client's config file and the terminal.
+        """
+        self.context = context or ClientContext()
+        self.interface = self.context.interface
+        self.relays = self.context.relays
+        self.keys = self.context.keys
         self.pubkey = self.keys.pubkey_hex_string()
+        self.builder = EventBuilder(self.keys)
+        # Connect to the healthiest relays only, so that dead ones don't slow everything down.
+        # How the connections and subscriptions fare feeds back into the relays' health.
+        self.pool = RelayPool(self.select_pool_relays(), on_relay_outcome=self.relays.record_relay_outcome)
+        self.pool.start()
 
     def run_loop(self):
         while (True):
@@ -30,87 +42,160 @@ class ClientManager:
             if not command:
                 continue
             elif command[0] in ['e', 'E']:
+                self.pool.close()
+                self.context.close()
                 break
 
             elif command[0] in ['p', 'P']:
                 content = input("Enter content below:\n>")
                 if not content: continue
                 event = TextEvent(self.pubkey, content)
-                payload = self.get_event_payload(event)
-                self.publish_payload(payload)
+                self.publish_event(event)
                 
             elif command[0] in ['s', 'S']:
-                subscription_request = Request.setup_subscription_from_input(self.pubkey, self.interface)
-                payload = subscription_request.start_subscription_payload()
-                self.publish_payload(payload)
+                try:
+                    subscription_request = Request.setup_subscription_from_input(self.pubkey, self.interface)
+                except ValueError as error:
+                    print("Error:", error)
+                    continue
+                self.query_with_cache(subscription_request)
 
             elif command[0] in ['i', 'I']:
                 print("User public key:", self.keys.pubkey_hex_string())
                 words = command.split(" ")
                 if len(words) > 1 and words[1] in ['-a', '--all']:
+                    try:
                         print("User private key:", self.keys.privkey_hex_string())
+                    except KeyAgentError as error:
+                        print(error)
 
             elif command[0] in ['h', 'H']:
                 print("Commands: 'fetch', 'post', 'subscribe', 'info', 'exit', 'help', 'add_relays'")
 
             elif command[0] in ['a', 'A']:
                 self.relays.get_new_relays()
+                self.refresh_pool()
     
+    def select_pool_relays(self):
+        return self.relays.select_relays(max(READ_RELAY_COUNT, WRITE_RELAY_COUNT))
+
+    def refresh_pool(self):
+        """
+        Connects to the relays that are now among the healthiest, and drops the
+        ones that no longer are. Relays put on probation leave the pool, and come
+        back to be tried again once their probation is over.
+        """
+        selected = self.select_pool_relays()
+        self.pool.remove_relays([url for url in self.pool.relay_urls if url not in selected])
+        self.pool.add_relays(selected)
+
+    def sign_event(self, event):
+        """
+        Stamps, hashes and signs the event with the EventBuilder fast path.
+
+        Returns:
+            tuple: the hex id of the event and the serialized EVENT message
+        """
+        event_id, payload = self.builder.build(event)
+        instrumentation.logger.debug("Signed event", extra={"id": event_id, "payload": payload})
+        return (event_id, payload)
+
     def get_event_payload(self, event):
-        (timestamp, serialized_event) = event.stamped_event()
-        id_of_event = BaseEvent.get_id_from_stamped_event(serialized_event)
-        signature = self.keys.sign_bytes(bytes.fromhex(id_of_event))
-        print("id", id_of_event)
-        print("pubkey", event.author)
-        print("created_at", timestamp)
-        print("kind", event.get_kind())
-        print("tags", event.tags)
-        print("content", event.content)
-        print("sig", signature)
-        return json.dumps([
-            ClientMessageType.EVENT,
-            {
-                "id": id_of_event,
-                "pubkey": event.author,
-                "created_at": timestamp,
-                "kind": event.get_kind(),
-                "tags": event.tags,
-                "content": event.content,
-                "sig": signature
-            }
-        ])
-
-    def publish_payload(self, payload):
-        """
-        Publish a payload to all relays.
+        return self.sign_event(event)[1]
+
+    def publish_event(self, event, timeout=None, quorum=None):
+        """
+        Signs the event, publishes it to the healthiest relays and waits for their OK replies.
+        Returns once every relay has answered, once quorum relays have accepted it,
+        or when the timeout passes.
+
+        Returns:
+            dict: maps each relay url to a PublishResult
         """
         if not self.relays.relay_urls:
             print("Error: No relays to publish to. Please add relays to your relay file.")
-        threads = []
-        for relay in self.relays.relay_urls:
-            # Send out each message in a separate thread
-            t = Thread(target=self.publish_to_relay, args=(relay, payload))
-            threads.append(t)
-            t.start()
-
-        # Wait for 2.5 seconds and then end the still running threads.
-        time.sleep(2.5)
-        for t in threads:
-            # End the thread after a max of 0.1 seconds.
-            t.join(0.1)
-
-    def publish_to_relay(self, relay_url, payload):
+            return {}
+        event_id, payload = self.sign_event(event)
+        self.refresh_pool()
+        relay_urls = self.relays.select_relays(WRITE_RELAY_COUNT, self.pool.relay_urls)
+        results = self.pool.run(self.pool.publish_event(event_id, payload, timeout, quorum, relay_urls))
+        for result in results.values():
+            print(result)
+        self.relays.record_publish_results(results)
+        self.relays.save_health()
+        return results
+
+    def publish_many(self, events, timeout=None, window=DEFAULT_PUBLISH_WINDOW):
+        """
+        Signs a whole batch of events up front and then streams them to the healthiest relays,
+        keeping up to window unacknowledged events in flight per relay.
+
+        Returns:
+            BatchPublishReport: per-event acceptance by each relay, and the batch throughput
+        """
+        if not self.relays.relay_urls:
+            print("Error: No relays to publish to. Please add relays to your relay file.")
+            return None
+        signed_events = self.builder.build_many(events)
+        self.refresh_pool()
+        relay_urls = self.relays.select_relays(WRITE_RELAY_COUNT, self.pool.relay_urls)
+        report = self.pool.run(self.pool.publish_many(signed_events, timeout, window, relay_urls))
+        print(report)
+        for results in report.results.values():
+            self.relays.record_publish_results(results)
+        self.relays.save_health()
+        return report
+
+    def publish_payload(self, payload, timeout=None):
+        """
+        Publish a payload to all relays over the pool's persistent connections.
+        Returns as soon as every relay has responded, or once the timeout
+        (the pool's publish_timeout by default) has passed.
+        """
+        if not self.relays.relay_urls:
+            print("Error: No relays to publish to. Please add relays to your relay file.")
+            return {}
+        responses = self.pool.run(self.pool.publish(payload, timeout))
+        for relay_url, response in responses.items():
+            instrumentation.logger.info("Relay response", extra={"relay": relay_url, "response": response})
+        return responses
+
+    def query_with_cache(self, request):
+        """
+        Prints the matching events that are already stored locally, and then only
+        asks the relays for events at least as new as the newest stored one.
+        """
+        for event in reversed(self.context.store.query(request.subscription_params)):
+            print("Stored event:", json.dumps(event))
+        delta_request = Request(self.pubkey, self.context.store.delta_filter(request.subscription_params))
+        self.stream_subscription(delta_request)
+
+    def stream_subscription(self, request):
+        """
+        Prints the events that relays send for the request until the user presses Ctrl+C,
+        then closes the subscription on every relay.
+        """
+        if not self.relays.relay_urls:
+            print("Error: No relays to subscribe to. Please add relays to your relay file.")
+            return
+        self.refresh_pool()
+        subscription = self.pool.run(self.pool.subscribe(request))
+        print("Streaming events. Press Ctrl+C to stop.")
         try:
-            ws = create_connection(relay_url)
-            ws.send(payload)
-            response = ws.recv()
-            print(f"Response from {relay_url}:", response)
-            ws.close()
-        except:
-            print(f"Failed to publish to {relay_url}.")
+            for relay_url, event in self.pool.iterate(subscription):
+                print(f"Event from {relay_url}:", json.dumps(event))
+                self.context.store.add(event)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.pool.run(subscription.close())
+            self.context.store.commit()
+        for relay_url, count in subscription.duplicates.most_common():
+            print(f"{relay_url} sent {count} events that another relay had already sent.")
 
     @staticmethod
     def initialize_user():
+        instrumentation.configure_logging(os.environ.get(LOG_LEVEL_ENV))
         client = ClientManager()
         client.run_loop()
 
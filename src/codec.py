@@ -0,0 +1,219 @@
+"""
+The JSON codec used for relay messages. orjson or msgspec are used when
+installed, since parsing incoming EVENT messages is where most of the time goes
+while streaming, and the standard library's json module is used otherwise.
+
+Whichever backend is used, canonical_event produces exactly the bytes NIP-01
+defines for computing event ids; anything a backend might serialize differently
+(floats, huge integers) goes through the standard library. Strings with lone
+surrogates can't be encoded as UTF-8 at all, so every backend raises
+UnicodeEncodeError for them.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+# Backends in order of preference. "json" (the standard library) is always available.
+BACKEND_PREFERENCE = ["orjson", "msgspec", "json"]
+
+_canonical_encoder = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False)
+_wire_encoder = json.JSONEncoder(ensure_ascii=False)
+
+if msgspec is not None:
+    class EventStruct(msgspec.Struct):
+        """
+        The shape of a NIP-01 event, for decoding events with type checks.
+        """
+        id: str
+        pubkey: str
+        created_at: int
+        kind: int
+        tags: list[list[str]]
+        content: str
+        sig: str
+
+    _msgspec_encoder = msgspec.json.Encoder()
+    _msgspec_decoder = msgspec.json.Decoder()
+    _msgspec_event_decoder = msgspec.json.Decoder(EventStruct)
+
+# Expected type of every field of an event, for backends without typed decoding.
+_EVENT_FIELDS = {
+    "id": str, "pubkey": str, "created_at": int, "kind": int, "tags": list, "content": str, "sig": str,
+}
+
+
+def available_backends():
+    modules = {"orjson": orjson, "msgspec": msgspec, "json": json}
+    return [name for name in BACKEND_PREFERENCE if modules[name] is not None]
+
+
+def _is_plain(value):
+    """
+    Returns True if every backend serializes the value exactly like the standard library.
+    """
+    value_type = type(value)
+    if value_type is str:
+        return True
+    if value_type is int:
+        return -2 ** 63 <= value < 2 ** 63
+    if value_type is list:
+        return all(_is_plain(item) for item in value)
+    return False
+
+
+def _stdlib_loads(data):
+    return json.loads(data)
+
+
+def _msgspec_loads(data):
+    try:
+        return _msgspec_decoder.decode(data)
+    except msgspec.DecodeError as error:
+        # Callers expect a ValueError, as raised by the other backends.
+        raise ValueError(str(error)) from error
+
+
+def _stdlib_dumps(value):
+    return _wire_encoder.encode(value)
+
+
+def _stdlib_canonical(value):
+    return _canonical_encoder.encode(value).encode()
+
+
+def _orjson_canonical(value):
+    if _is_plain(value):
+        try:
+            return orjson.dumps(value)
+        except TypeError:
+            pass
+    return _stdlib_canonical(value)
+
+
+def _msgspec_canonical(value):
+    if _is_plain(value):
+        try:
+            return _msgspec_encoder.encode(value)
+        except (TypeError, OverflowError, UnicodeEncodeError):
+            pass
+    return _stdlib_canonical(value)
+
+
+def _orjson_dumps(value):
+    return orjson.dumps(value).decode()
+
+
+def _msgspec_dumps(value):
+    return _msgspec_encoder.encode(value).decode()
+
+
+def _checked_event(event):
+    if not isinstance(event, dict):
+        raise ValueError("an event must be a JSON object")
+    for field, field_type in _EVENT_FIELDS.items():
+        value = event.get(field)
+        if type(value) is not field_type:
+            raise ValueError(f"the event's {field} must be of type {field_type.__name__}")
+    if not all(isinstance(tag, list) and all(type(item) is str for item in tag) for tag in event["tags"]):
+        raise ValueError("the event's tags must be lists of strings")
+    return event
+
+
+def _stdlib_decode_event(data):
+    return _checked_event(json.loads(data))
+
+
+def _orjson_decode_event(data):
+    return _checked_event(orjson.loads(data))
+
+
+def _msgspec_decode_event(data):
+    try:
+        return msgspec.structs.asdict(_msgspec_event_decoder.decode(data))
+    except msgspec.DecodeError as error:
+        raise ValueError(str(error)) from error
+
+
+def use_backend(name):
+    """
+    Switches every function of this module to the given backend.
+
+    Args:
+        name (str): one of BACKEND_PREFERENCE
+
+    Raises:
+        ValueError: if the backend isn't installed
+    """
+    global backend, loads, dumps, canonical_dumps, decode_event, _fast_canonical
+    if name not in available_backends():
+        raise ValueError(f"The {name} JSON backend is not installed")
+    backend = name
+    if name == "orjson":
+        loads = orjson.loads
+        dumps = _orjson_dumps
+        canonical_dumps = _orjson_canonical
+        _fast_canonical = orjson.dumps
+        # msgspec checks the types while decoding, so use it for events if it's there too.
+        decode_event = _orjson_decode_event if msgspec is None else _msgspec_decode_event
+    elif name == "msgspec":
+        loads = _msgspec_loads
+        dumps = _msgspec_dumps
+        canonical_dumps = _msgspec_canonical
+        _fast_canonical = _msgspec_encoder.encode
+        decode_event = _msgspec_decode_event
+    else:
+        loads = _stdlib_loads
+        dumps = _stdlib_dumps
+        canonical_dumps = _stdlib_canonical
+        _fast_canonical = None
+        decode_event = _stdlib_decode_event
+
+
+def _is_plain_event(pubkey, created_at, kind, tags, content):
+    """
+    The same check as _is_plain, unrolled for the fields of an event.
+    """
+    if type(pubkey) is not str or type(content) is not str or type(tags) is not list:
+        return False
+    if type(created_at) is not int or type(kind) is not int:
+        return False
+    if not (-2 ** 63 <= created_at < 2 ** 63 and -2 ** 63 <= kind < 2 ** 63):
+        return False
+    for tag in tags:
+        if type(tag) is not list:
+            return False
+        for item in tag:
+            if type(item) is not str:
+                return False
+    return True
+
+
+def canonical_event(pubkey, created_at, kind, tags, content):
+    """
+    Returns the UTF-8 encoded NIP-01 serialization of an event, whose sha256 hash is the event's id.
+    """
+    values = [0, pubkey, created_at, kind, tags, content]
+    if _fast_canonical is not None and _is_plain_event(pubkey, created_at, kind, tags, content):
+        try:
+            return _fast_canonical(values)
+        except (TypeError, UnicodeEncodeError):
+            pass
+    return _stdlib_canonical(values)
+
+
+# Set by use_backend. Call them as codec.loads etc. rather than importing them, so that
+# switching the backend takes effect everywhere.
+#   loads(data): parses a str or bytes message
+#   dumps(value): serializes a message to send, as a str
+#   canonical_dumps(value): the compact serialization NIP-01 uses for ids, as UTF-8 bytes
+#   decode_event(data): parses one event and checks the types of its fields; raises ValueError
+backend = loads = dumps = canonical_dumps = decode_event = _fast_canonical = None
+use_backend(available_backends()[0])
@@ -0,0 +1,173 @@
+import sys
+from collections import OrderedDict
+
+import codec
+from constants import DEFAULT_PUBKEY_CACHE_SIZE, HEX_KEY_LENGTH
+from event import BaseEvent, EventKinds
+
+# The fields of a signed event, in the order relays send them.
+EVENT_FIELDS = ("id", "pubkey", "created_at", "kind", "tags", "content", "sig")
+# Kinds that have an EventKinds member.
+_KNOWN_KINDS = frozenset(kind.value for kind in EventKinds)
+
+# Public keys already seen, so that the events of one author (and the "p" tags
+# mentioning them) share a single bytes object. Event ids are mostly unique, so
+# they aren't kept. The least recently seen key is dropped when it is full.
+_keys = OrderedDict()
+
+
+def _intern_key(key):
+    interned = _keys.get(key)
+    if interned is None:
+        if len(_keys) >= DEFAULT_PUBKEY_CACHE_SIZE:
+            _keys.popitem(last=False)
+        interned = _keys[key] = key
+    else:
+        _keys.move_to_end(key)
+    return interned
+
+
+def _compact_value(value, intern=False):
+    """
+    Stores ids and public keys referenced by tags as raw bytes, and everything
+    else as it is. Public keys are interned if intern is true.
+    """
+    if type(value) is str and len(value) == HEX_KEY_LENGTH:
+        try:
+            raw = bytes.fromhex(value)
+        except ValueError:
+            return value
+        # Upper case hex wouldn't come back the same.
+        if raw.hex() == value:
+            return _intern_key(raw) if intern else raw
+    return value
+
+
+def _compact_tags(tags):
+    """
+    Turns a list of tags into a tuple of tuples, interning the tag names (e.g. "p", "e")
+    and the public keys in "p" tags.
+    """
+    return tuple(
+        (sys.intern(tag[0]),) + tuple(_compact_value(value, tag[0] == "p") for value in tag[1:])
+        if tag and type(tag[0]) is str else tuple(tag)
+        for tag in tags
+    )
+
+
+def _wire_tags(tags):
+    return [[value.hex() if type(value) is bytes else value for value in tag] for tag in tags]
+
+
+class CompactEvent:
+    """
+    A signed event stored in as little memory as possible, for keeping many of
+    them around: no instance dict, the id, public key and signature as raw
+    bytes rather than hex, tags as tuples with the ids and public keys in them
+    as bytes too, and tag names interned.
+
+    Reading it like the dict relays send (event["id"], event["tags"], ...)
+    returns the wire values, so it can be passed to CompiledFilter.matches.
+    """
+    __slots__ = ("id", "pubkey", "created_at", "kind", "tags", "content", "sig")
+
+    def __init__(self, id, pubkey, created_at, kind, tags, content, sig):
+        """
+        Args:
+            id (bytes): the 32-byte event id
+            pubkey (bytes): the author's 32-byte public key
+            created_at (int): unix timestamp of the event
+            kind (int): the event kind
+            tags (tuple): the tags, as tuples of strings, or bytes for 32-byte hex values
+            content (str): the content of the event
+            sig (bytes): the 64-byte signature
+        """
+        self.id = id
+        self.pubkey = _intern_key(pubkey)
+        self.created_at = created_at
+        self.kind = kind
+        self.tags = tags
+        self.content = content
+        self.sig = sig
+
+    @staticmethod
+    def from_dict(event):
+        """
+        Creates a CompactEvent from an event as received from a relay.
+
+        Raises:
+            ValueError: if the id, public key or signature aren't hex
+        """
+        return CompactEvent(
+            bytes.fromhex(event["id"]),
+            bytes.fromhex(event["pubkey"]),
+            event["created_at"],
+            event["kind"],
+            _compact_tags(event["tags"]),
+            event["content"],
+            bytes.fromhex(event["sig"]),
+        )
+
+    def to_dict(self):
+        """
+        Returns the event in the form relays send and expect it.
+        """
+        return {field: self[field] for field in EVENT_FIELDS}
+
+    @staticmethod
+    def from_json(data):
+        return CompactEvent.from_dict(codec.loads(data))
+
+    def to_json(self):
+        return codec.dumps(self.to_dict())
+
+    @staticmethod
+    def from_base_event(event, created_at, event_id, signature):
+        """
+        Creates a CompactEvent from a BaseEvent and the values it got when it was signed.
+
+        Args:
+            event (BaseEvent): the event
+            created_at (int): the timestamp the event was signed with
+            event_id (str): hex id of the event
+            signature (str): hex signature of the event
+        """
+        return CompactEvent(
+            bytes.fromhex(event_id),
+            bytes.fromhex(event.author),
+            created_at,
+            event.get_kind(),
+            _compact_tags(event.tags),
+            event.content,
+            bytes.fromhex(signature),
+        )
+
+    def to_base_event(self):
+        """
+        Returns a BaseEvent with the author, content, kind and tags of this event.
+        Its kind is one of EventKinds if there is one for it, and the plain integer otherwise.
+        """
+        kind = EventKinds(self.kind) if self.kind in _KNOWN_KINDS else self.kind
+        event = BaseEvent(self.pubkey.hex(), self.content, kind)
+        event.tags = _wire_tags(self.tags)
+        return event
+
+    def __getitem__(self, field):
+        if field in ("id", "pubkey", "sig"):
+            return getattr(self, field).hex()
+        if field == "tags":
+            return _wire_tags(self.tags)
+        if field in EVENT_FIELDS:
+            return getattr(self, field)
+        raise KeyError(field)
+
+    def __eq__(self, other):
+        if not isinstance(other, CompactEvent):
+            return NotImplemented
+        return all(getattr(self, field) == getattr(other, field) for field in EVENT_FIELDS)
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __repr__(self):
+        return f"CompactEvent(id={self.id.hex()}, kind={self.kind}, created_at={self.created_at})"
@@ -7,6 +7,11 @@ KEY_STORAGE_FILE_KEY = "KEY_STORAGE_FILE"
 RELAY_FILE_KEY = "RELAY_FILE"
 
 class UserConfig:
+    """
+    The client's configuration file. It is only read (and any missing file
+    names asked for) the first time a value is looked up, so creating a
+    UserConfig, or importing a module that uses one, is free.
+    """
     _instance = None
 
     def __new__(cls):
@@ -16,16 +21,21 @@ class UserConfig:
             dir_path = os.path.dirname(os.path.realpath(__file__))
             # get the path that is one level up from the current directory
             cls.prepath = os.path.abspath(os.path.join(dir_path, os.pardir))
-            cls.client_configs = cls.load_client_configs()
+            cls.client_configs = None
         return cls._instance
 
     @classmethod
-    def load_client_configs(cls, interface = BaseInterface()):
+    def config_file_path(cls):
+        return os.path.join(cls.prepath, cls.file_name)
+
+    @classmethod
+    def load_client_configs(cls, interface=None):
         """
         Load the client configs from the config file.
         """
+        interface = interface or BaseInterface()
         configs = {}
-        config_file_path = os.path.join(cls.prepath, cls.file_name)
+        config_file_path = cls.config_file_path()
         keys = [KEY_STORAGE_FILE_KEY, RELAY_FILE_KEY]
         try:
             with open(config_file_path, 'r') as f:
@@ -44,18 +54,20 @@ class UserConfig:
             # join the prepath to the storage file
             configs[key] = os.path.join(cls.prepath, storage_file)
         if new_file_added: cls.set_client_configs(configs)
+        cls.client_configs = configs
         return configs
 
 
     @classmethod
     def set_client_configs(cls, configs):
-        with open(CLIENT_CONFIG_FILE, 'w') as f:
+        with open(cls.config_file_path(), 'w') as f:
             json.dump(configs, f)
             f.close()
         cls.client_configs = configs
-    
+
     @classmethod
-    def get_config_file_from_input(cls, configuration_file_key, interface = BaseInterface()):
+    def get_config_file_from_input(cls, configuration_file_key, interface=None):
+        interface = interface or BaseInterface()
         file_path = None
         while not file_path:
             file_path = interface.get_input(f"Enter the file name for your {configuration_file_key}:\n>").strip()
@@ -68,5 +80,7 @@ class UserConfig:
         return file_path
 
     @classmethod
-    def get_client_config(cls, configuration_file_key):
-        return cls.client_configs.get(configuration_file_key)
\ No newline at end of file
+    def get_client_config(cls, configuration_file_key, interface=None):
+        if cls.client_configs is None:
+            cls.load_client_configs(interface)
+        return cls.client_configs.get(configuration_file_key)
@@ -2,6 +2,97 @@ class ClientMessageType():
     EVENT = "EVENT"
     REQUEST = "REQ"
     CLOSE = "CLOSE"
+    NEG_OPEN = "NEG-OPEN"
+    NEG_MSG = "NEG-MSG"
+    NEG_CLOSE = "NEG-CLOSE"
+
+class RelayMessageType():
+    EVENT = "EVENT"
+    OK = "OK"
+    EOSE = "EOSE"
+    CLOSED = "CLOSED"
+    NOTICE = "NOTICE"
+    NEG_MSG = "NEG-MSG"
+    NEG_ERR = "NEG-ERR"
 
 KEY_STORAGE_FILE = "mykeys"
-RELAY_FILE = "relays"
\ No newline at end of file
+RELAY_FILE = "relays"
+EVENT_STORE_FILE = "events.db"
+SYNC_STATE_FILE = "sync.db"
+
+# Largest event kind NIP-01 allows.
+MAX_EVENT_KIND = 65535
+
+# Length of a full hex event id or public key. Anything shorter in a filter is a prefix.
+HEX_KEY_LENGTH = 64
+
+# Seconds to wait for relays to respond to a published payload.
+DEFAULT_PUBLISH_TIMEOUT = 2.5
+# Maximum number of events awaiting an OK from a single relay during a batch publish.
+DEFAULT_PUBLISH_WINDOW = 100
+# Number of distinct filters whose subscription ids and REQ/CLOSE messages are kept for reuse.
+DEFAULT_REQUEST_CACHE_SIZE = 1024
+# Number of subscriptions kept open on a relay at a time; more wait in a queue.
+DEFAULT_MAX_SUBSCRIPTIONS_PER_RELAY = 20
+# Bounds (in seconds) of the exponential backoff used when reconnecting to a relay.
+RECONNECT_BASE_DELAY = 0.5
+RECONNECT_MAX_DELAY = 60
+
+# Number of received events a subscription holds in memory until they are consumed.
+DEFAULT_EVENT_QUEUE_SIZE = 10000
+
+# Number of events asked for in each until+limit window of a historical backfill.
+DEFAULT_BACKFILL_WINDOW = 500
+# Seconds to wait for a relay to finish sending a sync or backfill window.
+DEFAULT_SYNC_TIMEOUT = 10
+# Number of missing event ids asked for per REQ after a negentropy reconciliation.
+DEFAULT_RECONCILE_FETCH_SIZE = 500
+
+# Number of event ids remembered for deduplicating events that arrive from several relays.
+DEFAULT_SEEN_ID_CAPACITY = 100000
+# False positive rate of the Bloom filter variant of the seen id cache.
+DEFAULT_BLOOM_ERROR_RATE = 0.001
+
+# Number of parsed author public keys kept per process when verifying signatures.
+DEFAULT_PUBKEY_CACHE_SIZE = 10000
+# Number of events handed to a worker process at a time when verifying signatures.
+DEFAULT_VERIFY_BATCH_SIZE = 500
+
+# Number of nonces or keys a worker process tries before reporting back when mining.
+DEFAULT_MINING_CHUNK_SIZE = 20000
+
+# Parameters of the scrypt key derivation for encrypting the private key. Raising
+# KDF_SCRYPT_N (a power of 2) makes guessing the password, and unlocking the key, slower.
+KDF_SCRYPT_N = 2 ** 15
+KDF_SCRYPT_R = 8
+KDF_SCRYPT_P = 1
+KDF_SALT_LENGTH = 16
+
+# Environment variable with the path of the key agent's socket, and the socket
+# file (in the client's folder) used when it isn't set.
+KEY_AGENT_SOCKET_ENV = "NOSTR_KEY_AGENT_SOCKET"
+KEY_AGENT_SOCKET_FILE = "key_agent.sock"
+# Environment variable with the password of the key file, so that the CLI doesn't prompt for it.
+KEY_PASSWORD_ENV = "NOSTR_KEY_PASSWORD"
+
+# Number of input lines the CLI signs and publishes together.
+DEFAULT_CLI_BATCH_SIZE = 1000
+
+# Upper bounds (in seconds) of the histogram buckets timings are counted in when metrics are recorded.
+DEFAULT_HISTOGRAM_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Environment variable with the level (e.g. "debug") from which the client's log
+# messages are printed to stderr as JSON lines. Nothing is logged when it isn't set.
+LOG_LEVEL_ENV = "NOSTR_LOG_LEVEL"
+
+# Number of relays, fastest first, to read from and to publish to.
+READ_RELAY_COUNT = 8
+WRITE_RELAY_COUNT = 8
+# Failures in a row after which a relay is put on probation, and the bounds (in seconds)
+# of the probation period, which doubles with each further round of failures.
+PROBATION_FAILURE_THRESHOLD = 3
+PROBATION_BASE_DELAY = 60
+PROBATION_MAX_DELAY = 24 * 60 * 60
+# Latency (in seconds) assumed for relays that haven't answered yet.
+UNKNOWN_RELAY_LATENCY = 0.5
+# Appended to the relay file name to get the file the relays' health is kept in.
+RELAY_HEALTH_FILE_SUFFIX = ".health"
@@ -1,8 +1,9 @@
 from enum import Enum
-import json
 import time
 from hashlib import sha256
 
+import codec
+
 class EventKinds(Enum):
     SET_METADATA = 0
     TEXT_NOTE = 1
@@ -21,6 +22,7 @@ class BaseEvent:
         Args:
             author (str): the hexadecimal public key of the author
             message (str): the message to be posted in a string format
+            kind (EventKinds or int): the kind of event; any integer kind is allowed
         """
         self.author = author
         self.content = content
@@ -28,7 +30,7 @@ class BaseEvent:
         self.tags = []
 
     def get_kind(self):
-        return self.kind.value
+        return self.kind.value if isinstance(self.kind, EventKinds) else self.kind
 
     def tag_event(self, event_id, relay_url=""):
         """
@@ -50,20 +52,26 @@ class BaseEvent:
         """
         self.tags.append(["p", pub_key, relay_url])
     
+    def tag_nonce(self, nonce, target_difficulty):
+        """
+        Adds a NIP-13 proof-of-work nonce tag to this event.
+
+        Args:
+            nonce (int): the nonce that gives the event's id its difficulty
+            target_difficulty (int): the number of leading zero bits that was aimed for
+        """
+        self.tags.append(["nonce", str(nonce), str(target_difficulty)])
+
     def clear_tags(self):
         self.tags = []
 
     def stamped_event(self):
         """
-        Serializes the event by also adding a timestamp. All contents 
-        before the serialization are expected to be composed of ascii characters.
-        Non-ascii characters are ignored. To include them, add ensure_ascii=True flag
-        in the call to json.dumps()
+        Serializes the event by also adding a timestamp. Non-ascii characters
+        are kept as they are (UTF-8 encoded) rather than escaped, as per NIP-01.
         """
         timestamp = int(time.time())
-        base_array = [0, self.author, timestamp, self.get_kind(), self.tags, self.content]
-        str_format = json.dumps(base_array, separators=(',', ':'))
-        return (timestamp, str_format.encode())
+        return (timestamp, codec.canonical_event(self.author, timestamp, self.get_kind(), self.tags, self.content))
     
     @staticmethod
     def get_id_from_stamped_event(stamped_event):
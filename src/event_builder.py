@@ -0,0 +1,69 @@
+import time
+from hashlib import sha256
+
+import codec
+import instrumentation
+from constants import ClientMessageType
+
+
+def _dumps(value):
+    return codec.canonical_dumps(value).decode()
+
+
+class EventBuilder:
+    """
+    A fast path for turning events into signed EVENT messages. The canonical
+    NIP-01 serialization is produced once, the id stays as raw bytes until it
+    has been signed, and the message sent to relays is spliced together from
+    the pieces that were already serialized for the id.
+    """
+    def __init__(self, keys):
+        """
+        Args:
+            keys (KeyPair): the keys to sign the events with
+        """
+        self.keys = keys
+        self.pubkey = keys.pubkey_hex_string()
+        self._pubkey_json = _dumps(self.pubkey)
+        self._message_prefix = f'[{_dumps(ClientMessageType.EVENT)},{{"id":"'
+
+    def build(self, event, created_at=None):
+        """
+        Stamps, hashes and signs the event.
+
+        Args:
+            event (BaseEvent): the event to publish
+            created_at (int, optional): the timestamp to give the event. Defaults to now.
+
+        Returns:
+            tuple: the hex id of the event and the serialized EVENT message
+        """
+        if created_at is None:
+            created_at = int(time.time())
+        recorder = instrumentation.recorder
+        with recorder.time("nostr_serialize_seconds"):
+            pubkey_json = self._pubkey_json if event.author == self.pubkey else _dumps(event.author)
+            kind = event.get_kind()
+            tags_json = _dumps(event.tags)
+            content_json = _dumps(event.content)
+            serialized_event = f'[0,{pubkey_json},{created_at},{kind},{tags_json},{content_json}]'.encode()
+            id_bytes = sha256(serialized_event).digest()
+        event_id = id_bytes.hex()
+        with recorder.time("nostr_sign_seconds"):
+            signature = self.keys.sign_raw_bytes(id_bytes).hex()
+        message = (
+            f'{self._message_prefix}{event_id}","pubkey":{pubkey_json},"created_at":{created_at},'
+            f'"kind":{kind},"tags":{tags_json},"content":{content_json},"sig":"{signature}"}}]'
+        )
+        return (event_id, message)
+
+    def build_many(self, events, created_at=None):
+        """
+        Builds a batch of events, stamping all of them with the same timestamp.
+
+        Returns:
+            list: (hex id, serialized EVENT message) pairs, in the same order as the events
+        """
+        if created_at is None:
+            created_at = int(time.time())
+        return [self.build(event, created_at) for event in events]
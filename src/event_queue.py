@@ -0,0 +1,152 @@
+import asyncio
+import json
+import tempfile
+from collections import deque
+from enum import Enum
+
+from constants import DEFAULT_EVENT_QUEUE_SIZE
+
+
+class OverflowPolicy(Enum):
+    # Make the producer wait for room, which stops reading from the relay's socket.
+    BLOCK = "block"
+    DROP_OLDEST = "drop_oldest"
+    DROP_NEWEST = "drop_newest"
+    # Keep the overflow in a temporary file and read it back in order.
+    SPILL_TO_DISK = "spill_to_disk"
+
+
+class QueueClosed(Exception):
+    """
+    Raised by BoundedEventQueue.get once the queue is closed and empty.
+    """
+
+
+class BoundedEventQueue:
+    """
+    A FIFO queue between the network receive path and the code that processes
+    events, holding at most maxsize items in memory. What happens when it is
+    full is decided by its OverflowPolicy. The current depth, the deepest it
+    has been, and how many items were dropped or spilled are kept for monitoring.
+    """
+    def __init__(self, maxsize=DEFAULT_EVENT_QUEUE_SIZE, policy=OverflowPolicy.BLOCK,
+                 spill_directory=None, dumps=json.dumps, loads=json.loads):
+        """
+        Args:
+            maxsize (int, optional): number of items held in memory
+            policy (OverflowPolicy, optional): what to do with items that arrive when the queue is full
+            spill_directory (str, optional): where to create the spill file. Defaults to the system's temp folder.
+            dumps, loads (optional): turn items into a line of text and back, for spilling to disk
+        """
+        self.maxsize = maxsize
+        self.policy = policy
+        self.spill_directory = spill_directory
+        self.dumps = dumps
+        self.loads = loads
+        self.dropped = 0
+        self.spilled = 0
+        self.max_depth = 0
+        self.closed = False
+        self._items = deque()
+        self._readable = asyncio.Event()
+        self._writable = asyncio.Event()
+        self._writable.set()
+        self._spill_file = None
+        self._spill_count = 0
+        self._spill_read_position = 0
+
+    @property
+    def depth(self):
+        return len(self._items) + self._spill_count
+
+    def __len__(self):
+        return self.depth
+
+    def put(self, item):
+        """
+        Adds the item, applying the overflow policy if the queue is full.
+
+        Returns:
+            None, or (with the BLOCK policy on a full queue) an awaitable that
+            finishes once the item has been added. The caller must await it
+            before putting anything else, to keep the items in order.
+        """
+        if self.closed:
+            return None
+        if self._spill_count:
+            # Older items are on disk, so this one has to wait its turn there too.
+            self._spill(item)
+        elif len(self._items) < self.maxsize:
+            self._append(item)
+        elif self.policy == OverflowPolicy.BLOCK:
+            return self._put_when_room(item)
+        elif self.policy == OverflowPolicy.DROP_OLDEST:
+            self._items.popleft()
+            self.dropped += 1
+            self._append(item)
+        elif self.policy == OverflowPolicy.DROP_NEWEST:
+            self.dropped += 1
+        else:
+            self._spill(item)
+        return None
+
+    def _append(self, item):
+        self._items.append(item)
+        self._readable.set()
+        self.max_depth = max(self.max_depth, self.depth)
+
+    async def _put_when_room(self, item):
+        while len(self._items) >= self.maxsize and not self.closed:
+            self._writable.clear()
+            await self._writable.wait()
+        if not self.closed:
+            self._append(item)
+
+    def _spill(self, item):
+        if self._spill_file is None:
+            self._spill_file = tempfile.TemporaryFile("w+", dir=self.spill_directory)
+        self._spill_file.seek(0, 2)
+        self._spill_file.write(self.dumps(item) + "\n")
+        self._spill_count += 1
+        self.spilled += 1
+        self.max_depth = max(self.max_depth, self.depth)
+
+    def _unspill(self):
+        while self._spill_count and len(self._items) < self.maxsize:
+            self._spill_file.seek(self._spill_read_position)
+            line = self._spill_file.readline()
+            self._spill_read_position = self._spill_file.tell()
+            self._spill_count -= 1
+            self._items.append(self.loads(line))
+        if not self._spill_count and self._spill_file is not None:
+            self._spill_file.seek(0)
+            self._spill_file.truncate()
+            self._spill_read_position = 0
+
+    async def get(self):
+        """
+        Removes and returns the oldest item, waiting for one if the queue is empty.
+        Raises QueueClosed once the queue is closed and everything has been taken out.
+        """
+        while not self._items:
+            if self.closed:
+                raise QueueClosed()
+            self._readable.clear()
+            await self._readable.wait()
+        item = self._items.popleft()
+        if self._spill_count:
+            self._unspill()
+        self._writable.set()
+        return item
+
+    def close(self):
+        """
+        Stops accepting items. Items already in the queue can still be taken out.
+        """
+        self.closed = True
+        self._readable.set()
+        self._writable.set()
+
+    def __del__(self):
+        if self._spill_file is not None:
+            self._spill_file.close()
@@ -0,0 +1,183 @@
+import sqlite3
+
+import codec
+from constants import HEX_KEY_LENGTH
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id TEXT PRIMARY KEY,
+    pubkey TEXT NOT NULL,
+    created_at INTEGER NOT NULL,
+    kind INTEGER NOT NULL,
+    raw TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_pubkey ON events (pubkey, created_at);
+CREATE INDEX IF NOT EXISTS events_kind ON events (kind, created_at);
+CREATE INDEX IF NOT EXISTS events_created_at ON events (created_at);
+CREATE TABLE IF NOT EXISTS tags (
+    event_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    value TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tags_value ON tags (name, value, event_id);
+"""
+
+
+def _prefix_condition(column, prefixes, params):
+    conditions = []
+    for prefix in prefixes:
+        if len(prefix) == HEX_KEY_LENGTH:
+            conditions.append(f"{column} = ?")
+            params.append(prefix)
+        else:
+            # A range instead of LIKE so that the index on the column is used.
+            # "g" sorts after every lowercase hex digit.
+            conditions.append(f"({column} >= ? AND {column} < ?)")
+            params += [prefix, prefix + "g"]
+    return "(" + " OR ".join(conditions) + ")" if conditions else "0"
+
+
+class EventStore:
+    """
+    Keeps received events in a SQLite database, indexed by id, author, kind,
+    created_at and the values of single-letter tags, so that subscription
+    filters can be answered locally.
+    """
+    def __init__(self, file_name):
+        """
+        Args:
+            file_name (str): path of the database file, or ":memory:"
+        """
+        self.file_name = file_name
+        # Events are received on the relay pool's thread and may be read from the main thread.
+        self._db = sqlite3.connect(file_name, check_same_thread=False)
+        self._db.executescript(SCHEMA)
+
+    def add(self, event):
+        """
+        Stores the event unless it is already stored. Call commit() to save it to disk.
+
+        Returns:
+            bool: True if the event was new
+        """
+        cursor = self._db.execute(
+            "INSERT OR IGNORE INTO events (id, pubkey, created_at, kind, raw) VALUES (?, ?, ?, ?, ?)",
+            (event["id"], event["pubkey"], event["created_at"], event["kind"], codec.dumps(event)),
+        )
+        if not cursor.rowcount:
+            return False
+        self._db.executemany(
+            "INSERT INTO tags (event_id, name, value) VALUES (?, ?, ?)",
+            [(event["id"], tag[0], tag[1]) for tag in event["tags"]
+             if len(tag) > 1 and isinstance(tag[0], str) and len(tag[0]) == 1],
+        )
+        return True
+
+    def add_many(self, events):
+        """
+        Stores a batch of events in a single transaction.
+
+        Returns:
+            int: the number of events that were new
+        """
+        with self._db:
+            return sum(1 for event in events if self.add(event))
+
+    def commit(self):
+        self._db.commit()
+
+    def get(self, event_id):
+        row = self._db.execute("SELECT raw FROM events WHERE id = ?", (event_id,)).fetchone()
+        return codec.loads(row[0]) if row else None
+
+    def __len__(self):
+        return self._db.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+
+    @staticmethod
+    def _where_clause(subscription_filter):
+        conditions = []
+        params = []
+        if "ids" in subscription_filter:
+            conditions.append(_prefix_condition("id", subscription_filter["ids"], params))
+        if "authors" in subscription_filter:
+            conditions.append(_prefix_condition("pubkey", subscription_filter["authors"], params))
+        if "kinds" in subscription_filter:
+            kinds = [int(kind) for kind in subscription_filter["kinds"]]
+            conditions.append(f"kind IN ({','.join('?' * len(kinds))})" if kinds else "0")
+            params += kinds
+        if "since" in subscription_filter:
+            conditions.append("created_at >= ?")
+            params.append(int(subscription_filter["since"]))
+        if "until" in subscription_filter:
+            conditions.append("created_at <= ?")
+            params.append(int(subscription_filter["until"]))
+        for key, values in subscription_filter.items():
+            if key.startswith("#") and len(key) == 2:
+                if not values:
+                    conditions.append("0")
+                    continue
+                conditions.append(
+                    "EXISTS (SELECT 1 FROM tags WHERE tags.event_id = events.id AND tags.name = ? "
+                    f"AND tags.value IN ({','.join('?' * len(values))}))"
+                )
+                params += [key[1]] + list(values)
+        return (" AND ".join(conditions) or "1", params)
+
+    def query(self, filters):
+        """
+        Returns the stored events matching any of the NIP-01 filters, newest first,
+        with each filter's limit applied.
+
+        Args:
+            filters (dict or list[dict]): the subscription filter(s), as built by Request
+        """
+        if isinstance(filters, dict):
+            filters = [filters]
+        matched = {}
+        for subscription_filter in filters:
+            where, params = EventStore._where_clause(subscription_filter)
+            sql = f"SELECT id, raw FROM events WHERE {where} ORDER BY created_at DESC"
+            if "limit" in subscription_filter:
+                sql += " LIMIT ?"
+                params.append(int(subscription_filter["limit"]))
+            for event_id, raw in self._db.execute(sql, params):
+                matched[event_id] = raw
+        events = [codec.loads(raw) for raw in matched.values()]
+        events.sort(key=lambda event: event["created_at"], reverse=True)
+        return events
+
+    def id_index(self, subscription_filter):
+        """
+        Returns the (created_at, id) pairs of the stored events matching the filter
+        (ignoring its limit), oldest first, without reading the events themselves.
+        """
+        subscription_filter = {key: value for key, value in subscription_filter.items() if key != "limit"}
+        where, params = EventStore._where_clause(subscription_filter)
+        return self._db.execute(
+            f"SELECT created_at, id FROM events WHERE {where} ORDER BY created_at, id", params
+        ).fetchall()
+
+    def newest_created_at(self, subscription_filter):
+        """
+        Returns the created_at of the newest stored event matching the filter
+        (ignoring its limit), or None if no stored event matches.
+        """
+        subscription_filter = {key: value for key, value in subscription_filter.items() if key != "limit"}
+        where, params = EventStore._where_clause(subscription_filter)
+        return self._db.execute(f"SELECT MAX(created_at) FROM events WHERE {where}", params).fetchone()[0]
+
+    def delta_filter(self, subscription_filter):
+        """
+        Returns a copy of the filter that only asks relays for events at least as new
+        as the newest matching event already stored. since is inclusive, so events
+        from that same second are fetched again rather than missed.
+        """
+        newest = self.newest_created_at(subscription_filter)
+        delta = dict(subscription_filter)
+        if newest is not None and newest > int(delta.get("since", 0)):
+            delta["since"] = newest
+        return delta
+
+    def close(self):
+        self._db.commit()
+        self._db.close()
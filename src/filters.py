@@ -0,0 +1,247 @@
+from constants import HEX_KEY_LENGTH
+
+# Key under which a trie node keeps the values of the prefix ending at that node.
+# Tries are keyed by single hex characters, so None can't clash with them.
+_VALUES = None
+
+
+# Filter fields that hold a single integer.
+INTEGER_FIELDS = ("since", "until", "limit")
+
+
+def _is_tag_key(key):
+    return len(key) == 2 and key[0] == "#"
+
+
+def _integer(key, value):
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.strip().lstrip("-").isdigit():
+        return int(value)
+    raise ValueError(f"{key} must be an integer, not {value!r}")
+
+
+def canonical_filter(subscription_filter):
+    """
+    Returns the filter in a canonical form, so that filters asking for the same
+    events are equal and serialize to the same JSON: keys in sorted order, lists
+    without duplicates and sorted, and kinds, since, until and limit as integers
+    (user input gives them as strings).
+
+    Raises:
+        ValueError: if kinds, since, until or limit hold something other than integers
+    """
+    canonical = {}
+    for key in sorted(subscription_filter):
+        value = subscription_filter[key]
+        if key in INTEGER_FIELDS:
+            value = _integer(key, value)
+        elif key == "kinds":
+            value = sorted({_integer(key, kind) for kind in value})
+        elif isinstance(value, (list, tuple)):
+            try:
+                value = sorted(set(value))
+            except TypeError:
+                # Values that can't be hashed or ordered are left as they are.
+                value = list(value)
+        canonical[key] = value
+    return canonical
+
+
+class PrefixIndex:
+    """
+    Maps hex ids/public keys and prefixes of them to lists of values. Full
+    length keys are looked up in a dict, and shorter prefixes in a trie, so a
+    lookup costs at most one step per character of the longest prefix.
+    """
+    def __init__(self):
+        self._exact = {}
+        self._trie = {}
+        self._has_prefixes = False
+
+    def add(self, prefix, value):
+        """
+        Adds the value under the prefix and returns the list it was added to.
+        """
+        if len(prefix) == HEX_KEY_LENGTH:
+            bucket = self._exact.setdefault(prefix, [])
+        else:
+            node = self._trie
+            for character in prefix:
+                node = node.setdefault(character, {})
+            bucket = node.setdefault(_VALUES, [])
+            self._has_prefixes = True
+        bucket.append(value)
+        return bucket
+
+    def lookup(self, key):
+        """
+        Returns the values of every prefix that key starts with.
+        """
+        values = list(self._exact.get(key, ()))
+        if self._has_prefixes:
+            node = self._trie
+            values += node.get(_VALUES, ())
+            for character in key:
+                node = node.get(character)
+                if node is None:
+                    break
+                values += node.get(_VALUES, ())
+        return values
+
+    def __contains__(self, key):
+        if key in self._exact:
+            return True
+        node = self._trie
+        if not self._has_prefixes:
+            return False
+        if _VALUES in node:
+            return True
+        for character in key:
+            node = node.get(character)
+            if node is None:
+                return False
+            if _VALUES in node:
+                return True
+        return False
+
+
+class CompiledFilter:
+    """
+    A NIP-01 filter turned into sets and prefix indexes, so that checking an
+    event against it costs a few lookups instead of scanning its lists.
+    """
+    def __init__(self, subscription_filter):
+        """
+        Args:
+            subscription_filter (dict): a filter as built by Request
+        """
+        self.filter = subscription_filter
+        self.ids = CompiledFilter._prefixes(subscription_filter.get("ids"))
+        self.authors = CompiledFilter._prefixes(subscription_filter.get("authors"))
+        kinds = subscription_filter.get("kinds")
+        self.kinds = frozenset(int(kind) for kind in kinds) if kinds is not None else None
+        since = subscription_filter.get("since")
+        self.since = int(since) if since is not None else None
+        until = subscription_filter.get("until")
+        self.until = int(until) if until is not None else None
+        self.tags = {
+            key[1]: frozenset(values) for key, values in subscription_filter.items() if _is_tag_key(key)
+        }
+
+    @staticmethod
+    def _prefixes(prefixes):
+        if prefixes is None:
+            return None
+        index = PrefixIndex()
+        for prefix in prefixes:
+            index.add(prefix, True)
+        return index
+
+    def matches(self, event):
+        """
+        Returns True if the event passes every condition of the filter.
+        """
+        if self.kinds is not None and event["kind"] not in self.kinds:
+            return False
+        if self.since is not None and event["created_at"] < self.since:
+            return False
+        if self.until is not None and event["created_at"] > self.until:
+            return False
+        if self.ids is not None and event["id"] not in self.ids:
+            return False
+        if self.authors is not None and event["pubkey"] not in self.authors:
+            return False
+        for name, values in self.tags.items():
+            if not any(len(tag) > 1 and tag[0] == name and tag[1] in values for tag in event["tags"]):
+                return False
+        return True
+
+
+class CompiledFilters:
+    """
+    A list of filters OR'd together, as in a REQ with several filters.
+    """
+    def __init__(self, filters):
+        if isinstance(filters, dict):
+            filters = [filters]
+        self.filters = [CompiledFilter(subscription_filter) for subscription_filter in filters]
+
+    def matches(self, event):
+        return any(compiled.matches(event) for compiled in self.filters)
+
+
+class FilterIndex:
+    """
+    Finds which of many active subscriptions an event belongs to without
+    checking every filter. Each filter is indexed by its most selective field
+    (ids, then authors, then a tag, then kinds), so that only the filters
+    sharing a value with the event are checked in full.
+    """
+    def __init__(self):
+        self._ids = PrefixIndex()
+        self._authors = PrefixIndex()
+        self._tags = {}
+        self._kinds = {}
+        self._unindexed = []
+        self._buckets = {}
+
+    def add(self, key, filters):
+        """
+        Starts routing events that match any of the filters to key.
+
+        Args:
+            key: identifies the subscription, e.g. its subscription id
+            filters (dict or list[dict]): the subscription's filter(s)
+        """
+        self.remove(key)
+        if isinstance(filters, dict):
+            filters = [filters]
+        buckets = []
+        for subscription_filter in filters:
+            compiled = CompiledFilter(subscription_filter)
+            entry = (key, compiled)
+            if "ids" in subscription_filter:
+                buckets += [(self._ids.add(prefix, entry), entry) for prefix in subscription_filter["ids"]]
+            elif "authors" in subscription_filter:
+                buckets += [(self._authors.add(prefix, entry), entry) for prefix in subscription_filter["authors"]]
+            elif compiled.tags:
+                name = min(compiled.tags, key=lambda tag_name: len(compiled.tags[tag_name]))
+                values = self._tags.setdefault(name, {})
+                for value in compiled.tags[name]:
+                    bucket = values.setdefault(value, [])
+                    bucket.append(entry)
+                    buckets.append((bucket, entry))
+            elif compiled.kinds is not None:
+                for kind in compiled.kinds:
+                    bucket = self._kinds.setdefault(kind, [])
+                    bucket.append(entry)
+                    buckets.append((bucket, entry))
+            else:
+                self._unindexed.append(entry)
+                buckets.append((self._unindexed, entry))
+        self._buckets[key] = buckets
+
+    def remove(self, key):
+        for bucket, entry in self._buckets.pop(key, []):
+            bucket.remove(entry)
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def match(self, event):
+        """
+        Returns the set of keys whose filters the event matches.
+        """
+        candidates = self._ids.lookup(event["id"]) + self._authors.lookup(event["pubkey"])
+        candidates += self._kinds.get(event["kind"], ())
+        if self._tags:
+            for tag in event["tags"]:
+                if len(tag) > 1 and tag[0] in self._tags:
+                    candidates += self._tags[tag[0]].get(tag[1], ())
+        candidates += self._unindexed
+        matched = set()
+        for key, compiled in candidates:
+            if key not in matched and compiled.matches(event):
+                matched.add(key)
+        return matched
@@ -0,0 +1,104 @@
+import asyncio
+
+from constants import (
+    DEFAULT_MAX_SUBSCRIPTIONS_PER_RELAY,
+    DEFAULT_PUBLISH_TIMEOUT,
+    DEFAULT_PUBLISH_WINDOW,
+)
+from event_builder import EventBuilder
+from relay_pool import RelayPool
+
+
+class HeadlessClient:
+    """
+    A client for programs rather than people: it never prompts or prints, and
+    runs on the caller's event loop. Use it as an async context manager:
+
+        async with HeadlessClient(keys, relay_urls) as client:
+            report = await client.publish(events)
+            async for relay_url, event in client.query(request):
+                ...
+    """
+    def __init__(self, keys, relay_urls, store=None, publish_timeout=DEFAULT_PUBLISH_TIMEOUT,
+                 max_subscriptions_per_relay=DEFAULT_MAX_SUBSCRIPTIONS_PER_RELAY):
+        """
+        Args:
+            keys (KeyPair or AgentKeyPair): the keys to sign events with, or None to only read
+            relay_urls (list[str]): the relays to connect to
+            store (EventStore, optional): where to keep the events that are received
+            publish_timeout (float, optional): seconds to wait for each relay's OK
+            max_subscriptions_per_relay (int, optional): number of subscriptions kept open per relay
+        """
+        self.keys = keys
+        self.builder = EventBuilder(keys) if keys is not None else None
+        self.store = store
+        self.pool = RelayPool(relay_urls, publish_timeout, max_subscriptions_per_relay=max_subscriptions_per_relay)
+
+    async def open(self):
+        await self.pool.open()
+
+    async def close(self):
+        await self.pool.aclose()
+        if self.store is not None:
+            self.store.commit()
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def publish(self, events, timeout=None, window=DEFAULT_PUBLISH_WINDOW, created_at=None):
+        """
+        Signs the events and publishes them to every relay.
+
+        Args:
+            events (list[BaseEvent]): the events to publish
+            timeout (float, optional): seconds to wait for each OK
+            window (int, optional): maximum number of unacknowledged events per relay
+            created_at (int, optional): the timestamp to give the events. Defaults to now.
+
+        Returns:
+            BatchPublishReport: per-event, per-relay results
+
+        Raises:
+            ValueError: if the client has no keys
+        """
+        if self.builder is None:
+            raise ValueError("Publishing needs keys to sign the events with")
+        signed_events = self.builder.build_many(events, created_at)
+        return await self.pool.publish_many(signed_events, timeout, window)
+
+    async def query(self, request, timeout=None):
+        """
+        Yields (relay_url, event) pairs for the events the relays have stored for
+        the request, and stops once every relay has sent EOSE or the timeout passes.
+        """
+        subscription = await self.pool.subscribe(request)
+        try:
+            eose = asyncio.ensure_future(subscription.wait_for_eose(timeout))
+            eose.add_done_callback(lambda _: asyncio.ensure_future(subscription.close()))
+            async for relay_url, event in subscription:
+                self._store(event)
+                yield (relay_url, event)
+        finally:
+            eose.cancel()
+            await subscription.close()
+
+    async def stream(self, request):
+        """
+        Yields (relay_url, event) pairs for the request's stored events and then
+        for new events as they arrive, until the caller stops iterating.
+        """
+        subscription = await self.pool.subscribe(request)
+        try:
+            async for relay_url, event in subscription:
+                self._store(event)
+                yield (relay_url, event)
+        finally:
+            await subscription.close()
+
+    def _store(self, event):
+        if self.store is not None:
+            self.store.add(event)
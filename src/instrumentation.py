@@ -0,0 +1,299 @@
+"""
+Metrics, tracing and logs for the publish and subscribe paths.
+
+The client reports what it does to the module's recorder: counters (events
+received per relay, ...), gauges (queue depths) and timed sections
+(serializing, signing, connecting, sending, waiting for OK). The default
+NullRecorder throws all of it away and its methods do nothing, so the hot
+paths pay for little more than a method call. To collect them, install a
+PrometheusRecorder (exposed as Prometheus text by render()) or an
+OpenTelemetryRecorder (timed sections become spans) with set_recorder().
+
+Code that reports on the hottest paths, like every received event, checks
+recorder.enabled first to skip building the labels too.
+
+Log messages go through the standard logging module under the "nostr"
+logger, with the structured details in the record's fields; configure_logging()
+prints them as JSON lines.
+"""
+import bisect
+import contextlib
+import json
+import logging
+import sys
+import threading
+import time
+
+from constants import DEFAULT_HISTOGRAM_BUCKETS
+
+# What the metrics the client reports measure, and their type.
+METRICS = {
+    "nostr_serialize_seconds": ("histogram", "Time spent serializing and hashing events"),
+    "nostr_sign_seconds": ("histogram", "Time spent signing event ids"),
+    "nostr_connect_seconds": ("histogram", "Time taken to open a relay connection"),
+    "nostr_connection_failures_total": ("counter", "Relay connections that failed or dropped"),
+    "nostr_send_seconds": ("histogram", "Time spent handing a message to a relay connection"),
+    "nostr_messages_sent_total": ("counter", "Messages sent to relays"),
+    "nostr_ok_latency_seconds": ("histogram", "Time from sending an event to the relay's OK"),
+    "nostr_publish_results_total": ("counter", "Publish outcomes, per relay and status"),
+    "nostr_events_received_total": ("counter", "Events received for subscriptions"),
+    "nostr_events_deduplicated_total": ("counter", "Events dropped because another relay sent them first"),
+    "nostr_events_mismatched_total": ("counter", "Events dropped for not matching the subscription filter"),
+    "nostr_events_verified_total": ("counter", "Event signatures checked, by result"),
+    "nostr_queue_depth": ("gauge", "Events waiting to be consumed, per subscription"),
+}
+
+logger = logging.getLogger("nostr")
+
+
+class NullRecorder:
+    """
+    Discards everything. This is the recorder in use until set_recorder() is called.
+    """
+    enabled = False
+
+    def increment(self, name, amount=1, **labels):
+        pass
+
+    def set_gauge(self, name, value, **labels):
+        pass
+
+    def observe(self, name, value, **labels):
+        pass
+
+    def time(self, name, **labels):
+        """
+        Returns a context manager that records how long its block takes in the histogram name.
+        """
+        return _NULL_TIMER
+
+
+_NULL_TIMER = contextlib.nullcontext()
+
+
+class _Timer:
+    def __init__(self, recorder, name, labels):
+        self.recorder = recorder
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.recorder.observe(self.name, time.perf_counter() - self.start, **self.labels)
+
+
+class PrometheusRecorder(NullRecorder):
+    """
+    Keeps the metrics in memory and renders them in the Prometheus text format.
+    Recording may happen from several threads (the pool's and the caller's).
+    """
+    enabled = True
+
+    def __init__(self, buckets=DEFAULT_HISTOGRAM_BUCKETS):
+        """
+        Args:
+            buckets (tuple, optional): upper bounds, in increasing order, of the histogram buckets
+        """
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # Each maps (name, sorted label pairs) to the value.
+        self._counters = {}
+        self._gauges = {}
+        # Histograms map the key to the per-bucket counts, the count and the sum.
+        self._histograms = {}
+
+    def increment(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self._gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * len(self.buckets), 0, 0.0]
+            bucket = bisect.bisect_left(self.buckets, value)
+            if bucket < len(self.buckets):
+                histogram[0][bucket] += 1
+            histogram[1] += 1
+            histogram[2] += value
+
+    def time(self, name, **labels):
+        return _Timer(self, name, labels)
+
+    def value(self, name, **labels):
+        """
+        Returns a counter's or gauge's value, or a histogram's number of observations. 0 if nothing was recorded.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if key in self._histograms:
+                return self._histograms[key][1]
+            return self._counters.get(key, self._gauges.get(key, 0))
+
+    def render(self):
+        """
+        Returns every metric recorded so far in the Prometheus text exposition format.
+        """
+        with self._lock:
+            samples = {}
+            for (name, labels), value in self._counters.items():
+                samples.setdefault((name, "counter"), []).append((name, labels, value))
+            for (name, labels), value in self._gauges.items():
+                samples.setdefault((name, "gauge"), []).append((name, labels, value))
+            for (name, labels), (bucket_counts, count, total) in self._histograms.items():
+                lines = samples.setdefault((name, "histogram"), [])
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, bucket_counts):
+                    cumulative += bucket_count
+                    lines.append((name + "_bucket", labels + (("le", _number(bound)),), cumulative))
+                lines.append((name + "_bucket", labels + (("le", "+Inf"),), count))
+                lines.append((name + "_count", labels, count))
+                lines.append((name + "_sum", labels, total))
+        output = []
+        for (name, kind), lines in sorted(samples.items()):
+            if name in METRICS:
+                output.append(f"# HELP {name} {METRICS[name][1]}")
+            output.append(f"# TYPE {name} {kind}")
+            for sample_name, labels, value in lines:
+                output.append(f"{sample_name}{_labels(labels)} {_number(value)}")
+        return "\n".join(output) + "\n" if output else ""
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    pairs = (f'{key}="{_escape(value)}"' for key, value in labels)
+    return "{" + ",".join(pairs) + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class OpenTelemetryRecorder(NullRecorder):
+    """
+    Hands the metrics to the OpenTelemetry API: counters and histograms go to
+    a meter, and each timed section is also a span, so publishes show up in
+    traces. Needs the opentelemetry-api package; the SDK and exporters are set
+    up by the application as usual.
+    """
+    enabled = True
+
+    def __init__(self, tracer=None, meter=None):
+        """
+        Args:
+            tracer (optional): the tracer to start spans with. Defaults to the global tracer provider's.
+            meter (optional): the meter to record metrics with. Defaults to the global meter provider's.
+        """
+        if tracer is None or meter is None:
+            from opentelemetry import metrics, trace
+            tracer = tracer or trace.get_tracer("nostr-client")
+            meter = meter or metrics.get_meter("nostr-client")
+        self.tracer = tracer
+        self.meter = meter
+        self._instruments = {}
+        self._gauge_values = {}
+        self._lock = threading.Lock()
+
+    def _instrument(self, name, kind):
+        instrument = self._instruments.get(name)
+        if instrument is None:
+            with self._lock:
+                instrument = self._instruments.get(name)
+                if instrument is None:
+                    description = METRICS.get(name, (kind, ""))[1]
+                    create = {
+                        "counter": self.meter.create_counter,
+                        "gauge": self.meter.create_up_down_counter,
+                        "histogram": self.meter.create_histogram,
+                    }[kind]
+                    instrument = self._instruments[name] = create(name, description=description)
+        return instrument
+
+    def increment(self, name, amount=1, **labels):
+        self._instrument(name, "counter").add(amount, labels)
+
+    def set_gauge(self, name, value, **labels):
+        # Gauges are up-down counters here, so add the change since the last value.
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            change = value - self._gauge_values.get(key, 0)
+            self._gauge_values[key] = value
+        self._instrument(name, "gauge").add(change, labels)
+
+    def observe(self, name, value, **labels):
+        self._instrument(name, "histogram").record(value, labels)
+
+    @contextlib.contextmanager
+    def time(self, name, **labels):
+        start = time.perf_counter()
+        with self.tracer.start_as_current_span(name, attributes=labels):
+            yield
+        self.observe(name, time.perf_counter() - start, **labels)
+
+
+recorder = NullRecorder()
+
+
+def set_recorder(new_recorder):
+    """
+    Makes new_recorder receive the metrics from now on. Pass None to stop recording.
+
+    Returns:
+        the recorder that was in use before
+    """
+    global recorder
+    previous = recorder
+    recorder = new_recorder or NullRecorder()
+    return previous
+
+
+class JsonLogFormatter(logging.Formatter):
+    """
+    Formats log records as one JSON object per line, with the fields passed
+    in the record's extra alongside the time, level and message.
+    """
+    # Attributes every LogRecord has, which aren't part of the structured fields.
+    _STANDARD_FIELDS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+    def format(self, record):
+        line = {"time": record.created, "level": record.levelname.lower(), "message": record.getMessage()}
+        for key, value in vars(record).items():
+            if key not in self._STANDARD_FIELDS:
+                line[key] = value
+        if record.exc_info:
+            line["exception"] = self.formatException(record.exc_info)
+        return json.dumps(line, default=str)
+
+
+def configure_logging(level, stream=None):
+    """
+    Prints the client's log messages at level or above (e.g. "debug") to stream
+    (stderr by default) as JSON lines, replacing the output set up by an earlier
+    call. Does nothing if level is None or empty.
+    """
+    global _log_handler
+    if not level:
+        return
+    if _log_handler is not None:
+        logger.removeHandler(_log_handler)
+    _log_handler = logging.StreamHandler(stream or sys.stderr)
+    _log_handler.setFormatter(JsonLogFormatter())
+    logger.addHandler(_log_handler)
+    logger.setLevel(level.upper() if isinstance(level, str) else level)
+
+
+_log_handler = None
@@ -0,0 +1,234 @@
+import argparse
+import json
+import os
+import socket
+import socketserver
+import threading
+
+from constants import KEY_AGENT_SOCKET_ENV, KEY_AGENT_SOCKET_FILE
+
+
+class KeyAgentError(Exception):
+    """
+    Raised when the key agent can't be reached or refuses a request.
+    """
+
+
+class _AgentHandler(socketserver.StreamRequestHandler):
+    """
+    Answers newline separated JSON requests on one connection:
+        {"method": "pubkey"} -> {"result": <hex public key>}
+        {"method": "sign", "message": <hex>} -> {"result": <hex signature>}
+    Errors are answered with {"error": <reason>}.
+    """
+    def setup(self):
+        super().setup()
+        self.server.clients.add(self.request)
+
+    def finish(self):
+        self.server.clients.discard(self.request)
+        super().finish()
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                response = {"result": self.server.agent.handle_request(request)}
+            except (ValueError, KeyError, TypeError) as error:
+                response = {"error": str(error)}
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+            self.wfile.flush()
+
+
+class _AgentServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, handler):
+        super().__init__(socket_path, handler)
+        self.clients = set()
+
+    def disconnect_clients(self):
+        for client in list(self.clients):
+            try:
+                client.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+class KeyAgent:
+    """
+    Holds an unlocked private key and signs messages for other processes over
+    a Unix socket, so that the password is only entered once and the workers
+    using the key never hold the secret. Only the user running the agent can
+    connect to the socket.
+    """
+    def __init__(self, keys, socket_path):
+        """
+        Args:
+            keys (KeyPair): the unlocked keys
+            socket_path (str): where to create the socket
+        """
+        self.keys = keys
+        self.socket_path = socket_path
+        self.pubkey = keys.pubkey_hex_string()
+        self._sign_lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    def handle_request(self, request):
+        method = request["method"]
+        if method == "pubkey":
+            return self.pubkey
+        if method == "sign":
+            message = bytes.fromhex(request["message"])
+            with self._sign_lock:
+                return self.keys.sign_raw_bytes(message).hex()
+        raise ValueError(f"unknown method {method}")
+
+    def _bind(self):
+        """
+        Raises:
+            KeyAgentError: if another agent is already listening on the socket
+        """
+        if os.path.exists(self.socket_path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.socket_path)
+            except OSError:
+                # Left behind by an agent that didn't shut down cleanly.
+                os.remove(self.socket_path)
+            else:
+                raise KeyAgentError(f"A key agent is already listening on {self.socket_path}")
+            finally:
+                probe.close()
+        previous_umask = os.umask(0o177)
+        try:
+            self._server = _AgentServer(self.socket_path, _AgentHandler)
+        finally:
+            os.umask(previous_umask)
+        self._server.agent = self
+
+    def start(self):
+        """
+        Starts serving in a background thread.
+        """
+        self._bind()
+        self._thread = threading.Thread(target=self._server.serve_forever, args=(0.05,), daemon=True)
+        self._thread.start()
+
+    def serve_forever(self):
+        self._bind()
+        try:
+            self._server.serve_forever()
+        finally:
+            self.close()
+
+    def close(self):
+        if self._server is not None:
+            if self._thread is not None:
+                self._server.shutdown()
+                self._thread = None
+            self._server.server_close()
+            self._server.disconnect_clients()
+            self._server = None
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+
+
+class AgentKeyPair:
+    """
+    Signs through a KeyAgent. Can be used wherever a KeyPair is used for
+    signing; the private key itself is never available.
+    """
+    def __init__(self, socket_path):
+        """
+        Raises:
+            KeyAgentError: if the agent can't be reached
+        """
+        self.socket_path = socket_path
+        self._lock = threading.Lock()
+        self._socket = None
+        self._reader = None
+        self._pubkey = self._call({"method": "pubkey"})
+
+    def _connect(self):
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self._socket.connect(self.socket_path)
+        except OSError as error:
+            self.close()
+            raise KeyAgentError(f"Could not reach the key agent at {self.socket_path}: {error}")
+        self._reader = self._socket.makefile("rb")
+
+    def _call(self, request):
+        with self._lock:
+            # Try again once on a fresh connection in case the agent was restarted.
+            for attempt in range(2):
+                if self._socket is None:
+                    self._connect()
+                try:
+                    self._socket.sendall(json.dumps(request).encode() + b"\n")
+                    line = self._reader.readline()
+                except OSError:
+                    line = b""
+                if line:
+                    break
+                self.close()
+            else:
+                raise KeyAgentError("The key agent closed the connection")
+        response = json.loads(line)
+        if "error" in response:
+            raise KeyAgentError(response["error"])
+        return response["result"]
+
+    def pubkey_hex_string(self):
+        return self._pubkey
+
+    def privkey_hex_string(self):
+        raise KeyAgentError("The private key is held by the key agent")
+
+    def sign_raw_bytes(self, msg):
+        return bytes.fromhex(self.sign_bytes(msg))
+
+    def sign_bytes(self, msg):
+        return self._call({"method": "sign", "message": msg.hex()})
+
+    def verify_signature(self, msg, signature):
+        import secp256k1
+        pubkey = secp256k1.PublicKey(b"\x02" + bytes.fromhex(self._pubkey), raw=True)
+        return pubkey.schnorr_verify(bytes.fromhex(msg), bytes.fromhex(signature), None, raw=True)
+
+    def close(self):
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+
+def default_socket_path(prepath):
+    """
+    Returns the socket given by the environment, or the one in the client's folder.
+    """
+    return os.environ.get(KEY_AGENT_SOCKET_ENV) or os.path.join(prepath, KEY_AGENT_SOCKET_FILE)
+
+
+if __name__ == "__main__":
+    from config import KEY_STORAGE_FILE_KEY, UserConfig
+    from key_pair import KeyPair
+
+    configs = UserConfig()
+    parser = argparse.ArgumentParser(description="Unlock the key once and sign for other processes.")
+    parser.add_argument("--socket", default=default_socket_path(configs.prepath), help="path of the Unix socket")
+    args = parser.parse_args()
+    keys = KeyPair.load_key_pair(configs.get_client_config(KEY_STORAGE_FILE_KEY))
+    if keys is None:
+        print("Error: No key has been saved yet. Run the client once to create one.")
+    else:
+        agent = KeyAgent(keys, args.socket)
+        print("Key agent listening on", args.socket)
+        try:
+            agent.serve_forever()
+        except KeyboardInterrupt:
+            pass
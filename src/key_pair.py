@@ -1,14 +1,67 @@
 import os
 import secrets
 
-import secp256k1
 import hashlib
-from base64 import b64encode
-from cryptography.fernet import Fernet
+from base64 import b64decode, b64encode, urlsafe_b64encode
 from base_interface import BaseInterface
 
-from constants import KEY_STORAGE_FILE
+from constants import KDF_SALT_LENGTH, KDF_SCRYPT_N, KDF_SCRYPT_P, KDF_SCRYPT_R, KEY_STORAGE_FILE
 from config import UserConfig, KEY_STORAGE_FILE_KEY
+from key_agent import AgentKeyPair, KeyAgentError, default_socket_path
+
+# Key files written with a salted scrypt key start with this, followed by the
+# scrypt parameters and the salt. Older files hold only the Fernet token.
+SCRYPT_HEADER = b"scrypt$"
+
+
+# secp256k1 and cryptography are imported where they are used rather than at the
+# top: they are slow to import, and most processes that import this module
+# never create a key or open a key file.
+
+
+def _scrypt_fernet(password, salt, n, r, p):
+    from cryptography.fernet import Fernet
+    key = hashlib.scrypt(
+        password.encode('utf-8'), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r * p + 2 ** 20, dklen=32
+    )
+    return Fernet(urlsafe_b64encode(key))
+
+
+def _legacy_fernet(password):
+    from cryptography.fernet import Fernet
+    # Unsalted, as used before key files had a header.
+    hash_as_bytes = hashlib.sha256(password.encode('utf-8')).digest()
+    return Fernet(b64encode(hash_as_bytes))
+
+
+def encrypt_private_key(secret_bytes, password, n=KDF_SCRYPT_N, r=KDF_SCRYPT_R, p=KDF_SCRYPT_P):
+    """
+    Encrypts the private key with a key derived from the password by scrypt
+    with a random salt. Raising n makes guessing the password slower (and
+    unlocking the key as well).
+
+    Returns:
+        bytes: the contents of the key file
+    """
+    salt = secrets.token_bytes(KDF_SALT_LENGTH)
+    token = _scrypt_fernet(password, salt, n, r, p).encrypt(secret_bytes)
+    return SCRYPT_HEADER + b"%d$%d$%d$" % (n, r, p) + b64encode(salt) + b"$" + token
+
+
+def decrypt_private_key(key_content, password):
+    """
+    Decrypts the contents of a key file.
+
+    Returns:
+        bytes: the private key
+
+    Raises:
+        cryptography.fernet.InvalidToken: if the password is wrong
+    """
+    if key_content.startswith(SCRYPT_HEADER):
+        n, r, p, salt, token = key_content[len(SCRYPT_HEADER):].split(b"$", 4)
+        return _scrypt_fernet(password, b64decode(salt), int(n), int(r), int(p)).decrypt(token)
+    return _legacy_fernet(password).decrypt(key_content)
 
 
 class KeyPair:
@@ -17,10 +70,10 @@ class KeyPair:
     for creating and loading key pairs.
     """
 
-    def __init__(self, private_key, key_store_file=None, interface=BaseInterface()) -> None:
+    def __init__(self, private_key, key_store_file=None, interface=None) -> None:
         self._private_key = private_key
         self.key_store_file = key_store_file
-        self.interface = interface
+        self.interface = interface or BaseInterface()
 
     def _private_key_bytes(self):
         return self._private_key.private_key
@@ -56,17 +109,27 @@ class KeyPair:
         """
         Returns the singature for the message
         """
-        signature_bytes = self._private_key.schnorr_sign(msg, None, raw=True)
-        return signature_bytes.hex()
+        return self.sign_raw_bytes(msg).hex()
+
+    def sign_raw_bytes(self, msg):
+        """
+        Returns the 64-byte schnorr signature for the message as bytes.
+        """
+        return self._private_key.schnorr_sign(msg, None, raw=True)
 
     def verify_signature(self, msg, signature):
         msg_bytes = bytes.fromhex(msg)
         signature_bytes = bytes.fromhex(signature)
         return self._private_key.pubkey.schnorr_verify(msg_bytes, signature_bytes, None, raw=True)
     
-    def save_key(self, file_name, set_key_store=True):
+    def save_key(self, file_name, set_key_store=True, cost=KDF_SCRYPT_N):
         """
         Encrypts and saves the private key to a file.
+
+        Args:
+            file_name (str): the key storage file
+            set_key_store (bool, optional): whether to remember the file as this key's storage file
+            cost (int, optional): the scrypt cost factor (a power of 2) for deriving the encryption key
         """
         if not file_name:
             raise ValueError("File name must be provided.")
@@ -78,46 +141,54 @@ class KeyPair:
             print("Creating a new encrypted key storage file...")
             password = self.interface.get_password("Enter password below:\n>")
             re_entered = self.interface.get_password("Confirm password below:\n>")
-        hash_str = hashlib.sha256(password.encode('utf-8')).hexdigest()
-        hash_as_bytes = bytes.fromhex(hash_str)
-        b64_version = b64encode(hash_as_bytes)
-        f = Fernet(b64_version)
-
-        # Now encrypt and save the key
-        encrypted_key = f.encrypt(self._private_key_bytes())
-        with open(file_name, 'wb') as storage_file:
-            storage_file.write(encrypted_key)
+        self.write_key_file(file_name, password, cost)
         if set_key_store:
             self.key_store_file = file_name
 
+    def write_key_file(self, file_name, password, cost=KDF_SCRYPT_N):
+        with open(file_name, 'wb') as storage_file:
+            storage_file.write(encrypt_private_key(self._private_key_bytes(), password, cost))
+
     @staticmethod
-    def get_user_keys(configs = UserConfig(), interface = BaseInterface()):
-        file_name = configs.get_client_config(KEY_STORAGE_FILE_KEY)
+    def get_user_keys(configs=None, interface=None):
+        """
+        Returns the user's keys, signing through the key agent if one is running
+        so that no password has to be entered.
+        """
+        configs = configs or UserConfig()
+        interface = interface or BaseInterface()
+        socket_path = default_socket_path(configs.prepath)
+        if os.path.exists(socket_path):
+            try:
+                return AgentKeyPair(socket_path)
+            except KeyAgentError as error:
+                print(error)
+        file_name = configs.get_client_config(KEY_STORAGE_FILE_KEY, interface)
         keys = KeyPair.load_key_pair(file_name, interface)
         if not keys:
             keys = KeyPair.create_new_key_pair()
-            keys.save_key(file_name, interface)
+            keys.interface = interface
+            keys.save_key(file_name)
         return keys
 
     @staticmethod
-    def load_key_pair(file_name, interface = BaseInterface()):
+    def load_key_pair(file_name, interface=None):
         """
         Reads the given key storage file, decrypts the private key using a password input,
         and returns a new KeyPair object containing the loaded keys.
-        Returns None if the file is empty.
+        Returns None if the file is empty. Files encrypted the old, unsalted way
+        are rewritten with a salted key once they have been unlocked.
         """
         with open(file_name, 'rb') as key_file:
             key_content = key_file.read()
         if not key_content:
             return None
+        interface = interface or BaseInterface()
         password = interface.get_password("Enter password below:\n>")
-        hash_str = hashlib.sha256(password.encode('utf-8')).hexdigest()
-        hash_as_bytes = bytes.fromhex(hash_str)
-        b64_version = b64encode(hash_as_bytes)
-        f = Fernet(b64_version)
-        secret_bytes = f.decrypt(key_content)
-        priv_key = secp256k1.PrivateKey(secret_bytes, raw=True)
-        return KeyPair(priv_key, file_name)
+        keys = KeyPair.from_secret_bytes(decrypt_private_key(key_content, password), file_name, interface)
+        if not key_content.startswith(SCRYPT_HEADER):
+            keys.write_key_file(file_name, password)
+        return keys
 
     @staticmethod
     def create_new_key_pair():
@@ -125,6 +196,12 @@ class KeyPair:
         Creates a new valid key pair using the secp256k1 curve and saves it to a file.
         Essentially creates the keys for a new Nostr user.
         """
-        secret_bytes = secrets.token_bytes(32)
-        priv_key = secp256k1.PrivateKey(secret_bytes, raw=True)
-        return KeyPair(priv_key)
+        return KeyPair.from_secret_bytes(secrets.token_bytes(32))
+
+    @staticmethod
+    def from_secret_bytes(secret_bytes, key_store_file=None, interface=None):
+        """
+        Returns the KeyPair for a 32-byte private key.
+        """
+        import secp256k1
+        return KeyPair(secp256k1.PrivateKey(secret_bytes, raw=True), key_store_file, interface)
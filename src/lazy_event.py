@@ -0,0 +1,169 @@
+import re
+
+import codec
+from constants import RelayMessageType
+
+# Matches the start of an EVENT message up to the opening brace of the event.
+# Subscription ids with escapes in them are left to the full parser.
+_EVENT_FRAME = re.compile(r'\s*\[\s*"EVENT"\s*,\s*"([^"\\]*)"\s*,\s*(?=\{)')
+
+# The fields that can be read without parsing the whole event. Strings inside
+# JSON can't contain an unescaped quote, so these patterns can only match the
+# event's own keys, never something inside its content or tags.
+_STRING_FIELDS = {
+    "id": re.compile(r'"id"\s*:\s*"([^"\\]*)"'),
+    "pubkey": re.compile(r'"pubkey"\s*:\s*"([^"\\]*)"'),
+}
+_INT_FIELDS = {
+    "kind": re.compile(r'"kind"\s*:\s*(-?\d+)\s*[,}]'),
+    "created_at": re.compile(r'"created_at"\s*:\s*(-?\d+)\s*[,}]'),
+}
+
+
+# How the fields start in compact JSON, as relays usually send it.
+_COMPACT_KEYS = {
+    "id": '"id":"', "pubkey": '"pubkey":"', "kind": '"kind":', "created_at": '"created_at":',
+}
+# How compact EVENT messages start.
+_COMPACT_EVENT_PREFIX = '["EVENT","'
+
+
+class LazyEvent:
+    """
+    An event received from a relay whose JSON is only parsed in full when
+    something other than its id, pubkey, kind or created_at is read. Those are
+    picked out of the raw text on demand, so events that turn out to be
+    duplicates or not to match a filter are dropped without being parsed.
+
+    It is read like the event dict (event["id"], event["tags"], ...), and
+    decode() returns that dict.
+    """
+    __slots__ = ("raw", "_fields", "_decoded")
+
+    def __init__(self, raw):
+        """
+        Args:
+            raw (str): the JSON text of the event object
+        """
+        self.raw = raw
+        self._fields = {}
+        self._decoded = None
+
+    def decode(self):
+        """
+        Parses the whole event and returns it as a dict, checking the types of
+        its fields (see codec.decode_event).
+
+        Raises:
+            ValueError: if the event isn't valid JSON or has a field of the wrong type
+        """
+        if self._decoded is None:
+            self._decoded = codec.decode_event(self.raw)
+        return self._decoded
+
+    def __getitem__(self, field):
+        if self._decoded is None:
+            value = self._fields.get(field)
+            if value is None:
+                value = self._read_field(field)
+            if value is not None:
+                return value
+        try:
+            event = self.decode()
+        except ValueError:
+            raise KeyError(field)
+        if not isinstance(event, dict):
+            raise KeyError(field)
+        return event[field]
+
+    def _read_field(self, field):
+        """
+        Picks the field out of the raw text, or returns None if that can't be done cheaply.
+        """
+        raw = self.raw
+        if field in _STRING_FIELDS:
+            # Relays almost always send compact JSON, where a plain find is enough.
+            needle = _COMPACT_KEYS[field]
+            start = raw.find(needle)
+            if start >= 0:
+                start += len(needle)
+                value = raw[start:raw.find('"', start)]
+                if "\\" in value:
+                    return None
+            else:
+                match = _STRING_FIELDS[field].search(raw)
+                if match is None:
+                    return None
+                value = match.group(1)
+        elif field in _INT_FIELDS:
+            needle = _COMPACT_KEYS[field]
+            start = raw.find(needle)
+            end = start + len(needle)
+            while end < len(raw) and raw[end] in "-0123456789":
+                end += 1
+            if start >= 0 and end < len(raw) and raw[end] in ",}":
+                value = int(raw[start + len(needle):end])
+            else:
+                match = _INT_FIELDS[field].search(raw)
+                if match is None:
+                    return None
+                value = int(match.group(1))
+        else:
+            return None
+        self._fields[field] = value
+        return value
+
+    def get(self, field, default=None):
+        try:
+            return self[field]
+        except KeyError:
+            return default
+
+    def is_decoded(self):
+        return self._decoded is not None
+
+    def __repr__(self):
+        return f"LazyEvent(id={self.get('id')})"
+
+
+def decoded_frame(frame):
+    """
+    Returns the frame with its LazyEvent (if any) replaced by the parsed event.
+
+    Raises:
+        ValueError: if the event isn't valid JSON
+    """
+    if len(frame) > 2 and isinstance(frame[2], LazyEvent):
+        return frame[:2] + [frame[2].decode()] + frame[3:]
+    return frame
+
+
+def parse_frame(message):
+    """
+    Parses a message from a relay. EVENT messages are split into their type and
+    subscription id, with the event left unparsed in a LazyEvent; any other
+    message is parsed in full.
+
+    Returns:
+        list: the parsed message
+
+    Raises:
+        ValueError: if the message isn't valid JSON
+    """
+    if isinstance(message, str):
+        if message.startswith(_COMPACT_EVENT_PREFIX):
+            end = message.find('",', len(_COMPACT_EVENT_PREFIX))
+            subscription_id = message[len(_COMPACT_EVENT_PREFIX):end]
+            start = end + 2
+            if end < 0 or "\\" in subscription_id or message[start:start + 1] != "{":
+                start = None
+        else:
+            match = _EVENT_FRAME.match(message)
+            start = match.end() if match is not None else None
+            subscription_id = match.group(1) if match is not None else None
+        if start is not None:
+            if message[-1] != "]":
+                message = message.rstrip()
+            if message.endswith("]"):
+                return [RelayMessageType.EVENT, subscription_id, LazyEvent(message[start:-1])]
+    return codec.loads(message)
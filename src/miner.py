@@ -0,0 +1,268 @@
+import argparse
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from hashlib import sha256
+
+import codec
+from constants import DEFAULT_MINING_CHUNK_SIZE
+from key_pair import KeyPair
+
+
+def difficulty(event_id):
+    """
+    Returns the NIP-13 difficulty of an event id: its number of leading zero bits.
+
+    Args:
+        event_id (str): hex id of the event
+    """
+    value = int(event_id, 16)
+    return len(event_id) * 4 - value.bit_length()
+
+
+def _target(target_difficulty):
+    """
+    Returns the 32 bytes that a sha256 digest must be smaller than to have the given difficulty.
+    """
+    if target_difficulty <= 0:
+        # Longer than any digest, so every digest compares smaller.
+        return b"\xff" * 33
+    return (1 << (256 - target_difficulty)).to_bytes(32, "big")
+
+
+def serialization_parts(event, created_at, target_difficulty):
+    """
+    Splits the NIP-01 serialization of the event, with a nonce tag added at the
+    end of its tags, into the parts before and after the nonce.
+
+    Returns:
+        tuple: the bytes before and the bytes after the nonce
+    """
+    tags = codec.canonical_dumps(event.tags).decode()
+    tags_start = "[" if not event.tags else tags[:-1] + ","
+    prefix = (
+        f'[0,{codec.canonical_dumps(event.author).decode()},{created_at},{event.get_kind()},'
+        f'{tags_start}["nonce","'
+    )
+    suffix = f'",{codec.canonical_dumps(str(target_difficulty)).decode()}]],{codec.canonical_dumps(event.content).decode()}]'
+    return prefix.encode(), suffix.encode()
+
+
+def _mine_nonces(prefix, suffix, target, start, count):
+    """
+    Tries the nonces from start to start + count. The hash state after the
+    fixed prefix is computed once and copied for every nonce.
+
+    Returns:
+        tuple: the first nonce that meets the target (or None), and the number of nonces tried
+    """
+    base = sha256(prefix)
+    for nonce in range(start, start + count):
+        hasher = base.copy()
+        hasher.update(b"%d" % nonce + suffix)
+        if hasher.digest() < target:
+            return (nonce, nonce - start + 1)
+    return (None, count)
+
+
+def _mine_keys(prefix, count):
+    """
+    Tries count random private keys.
+
+    Returns:
+        tuple: the hex private key whose public key starts with prefix (or None), and the number of keys tried
+    """
+    import secp256k1
+    for attempt in range(count):
+        secret = secrets.token_bytes(32)
+        try:
+            pubkey = secp256k1.PrivateKey(secret, raw=True).pubkey.serialize()[1:].hex()
+        except Exception:
+            # Not a valid private key, which is astronomically unlikely.
+            continue
+        if pubkey.startswith(prefix):
+            return (secret.hex(), attempt + 1)
+    return (None, count)
+
+
+class MiningResult:
+    """
+    What a mining run found and how much work it took. value is the nonce or
+    the private key that was found, or None if the run was cancelled.
+    """
+    def __init__(self, value, attempts, elapsed, created_at=None, event_id=None):
+        self.value = value
+        self.attempts = attempts
+        self.elapsed = elapsed
+        self.created_at = created_at
+        self.event_id = event_id
+
+    @property
+    def hashes_per_second(self):
+        return self.attempts / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        return f"{self.value} after {self.attempts} attempts ({self.hashes_per_second:.0f}/s)"
+
+
+class Miner:
+    """
+    Searches for NIP-13 proof-of-work nonces and for public keys with a chosen
+    prefix, spreading the search over a pool of worker processes. Work is
+    handed out in chunks, so progress can be reported and a search cancelled
+    after each chunk.
+    """
+    def __init__(self, processes=None, chunk_size=DEFAULT_MINING_CHUNK_SIZE, progress=None):
+        """
+        Args:
+            processes (int, optional): number of worker processes. Defaults to the number of cores.
+                Use 0 to mine in the calling process.
+            chunk_size (int, optional): number of attempts handed to a worker at a time
+            progress (callable, optional): called with the number of attempts so far and
+                the attempts per second after every chunk
+        """
+        self.processes = processes
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self._cancelled = threading.Event()
+        self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(self.processes)
+        return self._executor
+
+    def cancel(self):
+        """
+        Stops the running search once the chunks being worked on are done. Can be called from any thread.
+        """
+        self._cancelled.set()
+
+    def _search(self, make_chunk):
+        """
+        Runs chunks until one of them finds something or the search is cancelled.
+
+        Args:
+            make_chunk (callable): takes the index of a chunk and returns the function and arguments that run it
+
+        Returns:
+            MiningResult: with the value that was found
+        """
+        self._cancelled.clear()
+        start = time.perf_counter()
+        attempts = 0
+        found = None
+        next_chunk = 0
+        if self.processes == 0:
+            while found is None and not self._cancelled.is_set():
+                task, args = make_chunk(next_chunk)
+                next_chunk += 1
+                found, tried = task(*args)
+                attempts += tried
+                self._report(attempts, start)
+            return MiningResult(found, attempts, time.perf_counter() - start)
+
+        executor = self._get_executor()
+        in_flight = (self.processes or os.cpu_count() or 1) * 2
+        pending = set()
+        while found is None and not self._cancelled.is_set():
+            while len(pending) < in_flight:
+                task, args = make_chunk(next_chunk)
+                next_chunk += 1
+                pending.add(executor.submit(task, *args))
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                value, tried = future.result()
+                attempts += tried
+                if found is None and value is not None:
+                    found = value
+            self._report(attempts, start)
+        for future in pending:
+            future.cancel()
+        return MiningResult(found, attempts, time.perf_counter() - start)
+
+    def _report(self, attempts, start):
+        if self.progress is not None:
+            elapsed = time.perf_counter() - start
+            self.progress(attempts, attempts / elapsed if elapsed else 0.0)
+
+    def mine_event(self, event, target_difficulty, created_at=None):
+        """
+        Finds a nonce that gives the event an id with at least target_difficulty
+        leading zero bits, and adds it to the event's tags as a NIP-13 nonce tag.
+        Build the event with the returned created_at to get the mined id.
+
+        Args:
+            event (BaseEvent): the event to mine
+            target_difficulty (int): number of leading zero bits to reach
+            created_at (int, optional): the timestamp to mine the event with. Defaults to now.
+
+        Returns:
+            MiningResult: with the nonce, the created_at and the id of the event. The value is
+                None, and the event is left as it was, if the search was cancelled.
+        """
+        if created_at is None:
+            created_at = int(time.time())
+        prefix, suffix = serialization_parts(event, created_at, target_difficulty)
+        target = _target(target_difficulty)
+        result = self._search(
+            lambda chunk: (_mine_nonces, (prefix, suffix, target, chunk * self.chunk_size, self.chunk_size))
+        )
+        result.created_at = created_at
+        if result.value is not None:
+            event.tag_nonce(result.value, target_difficulty)
+            result.event_id = sha256(prefix + b"%d" % result.value + suffix).hexdigest()
+        return result
+
+    def mine_vanity_key(self, prefix):
+        """
+        Finds a key pair whose hex public key starts with prefix. Every extra
+        character makes the search take 16 times longer on average.
+
+        Returns:
+            tuple: the KeyPair (None if the search was cancelled) and the MiningResult
+
+        Raises:
+            ValueError: if the prefix isn't hex
+        """
+        prefix = prefix.lower()
+        if any(character not in "0123456789abcdef" for character in prefix):
+            raise ValueError(f"{prefix} is not a hex prefix")
+        result = self._search(lambda chunk: (_mine_keys, (prefix, self.chunk_size)))
+        if result.value is None:
+            return (None, result)
+        return (KeyPair.from_secret_bytes(bytes.fromhex(result.value)), result)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _print_progress(attempts, rate):
+    print(f"\r{attempts} attempts, {rate:.0f}/s", end="", flush=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mine a public key with a chosen hex prefix.")
+    parser.add_argument("prefix", help="hex characters the public key should start with")
+    parser.add_argument("--processes", type=int, help="number of worker processes (default: one per core)")
+    args = parser.parse_args()
+    with Miner(args.processes, progress=_print_progress) as miner:
+        try:
+            keys, result = miner.mine_vanity_key(args.prefix)
+        except KeyboardInterrupt:
+            miner.cancel()
+            keys = None
+    print()
+    if keys is not None:
+        print("Public key: ", keys.pubkey_hex_string())
+        print("Private key:", keys.privkey_hex_string())
@@ -0,0 +1,217 @@
+import argparse
+import asyncio
+import random
+
+import websockets
+
+import codec
+from constants import ClientMessageType, RelayMessageType
+from filters import CompiledFilter, CompiledFilters
+from negentropy import Negentropy, NegentropyError
+from verifier import verify_event
+
+
+class MockRelay:
+    """
+    An in-memory NIP-01 relay for testing the client without the network.
+    It stores the events it is sent, answers REQs with the stored events that
+    match followed by EOSE, forwards newly published events to the open
+    subscriptions they match, and can be made slow or lossy on purpose. It
+    also takes part in NIP-77 negentropy reconciliations, unless created with
+    negentropy=False to act like a relay without NIP-77.
+    """
+    def __init__(self, latency=0, drop_rate=0, read_delay=0, verify=False, max_subscriptions=None,
+                 negentropy=True):
+        """
+        Args:
+            latency (float, optional): seconds to wait before answering each message
+            drop_rate (float, optional): fraction of incoming messages to silently ignore
+            read_delay (float, optional): seconds to wait before reading each message,
+                to act like a relay that can't keep up with its clients
+            verify (bool, optional): reject events whose id or signature is invalid
+            max_subscriptions (int, optional): number of subscriptions a connection may have
+                open. Further REQs are refused with a CLOSED message. Defaults to no limit.
+            negentropy (bool, optional): answer NIP-77 NEG-OPEN and NEG-MSG messages
+        """
+        self.latency = latency
+        self.drop_rate = drop_rate
+        self.read_delay = read_delay
+        self.verify = verify
+        self.max_subscriptions = max_subscriptions
+        self.negentropy = negentropy
+        self.events = {}
+        self.received_count = 0
+        self.dropped_count = 0
+        # Number of events sent to clients, whether stored or newly published.
+        self.sent_count = 0
+        self._subscriptions = {}
+        self._reconciliations = {}
+        self._delayed = set()
+        self._server = None
+        self.url = None
+
+    async def start(self, host="127.0.0.1", port=0):
+        """
+        Starts listening and returns the url of the relay.
+        """
+        self._server = await websockets.serve(self._handle_connection, host, port)
+        port = self._server.sockets[0].getsockname()[1]
+        self.url = f"ws://{host}:{port}"
+        return self.url
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    def subscription_count(self):
+        """
+        Returns the number of subscriptions open over all connections.
+        """
+        return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+    def query(self, filters):
+        """
+        Returns the stored events matching any of the filters, newest first,
+        with each filter's limit applied.
+        """
+        matched = {}
+        for subscription_filter in filters:
+            compiled = CompiledFilter(subscription_filter)
+            events = [event for event in self.events.values() if compiled.matches(event)]
+            events.sort(key=lambda event: event["created_at"], reverse=True)
+            if "limit" in subscription_filter:
+                events = events[:int(subscription_filter["limit"])]
+            for event in events:
+                matched[event["id"]] = event
+        return sorted(matched.values(), key=lambda event: event["created_at"], reverse=True)
+
+    async def _handle_connection(self, websocket):
+        self._subscriptions[websocket] = {}
+        try:
+            while True:
+                if self.read_delay:
+                    await asyncio.sleep(self.read_delay)
+                try:
+                    message = await websocket.recv()
+                except websockets.ConnectionClosed:
+                    break
+                self.received_count += 1
+                if self.drop_rate and random.random() < self.drop_rate:
+                    self.dropped_count += 1
+                    continue
+                if self.latency:
+                    # Delay the answer without holding up the messages that come after it.
+                    task = asyncio.ensure_future(self._handle_later(websocket, message))
+                    self._delayed.add(task)
+                    task.add_done_callback(self._delayed.discard)
+                else:
+                    await self._handle_message(websocket, message)
+        finally:
+            self._subscriptions.pop(websocket, None)
+            self._reconciliations.pop(websocket, None)
+
+    async def _handle_later(self, websocket, message):
+        await asyncio.sleep(self.latency)
+        try:
+            await self._handle_message(websocket, message)
+        except websockets.ConnectionClosed:
+            pass
+
+    async def _handle_message(self, websocket, message):
+        try:
+            frame = codec.loads(message)
+            message_type = frame[0]
+        except (ValueError, IndexError, KeyError):
+            await websocket.send(codec.dumps([RelayMessageType.NOTICE, "invalid: could not parse message"]))
+            return
+        if message_type == ClientMessageType.EVENT and len(frame) > 1 and isinstance(frame[1], dict):
+            await self._handle_event(websocket, frame[1])
+        elif message_type == ClientMessageType.REQUEST and len(frame) > 1:
+            subscription_id, filters = frame[1], frame[2:]
+            subscriptions = self._subscriptions.get(websocket, {})
+            if (self.max_subscriptions is not None and subscription_id not in subscriptions
+                    and len(subscriptions) >= self.max_subscriptions):
+                await websocket.send(codec.dumps(
+                    [RelayMessageType.CLOSED, subscription_id, "rate-limited: too many open subscriptions"]))
+                return
+            subscriptions[subscription_id] = CompiledFilters(filters)
+            for event in self.query(filters):
+                self.sent_count += 1
+                await websocket.send(codec.dumps([RelayMessageType.EVENT, subscription_id, event]))
+            await websocket.send(codec.dumps([RelayMessageType.EOSE, subscription_id]))
+        elif message_type == ClientMessageType.CLOSE and len(frame) > 1:
+            self._subscriptions.get(websocket, {}).pop(frame[1], None)
+        elif (self.negentropy and message_type == ClientMessageType.NEG_OPEN and len(frame) > 3
+              and isinstance(frame[2], dict)):
+            subscription_filter = {key: value for key, value in frame[2].items() if key != "limit"}
+            items = [(event["created_at"], event["id"]) for event in self.query([subscription_filter])]
+            self._reconciliations.setdefault(websocket, {})[frame[1]] = Negentropy(items, initiator=False)
+            await self._reconcile(websocket, frame[1], frame[3])
+        elif self.negentropy and message_type == ClientMessageType.NEG_MSG and len(frame) > 2:
+            await self._reconcile(websocket, frame[1], frame[2])
+        elif self.negentropy and message_type == ClientMessageType.NEG_CLOSE and len(frame) > 1:
+            self._reconciliations.get(websocket, {}).pop(frame[1], None)
+        else:
+            await websocket.send(codec.dumps([RelayMessageType.NOTICE, f"invalid: could not handle {message_type} message"]))
+
+    async def _reconcile(self, websocket, subscription_id, message):
+        negentropy = self._reconciliations.get(websocket, {}).get(subscription_id)
+        if negentropy is None:
+            await websocket.send(codec.dumps(
+                [RelayMessageType.NEG_ERR, subscription_id, "closed: no reconciliation open with this id"]))
+            return
+        try:
+            reply = negentropy.reconcile(bytes.fromhex(message))
+        except (NegentropyError, ValueError, TypeError) as error:
+            self._reconciliations[websocket].pop(subscription_id, None)
+            await websocket.send(codec.dumps([RelayMessageType.NEG_ERR, subscription_id, f"error: {error}"]))
+            return
+        await websocket.send(codec.dumps([RelayMessageType.NEG_MSG, subscription_id, reply.hex()]))
+
+    async def _handle_event(self, websocket, event):
+        event_id = event.get("id", "")
+        if self.verify and not verify_event(event):
+            await websocket.send(codec.dumps([RelayMessageType.OK, event_id, False, "invalid: bad id or signature"]))
+            return
+        if event_id in self.events:
+            await websocket.send(codec.dumps([RelayMessageType.OK, event_id, True, "duplicate: already have this event"]))
+            return
+        self.events[event_id] = event
+        await websocket.send(codec.dumps([RelayMessageType.OK, event_id, True, ""]))
+        await self._broadcast(event)
+
+    async def _broadcast(self, event):
+        for subscriber, subscriptions in list(self._subscriptions.items()):
+            for subscription_id, filters in list(subscriptions.items()):
+                if filters.matches(event):
+                    self.sent_count += 1
+                    try:
+                        await subscriber.send(codec.dumps([RelayMessageType.EVENT, subscription_id, event]))
+                    except websockets.ConnectionClosed:
+                        pass
+
+
+async def _serve_forever(relay, host, port):
+    print("Mock relay listening on", await relay.start(host, port))
+    await asyncio.Future()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run an in-memory Nostr relay for testing.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7777)
+    parser.add_argument("--latency", type=float, default=0, help="seconds to wait before answering each message")
+    parser.add_argument("--drop-rate", type=float, default=0, help="fraction of messages to ignore")
+    parser.add_argument("--read-delay", type=float, default=0, help="seconds to wait before reading each message")
+    parser.add_argument("--verify", action="store_true", help="reject events with an invalid id or signature")
+    parser.add_argument("--max-subscriptions", type=int, help="number of subscriptions a connection may have open")
+    parser.add_argument("--no-negentropy", action="store_true", help="don't answer NIP-77 reconciliation messages")
+    args = parser.parse_args()
+    relay = MockRelay(args.latency, args.drop_rate, args.read_delay, args.verify, args.max_subscriptions,
+                      not args.no_negentropy)
+    try:
+        asyncio.run(_serve_forever(relay, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,245 @@
+"""
+Range-based set reconciliation as used by NIP-77 (negentropy protocol
+version 1). Two sides holding sets of events, each event being a
+(created_at, id) pair, find out which events only one of them has by
+exchanging fingerprints of ranges of their sets and splitting the ranges that
+differ, so the data exchanged grows with the difference rather than the size
+of the sets.
+"""
+import bisect
+from hashlib import sha256
+
+PROTOCOL_VERSION = 0x61
+ID_SIZE = 32
+FINGERPRINT_SIZE = 16
+# Number of sub-ranges a range whose fingerprints differ is split into.
+BUCKETS = 16
+# Stands for a timestamp later than that of any event.
+INFINITY = 2 ** 64 - 1
+
+_MASK = 2 ** 256 - 1
+
+
+class Mode:
+    SKIP = 0
+    FINGERPRINT = 1
+    ID_LIST = 2
+
+
+class NegentropyError(ValueError):
+    """
+    Raised for messages that aren't valid negentropy messages.
+    """
+
+
+def encode_varint(value):
+    """
+    Encodes a non-negative integer in base 128, most significant digit first,
+    with the high bit set on every byte but the last.
+    """
+    digits = [value & 0x7F]
+    value >>= 7
+    while value:
+        digits.append(0x80 | (value & 0x7F))
+        value >>= 7
+    return bytes(reversed(digits))
+
+
+class _Reader:
+    def __init__(self, data):
+        self.data = data
+        self.position = 0
+        self._last_timestamp = 0
+
+    def at_end(self):
+        return self.position >= len(self.data)
+
+    def read(self, length):
+        if self.position + length > len(self.data):
+            raise NegentropyError("message ended unexpectedly")
+        value = self.data[self.position:self.position + length]
+        self.position += length
+        return value
+
+    def varint(self):
+        value = 0
+        while True:
+            byte = self.read(1)[0]
+            value = (value << 7) | (byte & 0x7F)
+            if not byte & 0x80:
+                return value
+
+    def bound(self):
+        encoded = self.varint()
+        timestamp = INFINITY if encoded == 0 else encoded - 1
+        # Timestamps are sent as the difference from the previous one in the message.
+        if self._last_timestamp == INFINITY or timestamp == INFINITY:
+            timestamp = INFINITY
+        else:
+            timestamp += self._last_timestamp
+        self._last_timestamp = timestamp
+        length = self.varint()
+        if length > ID_SIZE:
+            raise NegentropyError("bound prefix is longer than an id")
+        return (timestamp, self.read(length))
+
+
+class _Writer:
+    def __init__(self):
+        self.out = bytearray([PROTOCOL_VERSION])
+        self._last_timestamp = 0
+
+    def varint(self, value):
+        self.out += encode_varint(value)
+
+    def bound(self, bound):
+        timestamp, prefix = bound
+        if timestamp == INFINITY:
+            self.varint(0)
+        else:
+            self.varint(timestamp - self._last_timestamp + 1)
+        self._last_timestamp = timestamp
+        self.varint(len(prefix))
+        self.out += prefix
+
+
+class Negentropy:
+    """
+    One side of a reconciliation. The initiator (the client) starts with
+    initiate() and passes every reply to reconcile() until it returns None;
+    the ids found along the way are collected in have_ids (only held here)
+    and need_ids (only held by the other side). The other side (the relay)
+    answers each message with reconcile().
+    """
+    def __init__(self, items, initiator=True):
+        """
+        Args:
+            items (iterable): (created_at, hex id) pairs of the events held on this side
+            initiator (bool, optional): whether this side starts the reconciliation
+        """
+        self.initiator = initiator
+        self._items = sorted((created_at, bytes.fromhex(event_id)) for created_at, event_id in items)
+        # Running sums of the ids, so that the fingerprint of any range takes a subtraction.
+        self._sums = [0]
+        total = 0
+        for _, event_id in self._items:
+            total = (total + int.from_bytes(event_id, "little")) & _MASK
+            self._sums.append(total)
+        self.have_ids = set()
+        self.need_ids = set()
+
+    def __len__(self):
+        return len(self._items)
+
+    def fingerprint(self, lower, upper):
+        """
+        Returns the fingerprint of the items from index lower up to upper: the first
+        16 bytes of the sha256 of the sum of their ids (mod 2**256) and their count.
+        """
+        total = (self._sums[upper] - self._sums[lower]) & _MASK
+        return sha256(total.to_bytes(ID_SIZE, "little") + encode_varint(upper - lower)).digest()[:FINGERPRINT_SIZE]
+
+    def _find(self, lower, upper, bound):
+        # Bounds compare like items whose id is the prefix padded with zeros.
+        timestamp, prefix = bound
+        return bisect.bisect_left(self._items, (timestamp, prefix.ljust(ID_SIZE, b"\0")), lower, upper)
+
+    def _minimal_bound(self, previous, current):
+        """
+        Returns the shortest bound that separates the items at the two indexes.
+        """
+        previous_timestamp, previous_id = self._items[previous]
+        timestamp, event_id = self._items[current]
+        if timestamp != previous_timestamp:
+            return (timestamp, b"")
+        shared = 0
+        while shared < ID_SIZE and event_id[shared] == previous_id[shared]:
+            shared += 1
+        return (timestamp, event_id[:shared + 1])
+
+    def _split_range(self, lower, upper, upper_bound, writer):
+        count = upper - lower
+        if count < BUCKETS * 2:
+            writer.bound(upper_bound)
+            writer.varint(Mode.ID_LIST)
+            writer.varint(count)
+            for _, event_id in self._items[lower:upper]:
+                writer.out += event_id
+            return
+        per_bucket, extra = divmod(count, BUCKETS)
+        current = lower
+        for bucket in range(BUCKETS):
+            size = per_bucket + (1 if bucket < extra else 0)
+            fingerprint = self.fingerprint(current, current + size)
+            current += size
+            bound = upper_bound if current == upper else self._minimal_bound(current - 1, current)
+            writer.bound(bound)
+            writer.varint(Mode.FINGERPRINT)
+            writer.out += fingerprint
+
+    def initiate(self):
+        """
+        Returns the first message, covering every item.
+        """
+        writer = _Writer()
+        self._split_range(0, len(self._items), (INFINITY, b""), writer)
+        return bytes(writer.out)
+
+    def reconcile(self, message):
+        """
+        Processes a message from the other side and returns the reply. For the
+        initiator, None means the reconciliation is complete.
+
+        Raises:
+            NegentropyError: if the message is malformed or of another protocol version
+        """
+        reader = _Reader(message)
+        if reader.at_end() or reader.read(1)[0] != PROTOCOL_VERSION:
+            raise NegentropyError("unsupported protocol version")
+        writer = _Writer()
+        previous_index = 0
+        previous_bound = (0, b"")
+        skip = False
+        while not reader.at_end():
+            bound = reader.bound()
+            mode = reader.varint()
+            lower = previous_index
+            upper = self._find(previous_index, len(self._items), bound)
+            if mode == Mode.SKIP:
+                skip = True
+            elif mode == Mode.FINGERPRINT:
+                if reader.read(FINGERPRINT_SIZE) == self.fingerprint(lower, upper):
+                    skip = True
+                else:
+                    if skip:
+                        writer.bound(previous_bound)
+                        writer.varint(Mode.SKIP)
+                        skip = False
+                    self._split_range(lower, upper, bound, writer)
+            elif mode == Mode.ID_LIST:
+                their_ids = {reader.read(ID_SIZE) for _ in range(reader.varint())}
+                if self.initiator:
+                    skip = True
+                    for _, event_id in self._items[lower:upper]:
+                        if event_id in their_ids:
+                            their_ids.discard(event_id)
+                        else:
+                            self.have_ids.add(event_id.hex())
+                    self.need_ids.update(event_id.hex() for event_id in their_ids)
+                else:
+                    if skip:
+                        writer.bound(previous_bound)
+                        writer.varint(Mode.SKIP)
+                        skip = False
+                    writer.bound(bound)
+                    writer.varint(Mode.ID_LIST)
+                    writer.varint(upper - lower)
+                    for _, event_id in self._items[lower:upper]:
+                        writer.out += event_id
+            else:
+                raise NegentropyError(f"unknown mode {mode}")
+            previous_index = upper
+            previous_bound = bound
+        if self.initiator and len(writer.out) == 1:
+            return None
+        return bytes(writer.out)
@@ -0,0 +1,99 @@
+from enum import Enum
+
+
+class PublishStatus(Enum):
+    ACCEPTED = "accepted"
+    REJECTED = "rejected"
+    TIMED_OUT = "timed out"
+    # The publish returned because the quorum was reached before this relay answered.
+    PENDING = "pending"
+
+
+class PublishResult:
+    """
+    The outcome of publishing one event to one relay, as reported by the
+    relay's ["OK", <event id>, <accepted>, <message>] reply.
+    """
+    def __init__(self, relay_url, status, message="", latency=None):
+        """
+        Args:
+            relay_url (str): the relay the event was sent to
+            status (PublishStatus): whether the relay accepted the event
+            message (str, optional): the reason given by the relay. Defaults to "".
+            latency (float, optional): seconds between sending the event and the OK reply
+        """
+        self.relay_url = relay_url
+        self.status = status
+        self.message = message
+        self.latency = latency
+
+    @staticmethod
+    def from_ok_frame(relay_url, frame, latency):
+        """
+        Builds the result from a relay's ["OK", <event id>, <accepted>, <message>] frame.
+        """
+        status = PublishStatus.ACCEPTED if frame[2] else PublishStatus.REJECTED
+        message = frame[3] if len(frame) > 3 else ""
+        return PublishResult(relay_url, status, message, latency)
+
+    @property
+    def accepted(self):
+        return self.status == PublishStatus.ACCEPTED
+
+    def to_dict(self):
+        return {"relay": self.relay_url, "status": self.status.value, "message": self.message, "latency": self.latency}
+
+    def __repr__(self):
+        return f"PublishResult({self.relay_url!r}, {self.status}, {self.message!r}, {self.latency!r})"
+
+    def __str__(self):
+        description = f"{self.relay_url}: {self.status.value}"
+        if self.latency is not None:
+            description += f" in {self.latency * 1000:.0f} ms"
+        if self.message:
+            description += f" ({self.message})"
+        return description
+
+
+class BatchPublishReport:
+    """
+    The outcome of publishing a batch of events to every relay.
+    """
+    def __init__(self, results, elapsed):
+        """
+        Args:
+            results (dict): maps each event id to a dict of relay url -> PublishResult
+            elapsed (float): seconds taken to publish the whole batch
+        """
+        self.results = results
+        self.elapsed = elapsed
+
+    def accepted_events(self):
+        """
+        Returns the ids of the events that at least one relay accepted.
+        """
+        return [event_id for event_id, by_relay in self.results.items()
+                if any(result.accepted for result in by_relay.values())]
+
+    def rejected_events(self):
+        """
+        Returns the ids of the events that no relay accepted.
+        """
+        accepted = set(self.accepted_events())
+        return [event_id for event_id in self.results if event_id not in accepted]
+
+    def acknowledged_count(self):
+        """
+        Returns the number of (event, relay) pairs for which the relay sent back an OK.
+        """
+        return sum(1 for by_relay in self.results.values() for result in by_relay.values()
+                   if result.status in (PublishStatus.ACCEPTED, PublishStatus.REJECTED))
+
+    @property
+    def events_per_second(self):
+        return len(self.results) / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        return (f"Published {len(self.results)} events in {self.elapsed:.2f} s "
+                f"({self.events_per_second:.0f} events/s): {len(self.accepted_events())} accepted, "
+                f"{len(self.rejected_events())} not accepted by any relay.")
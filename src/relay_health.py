@@ -0,0 +1,136 @@
+import time
+
+from constants import (
+    PROBATION_BASE_DELAY,
+    PROBATION_FAILURE_THRESHOLD,
+    PROBATION_MAX_DELAY,
+    UNKNOWN_RELAY_LATENCY,
+)
+
+# Upper bounds (in seconds) of the latency histogram buckets. The last bucket has no upper bound.
+LATENCY_BUCKETS = [0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5]
+
+
+class RelayHealth:
+    """
+    Keeps track of how well one relay has been answering: a histogram of its
+    OK latencies, how many requests failed or timed out, and how many events
+    it accepted. Relays that keep failing are put on probation for a time that
+    doubles with every further round of failures.
+    """
+    def __init__(self):
+        self.latency_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.successes = 0
+        self.failures = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.consecutive_failures = 0
+        self.probation_count = 0
+        self.probation_until = 0
+
+    def record_latency(self, latency):
+        for index, bound in enumerate(LATENCY_BUCKETS):
+            if latency <= bound:
+                break
+        else:
+            index = len(LATENCY_BUCKETS)
+        self.latency_counts[index] += 1
+
+    def record_success(self, latency=None, accepted=True):
+        """
+        Records an answer from the relay.
+
+        Args:
+            latency (float, optional): seconds the relay took to answer
+            accepted (bool, optional): whether the relay accepted the event. None for
+                answers that weren't about an event, like an EOSE.
+        """
+        self.successes += 1
+        self.consecutive_failures = 0
+        self.probation_count = 0
+        self.probation_until = 0
+        if latency is not None:
+            self.record_latency(latency)
+        if accepted is None:
+            return
+        if accepted:
+            self.accepted += 1
+        else:
+            self.rejected += 1
+
+    def record_failure(self, now=None):
+        """
+        Records a timeout or connection failure, and starts a probation period
+        once too many of them happened in a row.
+        """
+        self.failures += 1
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= PROBATION_FAILURE_THRESHOLD:
+            now = time.time() if now is None else now
+            delay = min(PROBATION_BASE_DELAY * 2 ** self.probation_count, PROBATION_MAX_DELAY)
+            self.probation_until = now + delay
+            self.probation_count += 1
+            self.consecutive_failures = 0
+
+    def on_probation(self, now=None):
+        now = time.time() if now is None else now
+        return now < self.probation_until
+
+    @property
+    def error_rate(self):
+        total = self.successes + self.failures
+        return self.failures / total if total else 0.0
+
+    @property
+    def acceptance_ratio(self):
+        total = self.accepted + self.rejected
+        return self.accepted / total if total else 1.0
+
+    def latency_percentile(self, percentile):
+        """
+        Estimates the latency below which the given fraction of answers came in,
+        as the upper bound of the histogram bucket holding that percentile.
+        Returns None if no latency was recorded.
+        """
+        total = sum(self.latency_counts)
+        if not total:
+            return None
+        cumulative = 0
+        for index, count in enumerate(self.latency_counts):
+            cumulative += count
+            if cumulative >= percentile * total:
+                break
+        return LATENCY_BUCKETS[index] if index < len(LATENCY_BUCKETS) else LATENCY_BUCKETS[-1] * 2
+
+    def score(self):
+        """
+        Returns a cost for using this relay, lower being better. Combines the tail
+        latency with the error rate and the share of events the relay rejects.
+        """
+        latency = self.latency_percentile(0.9)
+        if latency is None:
+            latency = UNKNOWN_RELAY_LATENCY
+        return latency * (1 + 4 * self.error_rate) / max(self.acceptance_ratio, 0.1)
+
+    def to_dict(self):
+        return {
+            "latency_counts": self.latency_counts,
+            "successes": self.successes,
+            "failures": self.failures,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "consecutive_failures": self.consecutive_failures,
+            "probation_count": self.probation_count,
+            "probation_until": self.probation_until,
+        }
+
+    @staticmethod
+    def from_dict(values):
+        health = RelayHealth()
+        for key, value in values.items():
+            if hasattr(health, key):
+                setattr(health, key, value)
+        if len(health.latency_counts) != len(LATENCY_BUCKETS) + 1:
+            # Saved with different buckets.
+            health.latency_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        return health
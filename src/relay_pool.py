@@ -0,0 +1,505 @@
+import asyncio
+import random
+from threading import Thread
+
+import instrumentation
+from constants import (
+    DEFAULT_EVENT_QUEUE_SIZE,
+    DEFAULT_MAX_SUBSCRIPTIONS_PER_RELAY,
+    DEFAULT_PUBLISH_TIMEOUT,
+    DEFAULT_PUBLISH_WINDOW,
+    RECONNECT_BASE_DELAY,
+    RECONNECT_MAX_DELAY,
+    RelayMessageType,
+)
+from event_queue import OverflowPolicy
+from lazy_event import decoded_frame, parse_frame
+from publish_result import BatchPublishReport, PublishResult, PublishStatus
+from subscription_manager import SubscriptionManager
+
+
+def _recorded(result):
+    """
+    Reports the publish result to the metrics recorder and returns it.
+    """
+    recorder = instrumentation.recorder
+    if recorder.enabled:
+        recorder.increment("nostr_publish_results_total", relay=result.relay_url, status=result.status.value)
+        if result.latency is not None:
+            recorder.observe("nostr_ok_latency_seconds", result.latency, relay=result.relay_url)
+    return result
+
+
+class RelayConnection:
+    """
+    Keeps a single long-lived websocket open to one relay. The connection is
+    re-established with exponential backoff whenever it drops, and every frame
+    received from the relay is handed to the registered listeners. Callables in
+    connect_callbacks run each time the connection is (re-)established. The
+    event in an EVENT frame is a LazyEvent, which is only parsed when read.
+
+    Whether the relay answers requests, and failed connections, are passed to
+    the outcome_callbacks as callback(relay_url, success), so that the relay's
+    health can be scored. Merely connecting doesn't count as an answer.
+
+    A listener that can't keep up may return an awaitable, which is awaited
+    before the next frame is read. The relay then has to wait as well, since
+    unread frames stay in the socket's buffers.
+    """
+    def __init__(self, relay_url, base_delay=RECONNECT_BASE_DELAY, max_delay=RECONNECT_MAX_DELAY):
+        self.relay_url = relay_url
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.listeners = []
+        self.connect_callbacks = []
+        self.outcome_callbacks = []
+        self.failures = 0
+        self._ws = None
+        self._connected = asyncio.Event()
+        self._closing = False
+        self._task = None
+
+    def is_connected(self):
+        return self._connected.is_set()
+
+    def start(self):
+        """
+        Starts the background task that connects (and reconnects) to the relay.
+        Must be called from within the event loop that owns the connection.
+        """
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        # Imported here rather than at the top since it is slow to import, and
+        # processes that never open a connection shouldn't have to pay for it.
+        import websockets
+        loop = asyncio.get_running_loop()
+        delay = self.base_delay
+        while not self._closing:
+            try:
+                started = loop.time()
+                async with websockets.connect(self.relay_url) as ws:
+                    connect_time = loop.time() - started
+                    instrumentation.recorder.observe("nostr_connect_seconds", connect_time, relay=self.relay_url)
+                    self._ws = ws
+                    self._connected.set()
+                    delay = self.base_delay
+                    for callback in list(self.connect_callbacks):
+                        callback()
+                    async for message in ws:
+                        for waiter in self._dispatch(message):
+                            await waiter
+            except asyncio.CancelledError:
+                raise
+            except Exception as error:
+                self.failures += 1
+                if not self._closing:
+                    self.report(False)
+                instrumentation.recorder.increment("nostr_connection_failures_total", relay=self.relay_url)
+                instrumentation.logger.debug(
+                    "Relay connection failed", extra={"relay": self.relay_url, "error": repr(error)}
+                )
+            finally:
+                self._connected.clear()
+                self._ws = None
+            if self._closing:
+                break
+            # Add some jitter so that relays that dropped together don't reconnect in lockstep.
+            await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+            delay = min(delay * 2, self.max_delay)
+
+    def report(self, success):
+        """
+        Passes an outcome of talking to the relay on to the outcome_callbacks.
+        """
+        for callback in list(self.outcome_callbacks):
+            callback(self.relay_url, success)
+
+    def _dispatch(self, message):
+        """
+        Hands the message to the listeners and returns the awaitables some of them returned.
+        """
+        try:
+            frame = parse_frame(message)
+        except ValueError:
+            return []
+        if not isinstance(frame, list) or not frame:
+            return []
+        waiters = []
+        for listener in list(self.listeners):
+            waiter = listener(frame)
+            if waiter is not None:
+                waiters.append(waiter)
+        return waiters
+
+    def expect(self, predicate):
+        """
+        Returns a future that resolves to the first incoming frame for which
+        predicate(frame) is true. Register it before sending the payload that
+        triggers the response so that a fast reply cannot be missed.
+        """
+        future = asyncio.get_running_loop().create_future()
+
+        def listener(frame):
+            if not future.done() and predicate(frame):
+                try:
+                    future.set_result(decoded_frame(frame))
+                except ValueError as error:
+                    future.set_exception(error)
+
+        self.listeners.append(listener)
+        future.add_done_callback(lambda _: self.listeners.remove(listener))
+        return future
+
+    async def wait_connected(self):
+        await self._connected.wait()
+
+    async def send(self, payload, timeout=None):
+        """
+        Sends the payload once the connection is up, waiting at most timeout seconds for it.
+
+        Raises:
+            asyncio.TimeoutError: if the connection isn't up in time
+            ConnectionError: if the connection is lost
+        """
+        if not self._connected.is_set():
+            await asyncio.wait_for(self._connected.wait(), timeout)
+        ws = self._ws
+        if ws is None:
+            raise ConnectionError(f"Lost connection to {self.relay_url}.")
+        import websockets
+        recorder = instrumentation.recorder
+        try:
+            with recorder.time("nostr_send_seconds", relay=self.relay_url):
+                await ws.send(payload)
+        except websockets.ConnectionClosed as error:
+            raise ConnectionError(f"Lost connection to {self.relay_url}.") from error
+        recorder.increment("nostr_messages_sent_total", relay=self.relay_url)
+
+    async def close(self):
+        self._closing = True
+        if self._ws is not None:
+            await self._ws.close()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+class RelayPool:
+    """
+    Holds one persistent connection per relay url and runs them on an asyncio
+    event loop in a background thread, so that synchronous callers can publish
+    without paying a new handshake for every payload.
+    """
+    def __init__(self, relay_urls, publish_timeout=DEFAULT_PUBLISH_TIMEOUT, publish_quorum=None,
+                 max_subscriptions_per_relay=DEFAULT_MAX_SUBSCRIPTIONS_PER_RELAY, on_relay_outcome=None):
+        """
+        Args:
+            relay_urls (list[str]): the relays to keep connections to
+            publish_timeout (float, optional): default seconds to wait for relays to answer a publish
+            publish_quorum (int, optional): default number of accepting relays after which
+                publish_event returns. Defaults to None, i.e. wait for every relay.
+            max_subscriptions_per_relay (int, optional): number of subscriptions to keep open
+                on each relay at a time. Further subscriptions wait for a free slot.
+            on_relay_outcome (callable, optional): called from the pool's event loop as
+                on_relay_outcome(relay_url, success) when a relay fails to connect or
+                answers a subscription (see RelayConnection)
+        """
+        self.relay_urls = list(dict.fromkeys(relay_urls))
+        self.publish_timeout = publish_timeout
+        self.publish_quorum = publish_quorum
+        self.max_subscriptions_per_relay = max_subscriptions_per_relay
+        self.on_relay_outcome = on_relay_outcome
+        self.connections = {}
+        self.subscriptions = SubscriptionManager(max_subscriptions_per_relay)
+        self._loop = None
+        self._thread = None
+
+    def start(self):
+        """
+        Starts the background event loop and opens a connection to every relay.
+        """
+        if self._loop is not None:
+            return
+        self._loop = asyncio.new_event_loop()
+        self._thread = Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+        self.run(self._open_connections(self.relay_urls))
+
+    async def open(self):
+        """
+        Opens a connection to every relay on the running event loop instead of a
+        background thread, for callers that are async themselves. A pool opened
+        this way is closed with aclose(), and run() and iterate() can't be used.
+        """
+        await self._open_connections(self.relay_urls)
+
+    async def aclose(self):
+        await self._close_connections()
+
+    def run(self, coroutine, timeout=None):
+        """
+        Runs the coroutine on the pool's event loop and blocks until it returns.
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result(timeout)
+
+    def add_relays(self, relay_urls):
+        """
+        Opens connections to any of the given relays that are not in the pool yet.
+        """
+        new_urls = [url for url in dict.fromkeys(relay_urls) if url not in self.relay_urls]
+        self.relay_urls += new_urls
+        if self._loop is not None:
+            self.run(self._open_connections(new_urls))
+
+    def remove_relays(self, relay_urls):
+        """
+        Closes the connections to the given relays and drops them from the pool.
+        Subscriptions stop waiting for their EOSE.
+        """
+        removed = [url for url in dict.fromkeys(relay_urls) if url in self.relay_urls]
+        self.relay_urls = [url for url in self.relay_urls if url not in removed]
+        if self._loop is not None:
+            self.run(self._close_relays(removed))
+
+    async def _close_relays(self, relay_urls):
+        connections = []
+        for relay_url in relay_urls:
+            self.subscriptions.remove_connection(relay_url)
+            connection = self.connections.pop(relay_url, None)
+            if connection is not None:
+                connections.append(connection)
+        await asyncio.gather(*[connection.close() for connection in connections])
+
+    async def _open_connections(self, relay_urls):
+        for relay_url in relay_urls:
+            connection = RelayConnection(relay_url)
+            if self.on_relay_outcome is not None:
+                connection.outcome_callbacks.append(self.on_relay_outcome)
+            self.connections[relay_url] = connection
+            self.subscriptions.add_connection(connection)
+            connection.start()
+
+    async def publish(self, payload, timeout=None):
+        """
+        Sends the payload to every relay and waits for each relay's next frame.
+        Returns as soon as every relay has answered, or when the timeout passes.
+
+        Returns:
+            dict: maps each relay url to its response frame, or None if it didn't answer
+        """
+        if timeout is None:
+            timeout = self.publish_timeout
+        relay_urls = list(self.connections)
+        responses = await asyncio.gather(*[
+            self._publish_to_relay(self.connections[url], payload, timeout) for url in relay_urls
+        ])
+        return dict(zip(relay_urls, responses))
+
+    async def _publish_to_relay(self, connection, payload, timeout):
+        response = connection.expect(lambda frame: True)
+        try:
+            return await asyncio.wait_for(self._send_and_wait(connection, payload, response), timeout)
+        except (asyncio.TimeoutError, ConnectionError, ValueError):
+            return None
+        finally:
+            response.cancel()
+
+    @staticmethod
+    async def _send_and_wait(connection, payload, response):
+        await connection.send(payload)
+        return await response
+
+    def _connections_for(self, relay_urls):
+        if relay_urls is None:
+            return list(self.connections.values())
+        return [self.connections[url] for url in relay_urls if url in self.connections]
+
+    async def publish_event(self, event_id, payload, timeout=None, quorum=None, relay_urls=None):
+        """
+        Sends an EVENT payload to every relay and matches each relay's OK reply to event_id.
+        Returns once every relay has answered, once quorum relays have accepted the
+        event, or when the timeout passes, whichever comes first.
+
+        Args:
+            event_id (str): hex id of the event inside the payload
+            payload (str): the serialized EVENT message
+            timeout (float, optional): defaults to the pool's publish_timeout
+            quorum (int, optional): defaults to the pool's publish_quorum
+            relay_urls (list[str], optional): publish to these relays only. Defaults to all.
+
+        Returns:
+            dict: maps each relay url to a PublishResult
+        """
+        if timeout is None:
+            timeout = self.publish_timeout
+        if quorum is None:
+            quorum = self.publish_quorum
+        connections = self._connections_for(relay_urls)
+        relay_urls = [connection.relay_url for connection in connections]
+        tasks = {
+            asyncio.ensure_future(self._publish_event_to_relay(connection, event_id, payload, timeout)):
+                connection.relay_url
+            for connection in connections
+        }
+        results = {}
+        accepted_count = 0
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                result = task.result()
+                results[result.relay_url] = result
+                if result.accepted:
+                    accepted_count += 1
+            if quorum is not None and accepted_count >= quorum:
+                break
+        for task in pending:
+            task.cancel()
+            results[tasks[task]] = PublishResult(tasks[task], PublishStatus.PENDING)
+        await asyncio.gather(*pending, return_exceptions=True)
+        return {url: results[url] for url in relay_urls}
+
+    async def _publish_event_to_relay(self, connection, event_id, payload, timeout):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        ok = connection.expect(
+            lambda frame: frame[0] == RelayMessageType.OK and len(frame) > 2 and frame[1] == event_id
+        )
+        try:
+            await asyncio.wait_for(connection.wait_connected(), timeout)
+            sent_at = loop.time()
+            await connection.send(payload)
+            frame = await asyncio.wait_for(ok, deadline - loop.time())
+        except (asyncio.TimeoutError, ConnectionError):
+            return _recorded(PublishResult(connection.relay_url, PublishStatus.TIMED_OUT))
+        except ValueError as error:
+            # The relay's OK couldn't be decoded, so it is as good as no answer.
+            return _recorded(PublishResult(connection.relay_url, PublishStatus.TIMED_OUT, f"invalid OK: {error}"))
+        finally:
+            ok.cancel()
+        return _recorded(PublishResult.from_ok_frame(connection.relay_url, frame, loop.time() - sent_at))
+
+    async def publish_many(self, signed_events, timeout=None, window=DEFAULT_PUBLISH_WINDOW, relay_urls=None):
+        """
+        Streams a batch of EVENT payloads down every relay's connection without waiting
+        for each OK before sending the next, keeping at most window events in flight per relay.
+
+        Args:
+            signed_events (list): (event id, serialized EVENT message) pairs
+            timeout (float, optional): seconds to wait for each OK. Defaults to the pool's publish_timeout
+            window (int, optional): maximum number of unacknowledged events per relay
+            relay_urls (list[str], optional): publish to these relays only. Defaults to all.
+
+        Returns:
+            BatchPublishReport: per-event, per-relay results and the batch throughput
+        """
+        if timeout is None:
+            timeout = self.publish_timeout
+        # Identical events share an id, and relays only acknowledge an id once.
+        events = dict(signed_events)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        connections = self._connections_for(relay_urls)
+        relay_urls = [connection.relay_url for connection in connections]
+        results_by_relay = await asyncio.gather(*[
+            self._publish_batch_to_relay(connection, events, timeout, window) for connection in connections
+        ])
+        results = {event_id: {} for event_id in events}
+        for relay_url, relay_results in zip(relay_urls, results_by_relay):
+            for event_id, result in relay_results.items():
+                results[event_id][relay_url] = result
+        return BatchPublishReport(results, loop.time() - start)
+
+    async def _publish_batch_to_relay(self, connection, events, timeout, window):
+        loop = asyncio.get_running_loop()
+        results = {}
+        waiters = {}
+        in_flight = asyncio.Semaphore(window)
+
+        def on_frame(frame):
+            if frame[0] == RelayMessageType.OK and len(frame) > 2:
+                waiter = waiters.pop(frame[1], None)
+                if waiter is not None and not waiter.done():
+                    waiter.set_result(frame)
+
+        async def wait_for_ok(event_id, waiter, sent_at):
+            try:
+                frame = await asyncio.wait_for(waiter, timeout)
+                results[event_id] = _recorded(
+                    PublishResult.from_ok_frame(connection.relay_url, frame, loop.time() - sent_at)
+                )
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                waiters.pop(event_id, None)
+                in_flight.release()
+
+        connection.listeners.append(on_frame)
+        ack_tasks = []
+        try:
+            await asyncio.wait_for(connection.wait_connected(), timeout)
+            for event_id, payload in events.items():
+                await in_flight.acquire()
+                waiter = loop.create_future()
+                waiters[event_id] = waiter
+                sent_at = loop.time()
+                await connection.send(payload)
+                ack_tasks.append(asyncio.ensure_future(wait_for_ok(event_id, waiter, sent_at)))
+            await asyncio.gather(*ack_tasks)
+        except (asyncio.TimeoutError, ConnectionError):
+            # The rest of the batch can't be acknowledged over a dropped connection.
+            for task in ack_tasks:
+                task.cancel()
+            await asyncio.gather(*ack_tasks, return_exceptions=True)
+        finally:
+            connection.listeners.remove(on_frame)
+        for event_id in events:
+            if event_id not in results:
+                results[event_id] = _recorded(PublishResult(connection.relay_url, PublishStatus.TIMED_OUT))
+        return results
+
+    async def subscribe(self, request, seen_ids=None, queue_size=DEFAULT_EVENT_QUEUE_SIZE,
+                        overflow_policy=OverflowPolicy.BLOCK, relay_urls=None):
+        """
+        Sends the request's REQ to every relay (or only to relay_urls) and returns the Subscription that
+        streams the matching events. The REQ is re-sent whenever a relay reconnects.
+        Pass the same seen_ids to several subscriptions to dedupe events across them.
+        queue_size and overflow_policy decide how many events may wait to be
+        consumed, and what happens to the ones arriving beyond that.
+        """
+        return self.subscriptions.subscribe(request, seen_ids, queue_size, overflow_policy, relay_urls)
+
+    def iterate(self, async_iterable):
+        """
+        Lets synchronous callers loop over an async iterable (like a Subscription)
+        that lives on the pool's event loop.
+        """
+        iterator = async_iterable.__aiter__()
+        while True:
+            try:
+                yield self.run(iterator.__anext__())
+            except StopAsyncIteration:
+                return
+
+    def close(self):
+        """
+        Closes every connection and stops the background event loop.
+        """
+        if self._loop is None:
+            return
+        self.run(self._close_connections())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = None
+
+    async def _close_connections(self):
+        await asyncio.gather(*[connection.close() for connection in self.connections.values()])
+        self.connections = {}
+        self.subscriptions = SubscriptionManager(self.max_subscriptions_per_relay)
@@ -1,15 +1,23 @@
+import json
+import time
+
 from errors import FileNonExistentError
 from base_interface import BaseInterface
+from constants import RELAY_HEALTH_FILE_SUFFIX
+from publish_result import PublishStatus
+from relay_health import RelayHealth
 
 from config import UserConfig, RELAY_FILE_KEY
 
 class Relays:
-    def __init__(self, relay_file, interface=BaseInterface()) -> None:
+    def __init__(self, relay_file, interface=None) -> None:
         self.relay_urls = []
         self.relay_file = relay_file
-        self.interface = interface
+        self.interface = interface or BaseInterface()
+        self.health = {}
 
         self.load_relays_from_file()
+        self.load_health()
 
     def add_new_relays(self, relays: "list[str]"):
         if not relays: return
@@ -49,17 +57,84 @@ class Relays:
             f.close()
     
     def load_relays_from_file(self):
-        set_of_relays = set(self.relay_urls)
         with open(self.relay_file, "r") as f:
             lines = f.readlines()
             f.close()
         if not lines:
             return
-        for line in lines:
-            set_of_relays.add(line.strip())
-        self.relay_urls = list(set_of_relays)
+        # Drop duplicates but keep the order of the file.
+        new_relays = [line.strip() for line in lines if line.strip()]
+        self.relay_urls = list(dict.fromkeys(self.relay_urls + new_relays))
+
+    def health_file(self):
+        return self.relay_file + RELAY_HEALTH_FILE_SUFFIX if self.relay_file else None
+
+    def load_health(self):
+        """
+        Loads the relays' health records saved next to the relay file, if any.
+        """
+        try:
+            with open(self.health_file(), "r") as f:
+                saved = json.load(f)
+        except (FileNotFoundError, TypeError, ValueError):
+            return
+        self.health = {relay_url: RelayHealth.from_dict(values) for relay_url, values in saved.items()}
+
+    def save_health(self):
+        if not self.relay_file:
+            return
+        with open(self.health_file(), "w") as f:
+            # The pool's thread may add records meanwhile, hence the copy.
+            json.dump({relay_url: health.to_dict() for relay_url, health in list(self.health.items())}, f)
+
+    def get_health(self, relay_url):
+        if relay_url not in self.health:
+            self.health[relay_url] = RelayHealth()
+        return self.health[relay_url]
+
+    def record_publish_results(self, results, now=None):
+        """
+        Updates the relays' health with the outcome of a publish.
+
+        Args:
+            results (dict): maps relay urls to PublishResults
+        """
+        for relay_url, result in results.items():
+            if result.status == PublishStatus.TIMED_OUT:
+                self.get_health(relay_url).record_failure(now)
+            elif result.status != PublishStatus.PENDING:
+                self.get_health(relay_url).record_success(result.latency, result.accepted)
+
+    def record_relay_outcome(self, relay_url, success, now=None):
+        """
+        Updates the relay's health with a failed connection or the answer to a
+        subscription; passed to RelayPool as on_relay_outcome.
+        """
+        if success:
+            self.get_health(relay_url).record_success(accepted=None)
+        else:
+            self.get_health(relay_url).record_failure(now)
+
+    def select_relays(self, count=None, relay_urls=None, now=None):
+        """
+        Returns up to count of the healthiest relays, best first. Relays on
+        probation are left out unless there would be none left otherwise.
+
+        Args:
+            count (int, optional): number of relays to pick. Defaults to all healthy relays.
+            relay_urls (list[str], optional): relays to pick from. Defaults to relay_urls.
+        """
+        now = time.time() if now is None else now
+        candidates = self.relay_urls if relay_urls is None else relay_urls
+        healthy = [url for url in candidates if not self.get_health(url).on_probation(now)]
+        if not healthy:
+            healthy = list(candidates)
+        # sorted() is stable, so relays with equal scores keep the order of the relay file.
+        healthy = sorted(healthy, key=lambda url: self.get_health(url).score())
+        return healthy[:count] if count is not None else healthy
     
     @staticmethod
-    def get_relays(configs=UserConfig(), interface=BaseInterface()):
-        file_name = configs.get_client_config(RELAY_FILE_KEY)
+    def get_relays(configs=None, interface=None):
+        configs = configs or UserConfig()
+        file_name = configs.get_client_config(RELAY_FILE_KEY, interface)
         return Relays(file_name, interface)
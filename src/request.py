@@ -1,31 +1,61 @@
+from functools import lru_cache
 from hashlib import sha256
-import json
-from constants import ClientMessageType
+import codec
+from constants import ClientMessageType, DEFAULT_REQUEST_CACHE_SIZE
 from base_interface import BaseInterface
+from filters import canonical_filter
+
+
+def _filter_json(subscription_filter):
+    return codec.canonical_dumps(subscription_filter).decode()
+
+
+@lru_cache(maxsize=DEFAULT_REQUEST_CACHE_SIZE)
+def _encoded_request(subscriber_id, filter_json):
+    """
+    Returns the subscription id and the REQ and CLOSE messages for a canonical
+    filter. Requests for the same filter share the result, so re-sending many
+    subscriptions (e.g. after reconnecting) doesn't serialize or hash anything.
+    """
+    subscription_id = sha256((subscriber_id + filter_json).encode('utf-8')).hexdigest()
+    start_payload = f'[{codec.dumps(ClientMessageType.REQUEST)},"{subscription_id}",{filter_json}]'
+    stop_payload = codec.dumps([ClientMessageType.CLOSE, subscription_id])
+    return (subscription_id, start_payload, stop_payload)
+
 
 class Request:
     def __init__(self, subscriber_id, subscription_params):
-        
-        self.subscription_params = subscription_params
-        self.subscription_id = Request.get_subscription_id(subscriber_id, subscription_params)
-    
+        """
+        Args:
+            subscriber_id (str): who subscribes; part of the subscription id
+            subscription_params (dict): the filter. It is kept in canonical form
+                (see filters.canonical_filter), so equal filters get the same subscription id.
+
+        Raises:
+            ValueError: if kinds, since, until or limit aren't integers
+        """
+        self.subscription_params = canonical_filter(subscription_params)
+        self.subscription_id, self._start_payload, self._stop_payload = _encoded_request(
+            subscriber_id, _filter_json(self.subscription_params)
+        )
+
     def start_subscription_payload(self):
-        return json.dumps([ClientMessageType.REQUEST, self.subscription_id, self.subscription_params])
-    
+        return self._start_payload
+
     def stop_subscription_payload(self):
-        return json.dumps([ClientMessageType.CLOSE, self.subscription_id])
+        return self._stop_payload
 
     @staticmethod
     def get_subscription_id(subscriber_id, subscription_params):
-        serialized_string = subscriber_id + json.dumps(subscription_params)
-        return sha256(serialized_string.encode('utf-8')).hexdigest()
+        return _encoded_request(subscriber_id, _filter_json(canonical_filter(subscription_params)))[0]
 
     @staticmethod
-    def setup_subscription_from_input(subscriber_id, interface=BaseInterface()):
+    def setup_subscription_from_input(subscriber_id, interface=None):
         """
         Get the parameters of a subscription from user input and return the resulting
         Request object.
         """
+        interface = interface or BaseInterface()
         subscription_params = {}
 
         list_param_definitions = [
@@ -0,0 +1,121 @@
+import math
+from collections import OrderedDict
+from hashlib import blake2b
+
+from constants import DEFAULT_BLOOM_ERROR_RATE, DEFAULT_SEEN_ID_CAPACITY
+
+
+def _id_key(event_id):
+    # Raw bytes take about half the memory of the 64-character hex string.
+    try:
+        return bytes.fromhex(event_id)
+    except (TypeError, ValueError):
+        return event_id
+
+
+class SeenIdCache:
+    """
+    Remembers the most recently seen event ids, forgetting the least recently
+    seen one once capacity ids are held.
+    """
+    def __init__(self, capacity=DEFAULT_SEEN_ID_CAPACITY):
+        self.capacity = capacity
+        self._ids = OrderedDict()
+
+    def add(self, event_id):
+        """
+        Records the event id.
+
+        Returns:
+            bool: True if the id had not been seen before, False if it is a duplicate
+        """
+        key = _id_key(event_id)
+        if key in self._ids:
+            self._ids.move_to_end(key)
+            return False
+        self._ids[key] = None
+        if len(self._ids) > self.capacity:
+            self._ids.popitem(last=False)
+        return True
+
+    def __contains__(self, event_id):
+        return _id_key(event_id) in self._ids
+
+    def __len__(self):
+        return len(self._ids)
+
+
+class BloomFilter:
+    """
+    A fixed-size set of event ids that can give false positives (reporting an
+    unseen id as seen) at roughly error_rate, but never false negatives.
+    Takes a fraction of the memory of SeenIdCache for the same capacity.
+    """
+    def __init__(self, capacity=DEFAULT_SEEN_ID_CAPACITY, error_rate=DEFAULT_BLOOM_ERROR_RATE):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.bit_count = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.bit_count / capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.bit_count + 7) // 8)
+
+    def _positions(self, event_id):
+        digest = blake2b(str(event_id).encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "big")
+        second = int.from_bytes(digest[8:], "big") | 1
+        return [(first + i * second) % self.bit_count for i in range(self.hash_count)]
+
+    def add(self, event_id):
+        """
+        Records the event id.
+
+        Returns:
+            bool: True if the id had not been seen before, False if it (probably) is a duplicate
+        """
+        is_new = False
+        for position in self._positions(event_id):
+            byte_index, bit = divmod(position, 8)
+            if not self._bits[byte_index] & (1 << bit):
+                is_new = True
+                self._bits[byte_index] |= 1 << bit
+        if is_new:
+            self.count += 1
+        return is_new
+
+    def __contains__(self, event_id):
+        for position in self._positions(event_id):
+            byte_index, bit = divmod(position, 8)
+            if not self._bits[byte_index] & (1 << bit):
+                return False
+        return True
+
+    def __len__(self):
+        return self.count
+
+
+class RotatingBloomFilter:
+    """
+    Keeps memory bounded for endless streams by starting a new BloomFilter once
+    the current one holds capacity ids, while still checking the previous one so
+    that recently seen ids are not forgotten at the switch.
+    """
+    def __init__(self, capacity=DEFAULT_SEEN_ID_CAPACITY, error_rate=DEFAULT_BLOOM_ERROR_RATE):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self._current = BloomFilter(capacity, error_rate)
+        self._previous = None
+
+    def add(self, event_id):
+        if self._previous is not None and event_id in self._previous:
+            return False
+        is_new = self._current.add(event_id)
+        if len(self._current) >= self.capacity:
+            self._previous = self._current
+            self._current = BloomFilter(self.capacity, self.error_rate)
+        return is_new
+
+    def __contains__(self, event_id):
+        return event_id in self._current or (self._previous is not None and event_id in self._previous)
+
+    def __len__(self):
+        return len(self._current) + (len(self._previous) if self._previous is not None else 0)
@@ -0,0 +1,186 @@
+import asyncio
+import json
+from collections import Counter
+
+import instrumentation
+from constants import DEFAULT_EVENT_QUEUE_SIZE
+from event_queue import BoundedEventQueue, OverflowPolicy, QueueClosed
+from filters import CompiledFilter
+from lazy_event import LazyEvent
+from seen_ids import SeenIdCache
+
+
+class Subscription:
+    """
+    Streams the events that relays send for one Request. Iterating over it
+    with `async for` yields (relay_url, event) pairs from all relays until the
+    subscription is closed. Which relays have sent EOSE (i.e. finished sending
+    their stored events) is tracked in eose_relays.
+
+    Events are yielded as dicts. An event that several relays send is only
+    yielded the first time it arrives; the copies from the other relays are
+    counted in duplicates, per relay.
+    Events that don't match the request's filter are dropped and counted in mismatches.
+
+    Received events wait in a BoundedEventQueue until they are consumed. By
+    default a full queue makes the relay connections wait (OverflowPolicy.BLOCK),
+    which also holds up the other subscriptions on those relays; the other
+    policies drop or spill events instead. queue_depth and dropped report on it.
+
+    Subscriptions are created by SubscriptionManager.subscribe, which sends the
+    REQ to the relays and hands incoming events to deliver().
+    """
+    def __init__(self, request, manager, seen_ids=None, queue_size=DEFAULT_EVENT_QUEUE_SIZE,
+                 overflow_policy=OverflowPolicy.BLOCK, spill_directory=None, relay_urls=None):
+        """
+        Args:
+            request (Request): the subscription request to send to the relays
+            manager (SubscriptionManager): the manager that routes the relays' messages
+            seen_ids (optional): a SeenIdCache, BloomFilter or RotatingBloomFilter used to
+                drop duplicate events. Defaults to a new SeenIdCache.
+            queue_size (int, optional): number of events held in memory until they are consumed
+            overflow_policy (OverflowPolicy, optional): what to do with events arriving when the queue is full
+            spill_directory (str, optional): where to spill events with OverflowPolicy.SPILL_TO_DISK
+            relay_urls (list[str], optional): the relays the REQ is sent to. Defaults to all of the manager's.
+        """
+        self.request = request
+        self.subscription_id = request.subscription_id
+        self.relay_urls = list(manager.relay_urls if relay_urls is None else relay_urls)
+        self.filter = CompiledFilter(request.subscription_params)
+        self.seen_ids = SeenIdCache() if seen_ids is None else seen_ids
+        self.duplicates = Counter()
+        self.mismatches = Counter()
+        self.eose_relays = set()
+        # Maps relay url to the reason given by relays that ended the subscription themselves.
+        self.closed_by_relay = {}
+        self.closed = False
+        self._manager = manager
+        self._queue = BoundedEventQueue(
+            queue_size, overflow_policy, spill_directory, loads=lambda line: tuple(json.loads(line))
+        )
+        self._all_eose = asyncio.Event()
+
+    def deliver(self, relay_url, event):
+        """
+        Queues an event received from the relay, unless it has already been
+        received or doesn't match the filter. The duplicate check only needs the
+        id, so a LazyEvent is only parsed in full if the filter needs more
+        fields than it can read cheaply, or once it is queued.
+
+        Returns an awaitable if the queue is full and the caller has to wait
+        for room (see BoundedEventQueue.put).
+        """
+        if self.closed:
+            return None
+        recorder = instrumentation.recorder
+        if recorder.enabled:
+            recorder.increment("nostr_events_received_total", relay=relay_url)
+        try:
+            event_id = event["id"]
+            if event_id in self.seen_ids:
+                self.duplicates[relay_url] += 1
+                if recorder.enabled:
+                    recorder.increment("nostr_events_deduplicated_total", relay=relay_url)
+                return None
+            if self.filter.matches(event):
+                if isinstance(event, LazyEvent):
+                    event = event.decode()
+                matched = isinstance(event, dict)
+            else:
+                matched = False
+        except (KeyError, TypeError, ValueError):
+            # Not a well-formed event.
+            matched = False
+        if not matched:
+            self.mismatches[relay_url] += 1
+            if recorder.enabled:
+                recorder.increment("nostr_events_mismatched_total", relay=relay_url)
+            return None
+        self.seen_ids.add(event_id)
+        waiter = self._queue.put((relay_url, event))
+        if recorder.enabled:
+            recorder.set_gauge("nostr_queue_depth", self._queue.depth, subscription=self.subscription_id)
+        return waiter
+
+    @property
+    def queue_depth(self):
+        """
+        Number of received events waiting to be consumed.
+        """
+        return self._queue.depth
+
+    @property
+    def dropped(self):
+        """
+        Number of events dropped because the queue was full.
+        """
+        return self._queue.dropped
+
+    def mark_eose(self, relay_url):
+        self.eose_relays.add(relay_url)
+        self.check_eose()
+
+    def mark_closed(self, relay_url, message):
+        self.closed_by_relay[relay_url] = message
+        self.check_eose()
+
+    def reset(self, relay_url):
+        """
+        Called when the REQ is sent to the relay again, which then starts over with its stored events.
+        """
+        self.eose_relays.discard(relay_url)
+        self.closed_by_relay.pop(relay_url, None)
+
+    def drop_relay(self, relay_url):
+        """
+        Called when the relay leaves the pool, so that EOSE isn't waited for from it.
+        """
+        if relay_url in self.relay_urls:
+            self.relay_urls.remove(relay_url)
+            self.reset(relay_url)
+            self.check_eose()
+
+    def check_eose(self):
+        finished = self.eose_relays | set(self.closed_by_relay)
+        if all(relay_url in finished for relay_url in self.relay_urls):
+            self._all_eose.set()
+
+    def reached_eose(self):
+        """
+        Returns True once every relay has sent all of its stored events.
+        """
+        return self._all_eose.is_set()
+
+    async def wait_for_eose(self, timeout=None):
+        """
+        Waits until every relay has sent EOSE (or closed the subscription).
+        Returns False if the timeout passed first.
+        """
+        try:
+            await asyncio.wait_for(self._all_eose.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            item = await self._queue.get()
+        except QueueClosed:
+            raise StopAsyncIteration
+        recorder = instrumentation.recorder
+        if recorder.enabled:
+            recorder.set_gauge("nostr_queue_depth", self._queue.depth, subscription=self.subscription_id)
+        return item
+
+    async def close(self):
+        """
+        Stops the subscription on the relays and ends the iteration once queued events are consumed.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        await self._manager.unsubscribe(self)
+        self._queue.close()
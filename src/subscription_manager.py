@@ -0,0 +1,346 @@
+import asyncio
+from collections import deque
+from hashlib import sha256
+
+import codec
+from constants import (
+    ClientMessageType,
+    DEFAULT_EVENT_QUEUE_SIZE,
+    DEFAULT_MAX_SUBSCRIPTIONS_PER_RELAY,
+    RelayMessageType,
+)
+from event_queue import OverflowPolicy
+from filters import FilterIndex, canonical_filter
+from lazy_event import LazyEvent
+from subscription import Subscription
+
+# Filter fields that subscriptions can be merged on, in order of preference.
+# Two filters that are identical apart from one of these lists are sent as one
+# REQ whose list is the union of theirs.
+MERGEABLE_FIELDS = ["authors", "ids", "#p", "#e", "kinds"]
+
+# Prefixes of CLOSED messages with which relays say that too many subscriptions are open.
+LIMIT_REACHED_PREFIXES = ["rate-limited:", "error: too many", "too many"]
+
+
+def merge_key(subscription_filter):
+    """
+    Returns the key under which filters that can be merged with this one are
+    grouped, and the field they are merged on (None if only identical filters
+    can share the REQ). Filters with a limit are never merged, since the limit
+    would then apply to the union.
+    """
+    subscription_filter = canonical_filter(subscription_filter)
+    if "limit" not in subscription_filter:
+        for field in MERGEABLE_FIELDS:
+            if field in subscription_filter:
+                rest = {key: value for key, value in subscription_filter.items() if key != field}
+                return (field, _key_json(rest)), field
+    return (None, _key_json(subscription_filter)), None
+
+
+def _key_json(subscription_filter):
+    return codec.canonical_dumps(subscription_filter).decode()
+
+
+def group_id(subscription_id, relay_urls=None):
+    """
+    Returns the id of the REQ a group started by subscription_id sends. A group
+    restricted to some relays gets an id of its own, so that it doesn't replace
+    the REQ of an unrestricted group for the same filter on those relays.
+    """
+    if relay_urls is None:
+        return subscription_id
+    return sha256(",".join([subscription_id] + list(relay_urls)).encode('utf-8')).hexdigest()
+
+
+async def _send(connection, payload):
+    try:
+        await connection.send(payload, timeout=0)
+    except (asyncio.TimeoutError, ConnectionError):
+        # The REQ is sent again when the connection is back up.
+        pass
+
+
+class SubscriptionGroup:
+    """
+    Subscriptions that share a single REQ on every relay. Events received for
+    the REQ are routed back to the subscriptions whose filters they match.
+    """
+    def __init__(self, subscription_id, key, merge_field, relay_urls=None):
+        self.subscription_id = subscription_id
+        self.key = key
+        self.merge_field = merge_field
+        # The relays the REQ is sent to, or None for every relay.
+        self.relay_urls = relay_urls
+        self.subscriptions = []
+        self._index = FilterIndex()
+        # The REQ for the merged filter, kept until the subscriptions change.
+        self._start_payload = None
+        self._stop_payload = codec.dumps([ClientMessageType.CLOSE, subscription_id])
+
+    def add(self, subscription):
+        self.subscriptions.append(subscription)
+        self._index.add(subscription, subscription.request.subscription_params)
+        self._start_payload = None
+
+    def remove(self, subscription):
+        self.subscriptions.remove(subscription)
+        self._index.remove(subscription)
+        self._start_payload = None
+
+    def merged_filter(self):
+        subscription_filter = dict(self.subscriptions[0].request.subscription_params)
+        if self.merge_field is not None:
+            values = []
+            for subscription in self.subscriptions:
+                values += subscription.request.subscription_params[self.merge_field]
+            subscription_filter[self.merge_field] = sorted(set(values))
+        return subscription_filter
+
+    def start_payload(self):
+        if len(self.subscriptions) == 1 and self.subscriptions[0].subscription_id == self.subscription_id:
+            return self.subscriptions[0].request.start_subscription_payload()
+        if self._start_payload is None:
+            self._start_payload = codec.dumps([ClientMessageType.REQUEST, self.subscription_id, self.merged_filter()])
+        return self._start_payload
+
+    def stop_payload(self):
+        return self._stop_payload
+
+    def deliver(self, relay_url, event):
+        """
+        Returns an awaitable if a subscription's queue is full and the
+        connection should wait before reading further events.
+        """
+        if len(self.subscriptions) == 1:
+            return self.subscriptions[0].deliver(relay_url, event)
+        try:
+            targets = self._index.match(event)
+        except (KeyError, TypeError):
+            # Not a well-formed event.
+            return None
+        waiters = [subscription.deliver(relay_url, event) for subscription in targets]
+        waiters = [waiter for waiter in waiters if waiter is not None]
+        if waiters:
+            return asyncio.gather(*waiters)
+        return None
+
+    def reset(self, relay_url):
+        for subscription in self.subscriptions:
+            subscription.reset(relay_url)
+
+    def mark_eose(self, relay_url):
+        for subscription in self.subscriptions:
+            subscription.mark_eose(relay_url)
+
+    def mark_closed(self, relay_url, message):
+        for subscription in self.subscriptions:
+            subscription.mark_closed(relay_url, message)
+
+
+class RelaySubscriptions:
+    """
+    Tracks the REQs open on one relay connection. REQs beyond the relay's limit
+    wait in a queue until another subscription on the relay is closed.
+
+    A relay that refuses a REQ for having too many open lowers the limit to
+    what it accepted. The limit then grows back by one with each EOSE, and is
+    restored in full when the connection is re-established.
+    """
+    def __init__(self, connection, max_subscriptions=DEFAULT_MAX_SUBSCRIPTIONS_PER_RELAY):
+        self.connection = connection
+        self.relay_url = connection.relay_url
+        self.configured_max_subscriptions = max_subscriptions
+        self.max_subscriptions = max_subscriptions
+        self.active = {}
+        self.queued = deque()
+        # The active REQs the relay hasn't answered yet, to report whether it does.
+        self._unanswered = set()
+        connection.listeners.append(self._on_frame)
+        connection.connect_callbacks.append(self._on_connect)
+
+    def detach(self):
+        """
+        Stops routing the connection's messages.
+        """
+        self.connection.listeners.remove(self._on_frame)
+        self.connection.connect_callbacks.remove(self._on_connect)
+
+    def _send_start(self, group):
+        self._unanswered.add(group.subscription_id)
+        asyncio.ensure_future(_send(self.connection, group.start_payload()))
+
+    def open(self, group):
+        if len(self.active) < self.max_subscriptions:
+            self._start(group)
+        else:
+            self.queued.append(group)
+
+    def _start(self, group):
+        self.active[group.subscription_id] = group
+        group.reset(self.relay_url)
+        if self.connection.is_connected():
+            self._send_start(group)
+
+    def update(self, group, joined=None):
+        """
+        Sends the group's REQ again after its merged filter has changed. A REQ
+        with the same subscription id replaces the previous one on the relay.
+        Only the subscription that joined (if any) waits for the relay's EOSE;
+        the others already have the stored events for their filters.
+        """
+        if group.subscription_id in self.active:
+            if joined is not None:
+                joined.reset(self.relay_url)
+            if self.connection.is_connected():
+                self._send_start(group)
+
+    async def close(self, group):
+        self._unanswered.discard(group.subscription_id)
+        if self.active.pop(group.subscription_id, None) is not None:
+            if self.connection.is_connected():
+                await _send(self.connection, group.stop_payload())
+            self._start_queued()
+        elif group in self.queued:
+            self.queued.remove(group)
+
+    def _start_queued(self):
+        while self.queued and len(self.active) < self.max_subscriptions:
+            self._start(self.queued.popleft())
+
+    def _on_connect(self):
+        # A new connection starts with the relay's limit unknown again.
+        self.max_subscriptions = self.configured_max_subscriptions
+        for group in self.active.values():
+            group.reset(self.relay_url)
+            self._send_start(group)
+        self._start_queued()
+
+    def _on_frame(self, frame):
+        if len(frame) < 2:
+            return None
+        group = self.active.get(frame[1])
+        if group is None:
+            return None
+        if frame[0] == RelayMessageType.EVENT and len(frame) > 2 and isinstance(frame[2], (dict, LazyEvent)):
+            return group.deliver(self.relay_url, frame[2])
+        elif frame[0] == RelayMessageType.EOSE:
+            self._report_answer(group)
+            group.mark_eose(self.relay_url)
+            if self.max_subscriptions < self.configured_max_subscriptions:
+                self.max_subscriptions += 1
+                self._start_queued()
+        elif frame[0] == RelayMessageType.CLOSED:
+            message = frame[2] if len(frame) > 2 and isinstance(frame[2], str) else ""
+            del self.active[group.subscription_id]
+            self._report_answer(group, success=not message.startswith("error:"))
+            if any(message.startswith(prefix) for prefix in LIMIT_REACHED_PREFIXES):
+                # The relay's limit is lower than ours: wait for a slot to free up and retry.
+                self.max_subscriptions = max(1, len(self.active))
+                self.queued.appendleft(group)
+            else:
+                group.mark_closed(self.relay_url, message)
+            self._start_queued()
+        return None
+
+    def _report_answer(self, group, success=True):
+        if group.subscription_id in self._unanswered:
+            self._unanswered.remove(group.subscription_id)
+            self.connection.report(success)
+
+
+class SubscriptionManager:
+    """
+    Multiplexes every subscription over the single connection the pool keeps
+    to each relay. Incoming messages are routed by subscription id, filters
+    that only differ in one list field are merged into a single REQ, and each
+    relay's limit on open subscriptions is respected by queueing.
+    """
+    def __init__(self, max_subscriptions_per_relay=DEFAULT_MAX_SUBSCRIPTIONS_PER_RELAY):
+        self.max_subscriptions_per_relay = max_subscriptions_per_relay
+        self.relays = {}
+        self.groups = {}
+        self._group_of = {}
+
+    @property
+    def relay_urls(self):
+        return list(self.relays)
+
+    def add_connection(self, connection):
+        """
+        Starts routing the connection's messages, and opens the current subscriptions on it.
+        """
+        relay = RelaySubscriptions(connection, self.max_subscriptions_per_relay)
+        self.relays[connection.relay_url] = relay
+        for group in self.groups.values():
+            if group.relay_urls is None:
+                relay.open(group)
+
+    def remove_connection(self, relay_url):
+        """
+        Stops routing the relay's messages. Its subscriptions no longer wait for it.
+        """
+        relay = self.relays.pop(relay_url, None)
+        if relay is None:
+            return
+        relay.detach()
+        for group in self.groups.values():
+            for subscription in group.subscriptions:
+                subscription.drop_relay(relay_url)
+
+    def _relays_of(self, group):
+        if group.relay_urls is None:
+            return list(self.relays.values())
+        return [self.relays[url] for url in group.relay_urls if url in self.relays]
+
+    def subscribe(self, request, seen_ids=None, queue_size=DEFAULT_EVENT_QUEUE_SIZE,
+                  overflow_policy=OverflowPolicy.BLOCK, relay_urls=None):
+        """
+        Opens a subscription for the request on every relay (or only on relay_urls),
+        merging it into an existing REQ where possible. See Subscription for the
+        other arguments.
+
+        Returns:
+            Subscription: streams the events the relays send for the request
+        """
+        if relay_urls is not None:
+            relay_urls = sorted(url for url in set(relay_urls) if url in self.relays)
+        subscription = Subscription(request, self, seen_ids, queue_size, overflow_policy, relay_urls=relay_urls)
+        key, merge_field = merge_key(request.subscription_params)
+        if relay_urls is not None:
+            # Only subscriptions to the same relays can share a REQ.
+            key = (key, tuple(relay_urls))
+        group = self.groups.get(key)
+        if group is None:
+            group = SubscriptionGroup(group_id(subscription.subscription_id, relay_urls), key, merge_field, relay_urls)
+            group.add(subscription)
+            self.groups[key] = group
+            for relay in self._relays_of(group):
+                relay.open(group)
+        else:
+            group.add(subscription)
+            for relay in self._relays_of(group):
+                relay.update(group, subscription)
+        self._group_of[subscription] = group
+        subscription.check_eose()
+        return subscription
+
+    async def unsubscribe(self, subscription):
+        group = self._group_of.pop(subscription, None)
+        if group is None:
+            return
+        group.remove(subscription)
+        if group.subscriptions:
+            for relay in self._relays_of(group):
+                relay.update(group)
+        else:
+            del self.groups[group.key]
+            await asyncio.gather(*[relay.close(group) for relay in self._relays_of(group)])
+
+    def open_count(self, relay_url):
+        """
+        Returns the number of REQs open on the relay and the number waiting for a free slot.
+        """
+        relay = self.relays[relay_url]
+        return (len(relay.active), len(relay.queued))
@@ -0,0 +1,388 @@
+import asyncio
+import sqlite3
+import time
+
+import codec
+from constants import (
+    ClientMessageType,
+    DEFAULT_BACKFILL_WINDOW,
+    DEFAULT_RECONCILE_FETCH_SIZE,
+    DEFAULT_SYNC_TIMEOUT,
+    RelayMessageType,
+)
+from filters import canonical_filter
+from negentropy import Negentropy, NegentropyError
+from request import Request
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS high_water_marks (
+    filter_key TEXT NOT NULL,
+    relay_url TEXT NOT NULL,
+    newest_created_at INTEGER,
+    reached_eose INTEGER NOT NULL,
+    synced_at INTEGER NOT NULL,
+    PRIMARY KEY (filter_key, relay_url)
+);
+CREATE TABLE IF NOT EXISTS backfill_checkpoints (
+    filter_key TEXT NOT NULL,
+    relay_url TEXT NOT NULL,
+    until INTEGER,
+    done INTEGER NOT NULL,
+    PRIMARY KEY (filter_key, relay_url)
+);
+"""
+
+# Filter fields that pick a time range or a number of events rather than which events match.
+_RANGE_FIELDS = ("since", "until", "limit")
+
+
+def filter_key(subscription_filter):
+    """
+    Returns the key that sync state is kept under for the filter: the filter
+    without its time range and limit, in canonical form (see filters.canonical_filter),
+    so that every sync of the same events shares it.
+    """
+    rest = {key: value for key, value in subscription_filter.items() if key not in _RANGE_FIELDS}
+    return codec.canonical_dumps(canonical_filter(rest)).decode()
+
+
+class SyncState:
+    """
+    Remembers, per (filter, relay) pair, the newest created_at received and
+    whether the relay got to EOSE, and where each historical backfill got to.
+    Kept in its own SQLite database so that it can be committed independently
+    of the event store.
+    """
+    def __init__(self, file_name):
+        """
+        Args:
+            file_name (str): path of the database file, or ":memory:"
+        """
+        self.file_name = file_name
+        self._db = sqlite3.connect(file_name, check_same_thread=False)
+        self._db.executescript(SCHEMA)
+
+    def high_water_mark(self, key, relay_url):
+        """
+        Returns:
+            tuple: the newest created_at synced from the relay (None if nothing was),
+                and whether the last sync reached EOSE
+        """
+        row = self._db.execute(
+            "SELECT newest_created_at, reached_eose FROM high_water_marks WHERE filter_key = ? AND relay_url = ?",
+            (key, relay_url),
+        ).fetchone()
+        return (row[0], bool(row[1])) if row else (None, False)
+
+    def record_sync(self, key, relay_url, newest_created_at, reached_eose, now=None):
+        """
+        Records the outcome of a sync. The mark only moves forward, and only when
+        the relay reached EOSE: until then older events may still be missing.
+        """
+        previous, _ = self.high_water_mark(key, relay_url)
+        if not reached_eose or newest_created_at is None or (previous is not None and previous > newest_created_at):
+            newest_created_at = previous
+        self._db.execute(
+            "INSERT OR REPLACE INTO high_water_marks VALUES (?, ?, ?, ?, ?)",
+            (key, relay_url, newest_created_at, int(reached_eose), int(now if now is not None else time.time())),
+        )
+
+    def checkpoint(self, key, relay_url):
+        """
+        Returns:
+            tuple: the until of the next backfill window (None for now) and whether
+                the backfill is done, or None if no backfill was started
+        """
+        row = self._db.execute(
+            "SELECT until, done FROM backfill_checkpoints WHERE filter_key = ? AND relay_url = ?",
+            (key, relay_url),
+        ).fetchone()
+        return (row[0], bool(row[1])) if row else None
+
+    def save_checkpoint(self, key, relay_url, until, done):
+        self._db.execute("INSERT OR REPLACE INTO backfill_checkpoints VALUES (?, ?, ?, ?)",
+                         (key, relay_url, until, int(done)))
+
+    def reset_backfill(self, key):
+        """
+        Forgets the backfill checkpoints of the filter, so that the next backfill starts over.
+        """
+        self._db.execute("DELETE FROM backfill_checkpoints WHERE filter_key = ?", (key,))
+
+    def commit(self):
+        self._db.commit()
+
+    def close(self):
+        self._db.commit()
+        self._db.close()
+
+
+class Synchronizer:
+    """
+    Fetches the events matching a filter from each relay without downloading
+    what was already fetched before.
+
+    sync() asks each relay only for events from its high-water mark on.
+    backfill() walks back through a relay's history in until+limit windows,
+    all relays at once, and checkpoints after every window so that a backfill
+    that was interrupted carries on where it stopped.
+    reconcile() compares the ids held in the event store with the relay's using
+    NIP-77 negentropy and only fetches the events that are missing.
+
+    Windows overlap by the second of their oldest event, since until and since
+    are inclusive and events from that second may not all have fit. Relays
+    holding more than a window's worth of events from one second can still make
+    some of them unreachable: NIP-01 has no way to page within a second.
+    """
+    def __init__(self, pool, state, store=None, window=DEFAULT_BACKFILL_WINDOW, timeout=DEFAULT_SYNC_TIMEOUT,
+                 on_event=None, fetch_size=DEFAULT_RECONCILE_FETCH_SIZE):
+        """
+        Args:
+            pool (RelayPool): an open pool connected to the relays
+            state (SyncState): where the high-water marks and checkpoints are kept
+            store (EventStore, optional): where to keep the fetched events
+            window (int, optional): number of events asked for per window
+            timeout (float, optional): seconds to wait for a relay to send a window
+            on_event (callable, optional): called with the relay url and each new event
+            fetch_size (int, optional): number of missing events asked for per REQ after a reconciliation
+        """
+        self.pool = pool
+        self.state = state
+        self.store = store
+        self.window = window
+        self.timeout = timeout
+        self.on_event = on_event
+        self.fetch_size = fetch_size
+        # Maps each relay url to the ids the last reconciliation found only in the store.
+        self.missing_on_relay = {}
+
+    def resume_filter(self, subscription_filter, relay_url):
+        """
+        Returns a copy of the filter starting from the relay's high-water mark.
+        since is inclusive, so events from that same second are fetched again rather than missed.
+        """
+        newest, _ = self.state.high_water_mark(filter_key(subscription_filter), relay_url)
+        resumed = dict(subscription_filter)
+        if newest is not None and newest > int(resumed.get("since", 0)):
+            resumed["since"] = newest
+        return resumed
+
+    async def _fetch(self, subscriber_id, subscription_filter, relay_url):
+        """
+        Returns the relay's stored events for the filter, and whether it got to EOSE in time.
+        """
+        subscription = await self.pool.subscribe(Request(subscriber_id, subscription_filter), relay_urls=[relay_url])
+        eose = asyncio.ensure_future(subscription.wait_for_eose(self.timeout))
+        eose.add_done_callback(lambda _: asyncio.ensure_future(subscription.close()))
+        try:
+            events = [event async for _, event in subscription]
+        finally:
+            eose.cancel()
+            await subscription.close()
+        # A relay that ends the subscription with CLOSED instead of EOSE didn't send everything.
+        return events, relay_url in subscription.eose_relays
+
+    def _keep(self, relay_url, events):
+        """
+        Stores the events and returns the number of them that were new.
+        """
+        kept = 0
+        for event in events:
+            if self.store is not None and not self.store.add(event):
+                continue
+            kept += 1
+            if self.on_event is not None:
+                self.on_event(relay_url, event)
+        return kept
+
+    async def _walk(self, subscriber_id, subscription_filter, relay_url, until, on_window=None):
+        """
+        Fetches the relay's events from until back to the filter's since, one window at a time.
+
+        Args:
+            until (int): the newest created_at to fetch, or None for now
+            on_window (callable, optional): called with the until of the next window
+                (None once there are no more) after each window has been kept
+
+        Returns:
+            tuple: the number of new events, the newest created_at received (or None),
+                and whether every window was received in full
+        """
+        since = subscription_filter.get("since")
+        kept = 0
+        newest = None
+        boundary_ids = set()
+        while True:
+            window_filter = {key: value for key, value in subscription_filter.items() if key != "until"}
+            window_filter["limit"] = self.window
+            if until is not None:
+                window_filter["until"] = until
+            events, reached_eose = await self._fetch(subscriber_id, window_filter, relay_url)
+            if not reached_eose:
+                return kept, newest, False
+            fresh = [event for event in events if event["id"] not in boundary_ids]
+            kept += self._keep(relay_url, fresh)
+            if events:
+                newest = max(newest or 0, max(event["created_at"] for event in events))
+            if len(events) < self.window:
+                until = None
+            else:
+                oldest = min(event["created_at"] for event in events)
+                at_oldest = {event["id"] for event in events if event["created_at"] == oldest}
+                boundary_ids = boundary_ids | at_oldest if oldest == until else at_oldest
+                # If the whole window was already seen, the second it ends in is full; move past it.
+                until = oldest if fresh else oldest - 1
+                if since is not None and until < int(since):
+                    until = None
+            if on_window is not None:
+                on_window(until)
+            if until is None:
+                return kept, newest, True
+
+    async def sync(self, subscriber_id, subscription_filter, relay_urls=None):
+        """
+        Fetches the events matching the filter that are newer than each relay's
+        high-water mark, and moves the marks forward.
+
+        Returns:
+            dict: maps each relay url to the number of new events and whether the relay got to EOSE
+        """
+        relay_urls = list(self.pool.relay_urls if relay_urls is None else relay_urls)
+        results = await asyncio.gather(*[
+            self._sync_relay(subscriber_id, subscription_filter, relay_url) for relay_url in relay_urls
+        ])
+        self._commit()
+        return dict(zip(relay_urls, results))
+
+    async def _sync_relay(self, subscriber_id, subscription_filter, relay_url):
+        resumed = self.resume_filter(subscription_filter, relay_url)
+        kept, newest, complete = await self._walk(subscriber_id, resumed, relay_url, resumed.get("until"))
+        self.state.record_sync(filter_key(subscription_filter), relay_url, newest, complete)
+        return kept, complete
+
+    async def backfill(self, subscriber_id, subscription_filter, relay_urls=None):
+        """
+        Fetches every event matching the filter, from its until (or now) back
+        to its since (or the beginning), carrying on from the checkpoint of an
+        earlier backfill of the same filter. Relays that were already backfilled
+        in full are skipped; call SyncState.reset_backfill to start over.
+
+        Returns:
+            dict: maps each relay url to the number of new events and whether its backfill is done
+        """
+        relay_urls = list(self.pool.relay_urls if relay_urls is None else relay_urls)
+        results = await asyncio.gather(*[
+            self._backfill_relay(subscriber_id, subscription_filter, relay_url) for relay_url in relay_urls
+        ])
+        self._commit()
+        return dict(zip(relay_urls, results))
+
+    async def _backfill_relay(self, subscriber_id, subscription_filter, relay_url):
+        key = filter_key(subscription_filter)
+        checkpoint = self.state.checkpoint(key, relay_url)
+        if checkpoint is not None and checkpoint[1]:
+            return 0, True
+        if checkpoint is not None:
+            until = checkpoint[0]
+        else:
+            # Fix the start of the backfill, so that a restart doesn't move it.
+            until = int(subscription_filter.get("until", time.time()))
+
+        def save_checkpoint(next_until):
+            # Save the events before the checkpoint that says they were fetched.
+            self._commit(store_only=True)
+            self.state.save_checkpoint(key, relay_url, next_until, next_until is None)
+            self.state.commit()
+
+        kept, newest, complete = await self._walk(subscriber_id, subscription_filter, relay_url, until,
+                                                  save_checkpoint)
+        if complete and "until" not in subscription_filter:
+            # Everything up to the start of the backfill was fetched, so a sync can carry on from there.
+            self.state.record_sync(key, relay_url, newest, True)
+        return kept, complete
+
+    async def reconcile(self, subscriber_id, subscription_filter, relay_urls=None):
+        """
+        Finds the events matching the filter that the relays have and the event
+        store doesn't, by NIP-77 set reconciliation, and fetches only those.
+        Relays that don't support NIP-77 are synced with sync() instead.
+
+        Returns:
+            dict: maps each relay url to the number of new events and whether everything was fetched
+
+        Raises:
+            ValueError: if the Synchronizer has no event store
+        """
+        if self.store is None:
+            raise ValueError("Reconciling needs an event store to compare with")
+        relay_urls = list(self.pool.relay_urls if relay_urls is None else relay_urls)
+        results = await asyncio.gather(*[
+            self._reconcile_relay(subscriber_id, subscription_filter, relay_url) for relay_url in relay_urls
+        ])
+        self._commit()
+        return dict(zip(relay_urls, results))
+
+    async def _reconcile_relay(self, subscriber_id, subscription_filter, relay_url):
+        connection = self.pool.connections.get(relay_url)
+        if connection is None:
+            return 0, False
+        subscription_filter = {key: value for key, value in subscription_filter.items() if key != "limit"}
+        items = self.store.id_index(subscription_filter)
+        negentropy = Negentropy(items)
+        try:
+            await self._exchange(connection, Request(subscriber_id, subscription_filter).subscription_id,
+                                 subscription_filter, negentropy)
+        except (asyncio.TimeoutError, ConnectionError, NegentropyError, ValueError, TypeError, IndexError):
+            return await self._sync_relay(subscriber_id, subscription_filter, relay_url)
+        self.missing_on_relay[relay_url] = negentropy.have_ids
+        kept = 0
+        complete = True
+        need_ids = sorted(negentropy.need_ids)
+        newest = max((created_at for created_at, _ in items), default=None)
+        for start in range(0, len(need_ids), self.fetch_size):
+            events, reached_eose = await self._fetch(
+                subscriber_id, {"ids": need_ids[start:start + self.fetch_size]}, relay_url)
+            complete = complete and reached_eose
+            kept += self._keep(relay_url, events)
+            newest = max([newest or 0] + [event["created_at"] for event in events])
+        self.state.record_sync(filter_key(subscription_filter), relay_url, newest, complete)
+        return kept, complete
+
+    async def _exchange(self, connection, subscription_id, subscription_filter, negentropy):
+        """
+        Runs the reconciliation with the relay until negentropy has found every difference.
+
+        Raises:
+            NegentropyError: if the relay refused or sent an invalid message
+        """
+        message = negentropy.initiate()
+        payload = codec.dumps([ClientMessageType.NEG_OPEN, subscription_id, subscription_filter, message.hex()])
+        try:
+            while message is not None:
+                # Relays without NIP-77 answer with a NOTICE, which has no subscription id.
+                reply = connection.expect(
+                    lambda frame: frame[0] == RelayMessageType.NOTICE or (
+                        frame[0] in (RelayMessageType.NEG_MSG, RelayMessageType.NEG_ERR)
+                        and len(frame) > 2 and frame[1] == subscription_id)
+                )
+                try:
+                    await connection.send(payload, self.timeout)
+                    frame = await asyncio.wait_for(reply, self.timeout)
+                finally:
+                    reply.cancel()
+                if frame[0] != RelayMessageType.NEG_MSG:
+                    raise NegentropyError(f"{connection.relay_url} refused to reconcile: {frame[1:]}")
+                message = negentropy.reconcile(bytes.fromhex(frame[2]))
+                if message is not None:
+                    payload = codec.dumps([ClientMessageType.NEG_MSG, subscription_id, message.hex()])
+        finally:
+            try:
+                await connection.send(codec.dumps([ClientMessageType.NEG_CLOSE, subscription_id]), 0)
+            except (asyncio.TimeoutError, ConnectionError):
+                pass
+
+    def _commit(self, store_only=False):
+        if self.store is not None:
+            self.store.commit()
+        if not store_only:
+            self.state.commit()
@@ -0,0 +1,118 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import islice
+
+import codec
+import instrumentation
+from constants import DEFAULT_PUBKEY_CACHE_SIZE, DEFAULT_VERIFY_BATCH_SIZE
+from event import BaseEvent
+
+
+@lru_cache(maxsize=DEFAULT_PUBKEY_CACHE_SIZE)
+def _public_key(pubkey):
+    import secp256k1
+    # Nostr public keys are the 32-byte x coordinate only, so add back the even "sign byte".
+    return secp256k1.PublicKey(b"\x02" + bytes.fromhex(pubkey), raw=True)
+
+
+def verify_event(event):
+    """
+    Checks that the event's id is the hash of its contents and that its
+    signature was made by its author.
+
+    Args:
+        event (dict): an event as received from a relay
+
+    Returns:
+        bool: True if both the id and the signature are valid
+    """
+    try:
+        serialized_event = codec.canonical_event(
+            event["pubkey"], event["created_at"], event["kind"], event["tags"], event["content"]
+        )
+        event_id = BaseEvent.get_id_from_stamped_event(serialized_event)
+        if event_id != event["id"]:
+            return False
+        return _public_key(event["pubkey"]).schnorr_verify(
+            bytes.fromhex(event_id), bytes.fromhex(event["sig"]), None, raw=True
+        )
+    except Exception:
+        # Missing fields, bad hex and malformed keys or signatures all make the event invalid.
+        return False
+
+
+def _verify_batch(events):
+    return [verify_event(event) for event in events]
+
+
+class EventVerifier:
+    """
+    Verifies the ids and signatures of events written by any author, spreading
+    large batches over a pool of worker processes. Each process keeps a cache
+    of parsed public keys, so authors with many events are only parsed once.
+    """
+    def __init__(self, processes=None, batch_size=DEFAULT_VERIFY_BATCH_SIZE):
+        """
+        Args:
+            processes (int, optional): number of worker processes. Defaults to the number of cores.
+                Use 0 to verify in the calling process.
+            batch_size (int, optional): number of events handed to a worker at a time
+        """
+        self.processes = processes
+        self.batch_size = batch_size
+        self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(self.processes)
+        return self._executor
+
+    def verify(self, event):
+        return verify_event(event)
+
+    def verify_many(self, events):
+        """
+        Returns a list holding whether each of the events is valid, in order.
+        """
+        return [valid for _, valid in self.verify_stream(events)]
+
+    def verify_stream(self, events):
+        """
+        Verifies an iterable of events, which may be endless, and yields (event, valid)
+        pairs in the order the events came in. Batches are read ahead so that every
+        worker process has work to do.
+        """
+        for event, valid in self._verify_stream(iter(events)):
+            instrumentation.recorder.increment("nostr_events_verified_total", valid=str(valid).lower())
+            yield (event, valid)
+
+    def _verify_stream(self, events):
+        if self.processes == 0:
+            for event in events:
+                yield (event, verify_event(event))
+            return
+        executor = self._get_executor()
+        read_ahead = (self.processes or os.cpu_count() or 1) * 2
+        pending = []
+        while True:
+            while len(pending) < read_ahead:
+                batch = list(islice(events, self.batch_size))
+                if not batch:
+                    break
+                pending.append((batch, executor.submit(_verify_batch, batch)))
+            if not pending:
+                return
+            batch, future = pending.pop(0)
+            yield from zip(batch, future.result())
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
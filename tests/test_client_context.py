@@ -0,0 +1,54 @@
+import os
+import subprocess
+import tempfile
+import unittest
+from unittest import mock
+
+import sys
+sys.path.append("src")
+
+from client_context import ClientContext
+from config import RELAY_FILE_KEY, UserConfig
+from key_pair import KeyPair
+
+
+class ClientContextTests(unittest.TestCase):
+    def test_importing_the_client_has_no_side_effects(self):
+        code = (
+            "import sys; sys.path.append('src');"
+            "import builtins; builtins.input = None;"
+            "import client_manager, cli, headless_client, key_pair, relays, verifier, miner;"
+            "print(','.join(m for m in ('secp256k1', 'cryptography', 'websockets') if m in sys.modules))"
+        )
+        output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+        self.assertEqual(output.strip(), "")
+
+    def test_configuration_is_read_on_first_use(self):
+        with mock.patch.object(UserConfig, "load_client_configs") as load:
+            context = ClientContext()
+            self.assertIsInstance(context.configs, UserConfig)
+            load.assert_not_called()
+
+    def test_relays_keys_and_store_load_lazily(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        relay_file = os.path.join(directory.name, "relays")
+        with open(relay_file, "w") as f:
+            f.write("wss://one\nwss://two\n")
+        keys = KeyPair.create_new_key_pair()
+        context = ClientContext(keys=keys)
+        with mock.patch.object(UserConfig, "get_client_config", return_value=relay_file) as get_config:
+            self.assertIs(context.keys, keys)
+            get_config.assert_not_called()
+            self.assertEqual(context.relays.relay_urls, ["wss://one", "wss://two"])
+            get_config.assert_called_once_with(RELAY_FILE_KEY, context.interface)
+            self.assertIs(context.relays, context.relays)
+        with mock.patch.object(UserConfig, "prepath", directory.name):
+            context.store.add({"id": "1" * 64, "pubkey": "2" * 64, "created_at": 1, "kind": 1,
+                               "tags": [], "content": "", "sig": "3" * 128})
+        context.close()
+        self.assertTrue(os.path.exists(relay_file + ".health"))
+
+
+if __name__ == "__main__":
+    unittest.main()
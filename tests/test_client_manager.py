@@ -0,0 +1,80 @@
+import asyncio
+import io
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import sys
+sys.path.append("src")
+
+from client_context import ClientContext
+from client_manager import ClientManager
+from event import TextEvent
+from key_pair import KeyPair
+from mock_relay import MockRelay
+from relays import Relays
+
+
+class ClientManagerTests(unittest.TestCase):
+    def setUp(self) -> None:
+        # The client runs its own event loop, so the relay gets one in another thread.
+        self.loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.loop.close)
+        self.addCleanup(thread.join)
+        self.addCleanup(lambda: self.loop.call_soon_threadsafe(self.loop.stop))
+        self.relay = MockRelay(verify=True)
+        self.url = self.run_on_relay_loop(self.relay.start())
+        self.addCleanup(lambda: self.run_on_relay_loop(self.relay.stop()))
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.relay_file = os.path.join(directory.name, "relays")
+        with open(self.relay_file, "w") as f:
+            f.write(self.url)
+        self.keys = KeyPair.create_new_key_pair()
+
+    def run_on_relay_loop(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(5)
+
+    def make_client(self):
+        client = ClientManager(ClientContext(relays=Relays(self.relay_file), keys=self.keys))
+        self.addCleanup(client.pool.close)
+        return client
+
+    def test_publish_event_signs_with_the_event_builder(self):
+        client = self.make_client()
+        with mock.patch("sys.stdout", io.StringIO()):
+            results = client.publish_event(TextEvent(self.keys.pubkey_hex_string(), "hello"))
+        self.assertTrue(results[self.url].accepted)
+        [event] = self.relay.events.values()
+        self.assertEqual((event["content"], event["pubkey"]), ("hello", self.keys.pubkey_hex_string()))
+        event_id, payload = client.sign_event(TextEvent(self.keys.pubkey_hex_string(), "again"))
+        self.assertIn(event_id, payload)
+
+
+    def test_relays_on_probation_leave_the_pool_until_it_ends(self):
+        unreachable_url = "ws://127.0.0.1:1"
+        with open(self.relay_file, "a") as f:
+            f.write("\n" + unreachable_url)
+        client = self.make_client()
+        self.assertEqual(client.pool.relay_urls, [self.url, unreachable_url])
+        deadline = time.monotonic() + 5
+        while client.relays.get_health(unreachable_url).failures == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertGreater(client.relays.get_health(unreachable_url).failures, 0)
+
+        client.relays.get_health(unreachable_url).probation_until = time.time() + 60
+        client.refresh_pool()
+        self.assertEqual(client.pool.relay_urls, [self.url])
+        client.relays.get_health(unreachable_url).probation_until = 0
+        client.refresh_pool()
+        self.assertIn(unreachable_url, client.pool.relay_urls)
+
+
+if __name__ == "__main__":
+    unittest.main()
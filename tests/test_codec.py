@@ -0,0 +1,80 @@
+import json
+import unittest
+
+import sys
+sys.path.append("src")
+
+import codec
+
+PUBKEY = "f" * 64
+
+# Contents and tags that JSON encoders are known to disagree on.
+CORPUS = [
+    ("", []),
+    ("plain text", [["p", PUBKEY, "wss://relay.example.com"]]),
+    ("quotes \" and backslashes \\ and a slash /", [["t", "a\\b"]]),
+    ("\b\f\n\r\t", [["e", "\n"]]),
+    ("".join(chr(code) for code in range(32)) + "\x7f", [["x", "\x00\x1f"]]),
+    ("é ü ß ñ 中文 日本語", [["t", "ünïcödé"]]),
+    ("emoji 😀🚀 and flags 🇪🇹", [["emoji", "😀"]]),
+    ("line separator\u2028paragraph separator\u2029and bom\ufeff", []),
+    ("</script><!-- -->", [["a", "30023:" + PUBKEY + ":slug"], ["d", ""]]),
+    ("a" * 10000, [["t", str(i)] for i in range(100)]),
+]
+
+
+def reference(pubkey, created_at, kind, tags, content):
+    return json.dumps([0, pubkey, created_at, kind, tags, content], separators=(',', ':'), ensure_ascii=False).encode()
+
+
+class CodecTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.addCleanup(codec.use_backend, codec.backend)
+
+    def test_canonical_serialization_is_identical_for_every_backend(self):
+        for name in codec.available_backends():
+            codec.use_backend(name)
+            for content, tags in CORPUS:
+                for created_at, kind in [(1700000000, 1), (0, 30023), (2 ** 62, 65535), (2 ** 70, 1), (1.5, 1)]:
+                    with self.subTest(backend=name, content=content[:20], created_at=created_at):
+                        self.assertEqual(
+                            codec.canonical_event(PUBKEY, created_at, kind, tags, content),
+                            reference(PUBKEY, created_at, kind, tags, content),
+                        )
+
+    def test_lone_surrogates_cannot_be_serialized(self):
+        for name in codec.available_backends():
+            codec.use_backend(name)
+            with self.subTest(backend=name):
+                with self.assertRaises(UnicodeEncodeError):
+                    codec.canonical_event(PUBKEY, 1, 1, [], "\ud800")
+                with self.assertRaises(UnicodeEncodeError):
+                    codec.canonical_dumps([["t", "\udfff"]])
+
+    def test_messages_round_trip(self):
+        message = ["EVENT", "sub", {"id": "ab", "kind": 1, "tags": [["t", "é"]], "content": "😀\n"}]
+        for name in codec.available_backends():
+            codec.use_backend(name)
+            with self.subTest(backend=name):
+                self.assertEqual(codec.loads(codec.dumps(message)), message)
+                self.assertEqual(codec.loads(codec.dumps(message).encode()), message)
+                with self.assertRaises(ValueError):
+                    codec.loads('["EVENT", ')
+
+    def test_decode_event_checks_field_types(self):
+        event = {"id": "ab", "pubkey": PUBKEY, "created_at": 1, "kind": 1, "tags": [["t", "x"]], "content": "", "sig": "cd"}
+        for name in codec.available_backends():
+            codec.use_backend(name)
+            with self.subTest(backend=name):
+                self.assertEqual(codec.decode_event(json.dumps(event)), event)
+                for field, value in [("kind", "1"), ("created_at", 1.5), ("tags", [["t", 1]]), ("sig", None)]:
+                    with self.assertRaises(ValueError):
+                        codec.decode_event(json.dumps(dict(event, **{field: value})))
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            codec.use_backend("simplejson")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+
+import sys
+sys.path.append("src")
+
+import codec
+from compact_event import CompactEvent
+from constants import DEFAULT_PUBKEY_CACHE_SIZE
+from event import EventKinds, TextEvent
+from event_builder import EventBuilder
+from filters import CompiledFilter
+from key_pair import KeyPair
+from verifier import verify_event
+
+
+class CompactEventTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.keys = KeyPair.create_new_key_pair()
+        self.pubkey = self.keys.pubkey_hex_string()
+        event = TextEvent(self.pubkey, "héllo 😀\n")
+        event.tag_user(self.pubkey, "wss://relay.example.com")
+        event.tag_event("e" * 64)
+        self.base_event = event
+        _, message = EventBuilder(self.keys).build(event, created_at=1700000000)
+        self.wire_event = codec.loads(message)[1]
+
+    def test_round_trips_with_the_wire_format(self):
+        compact = CompactEvent.from_dict(self.wire_event)
+        self.assertEqual(len(compact.id), 32)
+        self.assertEqual(len(compact.pubkey), 32)
+        self.assertEqual(len(compact.sig), 64)
+        self.assertIsInstance(compact.tags[0], tuple)
+        self.assertEqual(compact.to_dict(), self.wire_event)
+        self.assertEqual(CompactEvent.from_json(compact.to_json()), compact)
+        self.assertTrue(verify_event(compact.to_dict()))
+
+    def test_keeps_tag_values_that_are_not_lowercase_hex(self):
+        wire = dict(self.wire_event, tags=[["e", "E" * 64], ["t", "x" * 64], ["r", "wss://a"], []])
+        self.assertEqual(CompactEvent.from_dict(wire).to_dict(), wire)
+
+    def test_round_trips_with_base_event(self):
+        wire = self.wire_event
+        compact = CompactEvent.from_base_event(self.base_event, wire["created_at"], wire["id"], wire["sig"])
+        self.assertEqual(compact, CompactEvent.from_dict(wire))
+        base_event = compact.to_base_event()
+        self.assertEqual(base_event.kind, EventKinds.TEXT_NOTE)
+        self.assertEqual(base_event.author, self.pubkey)
+        self.assertEqual(base_event.tags, self.base_event.tags)
+        self.assertEqual(base_event.content, self.base_event.content)
+
+    def test_any_kind_turns_back_into_a_base_event(self):
+        compact = CompactEvent.from_dict(dict(self.wire_event, kind=30023))
+        base_event = compact.to_base_event()
+        self.assertEqual(base_event.kind, 30023)
+        self.assertEqual(base_event.get_kind(), 30023)
+
+    def test_shares_public_keys_and_tag_names(self):
+        first = CompactEvent.from_dict(self.wire_event)
+        second = CompactEvent.from_dict(dict(self.wire_event))
+        self.assertIs(first.pubkey, second.pubkey)
+        self.assertIs(first.tags[0][0], second.tags[0][0])
+        self.assertFalse(hasattr(first, "__dict__"))
+
+    def test_only_public_keys_are_interned(self):
+        first = CompactEvent.from_dict(self.wire_event)
+        for number in range(DEFAULT_PUBKEY_CACHE_SIZE):
+            event_id = "%064x" % number
+            CompactEvent.from_dict(dict(self.wire_event, tags=[["e", event_id]]))
+        # Unique "e" ids didn't push the author out of the cache.
+        self.assertIs(CompactEvent.from_dict(dict(self.wire_event)).pubkey, first.pubkey)
+        self.assertIs(CompactEvent.from_dict(dict(self.wire_event)).tags[0][1], first.pubkey)
+
+    def test_can_be_matched_against_filters(self):
+        compact = CompactEvent.from_dict(self.wire_event)
+        self.assertTrue(CompiledFilter({"authors": [self.pubkey[:8]], "#p": [self.pubkey], "kinds": [1]}).matches(compact))
+        self.assertFalse(CompiledFilter({"#e": ["f" * 64]}).matches(compact))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import json
+import unittest
+
+import sys
+sys.path.append("src")
+
+from event import BaseEvent, TextEvent
+from event_builder import EventBuilder
+from key_pair import KeyPair
+from verifier import verify_event
+
+
+class EventBuilderTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.keys = KeyPair.create_new_key_pair()
+        self.builder = EventBuilder(self.keys)
+        self.event = TextEvent(self.keys.pubkey_hex_string(), "Hello there")
+        self.event.tag_user(self.keys.pubkey_hex_string(), "wss://relay.example")
+
+    def test_message_is_a_valid_signed_event(self):
+        event_id, message = self.builder.build(self.event)
+        message_type, event = json.loads(message)
+        self.assertEqual(message_type, "EVENT")
+        self.assertEqual(event["id"], event_id)
+        self.assertEqual(event["pubkey"], self.keys.pubkey_hex_string())
+        self.assertEqual(event["kind"], 1)
+        self.assertEqual(event["tags"], self.event.tags)
+        self.assertEqual(event["content"], "Hello there")
+        self.assertTrue(verify_event(event))
+
+    def test_id_matches_stamped_event(self):
+        event_id, message = self.builder.build(self.event)
+        created_at = json.loads(message)[1]["created_at"]
+        serialized = json.dumps(
+            [0, self.event.author, created_at, 1, self.event.tags, self.event.content],
+            separators=(',', ':'), ensure_ascii=False,
+        ).encode()
+        self.assertEqual(event_id, BaseEvent.get_id_from_stamped_event(serialized))
+
+    def test_content_needing_escapes(self):
+        event = TextEvent(self.keys.pubkey_hex_string(), 'Quote " backslash \\ newline \n ሰላም')
+        _, message = self.builder.build(event)
+        decoded = json.loads(message)[1]
+        self.assertEqual(decoded["content"], event.content)
+        self.assertTrue(verify_event(decoded))
+
+    def test_build_many_uses_one_timestamp(self):
+        events = [TextEvent(self.keys.pubkey_hex_string(), str(i)) for i in range(3)]
+        built = self.builder.build_many(events, created_at=1700000000)
+        self.assertEqual(len(built), 3)
+        for event_id, message in built:
+            self.assertEqual(json.loads(message)[1]["created_at"], 1700000000)
+
+
+if __name__ == '__main__':
+    unittest.main()
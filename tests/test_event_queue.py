@@ -0,0 +1,134 @@
+import asyncio
+import tempfile
+import time
+import unittest
+
+import sys
+sys.path.append("src")
+
+from event import TextEvent
+from event_builder import EventBuilder
+from event_queue import BoundedEventQueue, OverflowPolicy, QueueClosed
+from key_pair import KeyPair
+from mock_relay import MockRelay
+from relay_pool import RelayPool
+from request import Request
+
+
+async def drain(queue):
+    items = []
+    queue.close()
+    while True:
+        try:
+            items.append(await queue.get())
+        except QueueClosed:
+            return items
+
+
+class BoundedEventQueueTests(unittest.TestCase):
+    def test_drop_newest_keeps_the_first_items(self):
+        queue = BoundedEventQueue(3, OverflowPolicy.DROP_NEWEST)
+        for item in range(5):
+            self.assertIsNone(queue.put(item))
+        self.assertEqual(queue.dropped, 2)
+        self.assertEqual(asyncio.run(drain(queue)), [0, 1, 2])
+
+    def test_drop_oldest_keeps_the_last_items(self):
+        queue = BoundedEventQueue(3, OverflowPolicy.DROP_OLDEST)
+        for item in range(5):
+            queue.put(item)
+        self.assertEqual(queue.dropped, 2)
+        self.assertEqual(queue.max_depth, 3)
+        self.assertEqual(asyncio.run(drain(queue)), [2, 3, 4])
+
+    def test_spill_to_disk_keeps_every_item_in_order(self):
+        with tempfile.TemporaryDirectory() as directory:
+            queue = BoundedEventQueue(3, OverflowPolicy.SPILL_TO_DISK, directory)
+            for item in range(10):
+                queue.put(["relay", item])
+            self.assertEqual(queue.depth, 10)
+            self.assertEqual(queue.spilled, 7)
+            self.assertEqual(queue.dropped, 0)
+
+            async def get_some_then_put_more():
+                first = [await queue.get() for _ in range(4)]
+                for item in range(10, 12):
+                    queue.put(["relay", item])
+                return first + await drain(queue)
+
+            items = asyncio.run(get_some_then_put_more())
+            self.assertEqual([item for _, item in items], list(range(12)))
+
+    def test_block_waits_until_there_is_room(self):
+        async def run():
+            queue = BoundedEventQueue(2, OverflowPolicy.BLOCK)
+            self.assertIsNone(queue.put(0))
+            self.assertIsNone(queue.put(1))
+            waiter = asyncio.ensure_future(queue.put(2))
+            await asyncio.sleep(0.01)
+            self.assertFalse(waiter.done())
+            self.assertEqual(await queue.get(), 0)
+            await asyncio.wait_for(waiter, 1)
+            return await drain(queue)
+
+        self.assertEqual(asyncio.run(run()), [1, 2])
+
+    def test_close_releases_blocked_producers(self):
+        async def run():
+            queue = BoundedEventQueue(1, OverflowPolicy.BLOCK)
+            queue.put(0)
+            waiter = asyncio.ensure_future(queue.put(1))
+            await asyncio.sleep(0.01)
+            queue.close()
+            await asyncio.wait_for(waiter, 1)
+            return await drain(queue)
+
+        self.assertEqual(asyncio.run(run()), [0])
+
+
+class SubscriptionBackpressureTests(unittest.TestCase):
+    def setUp(self) -> None:
+        keys = KeyPair.create_new_key_pair()
+        self.pubkey = keys.pubkey_hex_string()
+        self.pool = RelayPool([])
+        self.pool.start()
+        self.addCleanup(self.pool.close)
+        relay = MockRelay()
+        url = self.pool.run(relay.start())
+        self.addCleanup(lambda: self.pool.run(relay.stop()))
+        self.pool.add_relays([url])
+        events = [TextEvent(self.pubkey, str(i)) for i in range(20)]
+        self.pool.run(self.pool.publish_many(EventBuilder(keys).build_many(events)))
+        self.request = Request.setup_subscription_with_params("reader", authors=[self.pubkey], limit=20)
+
+    def test_full_queue_holds_up_the_relay(self):
+        subscription = self.pool.run(self.pool.subscribe(self.request, queue_size=5))
+        time.sleep(0.3)
+        self.assertEqual(subscription.queue_depth, 5)
+        self.assertFalse(subscription.reached_eose())
+
+        async def consume():
+            events = []
+            async for _, event in subscription:
+                events.append(event)
+                if len(events) == 20:
+                    break
+            await subscription.wait_for_eose(timeout=5)
+            await subscription.close()
+            return events
+
+        self.assertEqual(len(self.pool.run(consume())), 20)
+        self.assertTrue(subscription.reached_eose())
+        self.assertEqual(subscription.dropped, 0)
+
+    def test_drop_policy_counts_dropped_events(self):
+        subscription = self.pool.run(self.pool.subscribe(
+            self.request, queue_size=5, overflow_policy=OverflowPolicy.DROP_NEWEST))
+        self.assertTrue(self.pool.run(subscription.wait_for_eose(timeout=5)))
+        self.assertEqual(subscription.queue_depth, 5)
+        self.assertEqual(subscription.dropped, 15)
+        self.pool.run(subscription.close())
+
+
+if __name__ == "__main__":
+    unittest.main()
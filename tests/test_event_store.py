@@ -0,0 +1,63 @@
+import unittest
+
+import sys
+sys.path.append("src")
+
+from event_store import EventStore
+
+
+def make_event(event_id, pubkey="aa" * 32, created_at=100, kind=1, tags=None):
+    return {
+        "id": event_id,
+        "pubkey": pubkey,
+        "created_at": created_at,
+        "kind": kind,
+        "tags": tags or [],
+        "content": "",
+        "sig": "",
+    }
+
+
+class EventStoreTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.store = EventStore(":memory:")
+        self.events = [
+            make_event("01" * 32, created_at=100),
+            make_event("02" * 32, created_at=200, kind=0),
+            make_event("03" * 32, pubkey="bb" * 32, created_at=300, tags=[["e", "01" * 32], ["p", "aa" * 32]]),
+        ]
+        self.store.add_many(self.events)
+
+    def tearDown(self) -> None:
+        self.store.close()
+
+    def ids(self, filters):
+        return [event["id"] for event in self.store.query(filters)]
+
+    def test_add_ignores_duplicates(self):
+        self.assertFalse(self.store.add(self.events[0]))
+        self.assertEqual(len(self.store), 3)
+        self.assertEqual(self.store.get("01" * 32), self.events[0])
+
+    def test_query_by_fields(self):
+        self.assertEqual(self.ids({"authors": ["aa" * 32]}), ["02" * 32, "01" * 32])
+        self.assertEqual(self.ids({"authors": ["bb"]}), ["03" * 32])
+        self.assertEqual(self.ids({"ids": ["0"], "kinds": [1]}), ["03" * 32, "01" * 32])
+        self.assertEqual(self.ids({"since": "150", "until": 250}), ["02" * 32])
+        self.assertEqual(self.ids({"#e": ["01" * 32]}), ["03" * 32])
+        self.assertEqual(self.ids({"#p": ["bb" * 32]}), [])
+        self.assertEqual(self.ids({"kinds": []}), [])
+
+    def test_query_applies_limit_per_filter(self):
+        self.assertEqual(self.ids({"limit": 2}), ["03" * 32, "02" * 32])
+        self.assertEqual(self.ids([{"kinds": [0]}, {"authors": ["bb"]}]), ["03" * 32, "02" * 32])
+
+    def test_delta_filter_starts_at_newest_stored_event(self):
+        self.assertEqual(self.store.delta_filter({"authors": ["aa" * 32], "limit": 1}),
+                         {"authors": ["aa" * 32], "limit": 1, "since": 200})
+        self.assertEqual(self.store.delta_filter({"authors": ["cc" * 32]}), {"authors": ["cc" * 32]})
+        self.assertEqual(self.store.delta_filter({"kinds": [0], "since": 500}), {"kinds": [0], "since": 500})
+
+
+if __name__ == '__main__':
+    unittest.main()
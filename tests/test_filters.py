@@ -0,0 +1,104 @@
+import random
+import unittest
+
+import sys
+sys.path.append("src")
+
+from filters import CompiledFilter, CompiledFilters, FilterIndex, PrefixIndex, canonical_filter
+
+
+def make_event(event_id="ab" * 32, pubkey="12" * 32, created_at=100, kind=1, tags=None):
+    return {"id": event_id, "pubkey": pubkey, "created_at": created_at, "kind": kind,
+            "tags": tags if tags is not None else [["e", "ef" * 32], ["p", "56" * 32]], "content": ""}
+
+
+class PrefixIndexTests(unittest.TestCase):
+    def test_lookup_finds_exact_keys_and_prefixes(self):
+        index = PrefixIndex()
+        index.add("ab" * 32, "exact")
+        index.add("ab", "short")
+        index.add("abab", "longer")
+        index.add("ac", "other")
+        self.assertEqual(sorted(index.lookup("ab" * 32)), ["exact", "longer", "short"])
+        self.assertEqual(index.lookup("ac" + "0" * 62), ["other"])
+        self.assertIn("abff", index)
+        self.assertNotIn("ff", index)
+
+
+class CanonicalFilterTests(unittest.TestCase):
+    def test_sorts_dedupes_and_types_the_fields(self):
+        canonical = canonical_filter({"limit": "20", "kinds": ["7", 1, "1"], "authors": ["bb", "aa", "bb"],
+                                      "since": " 100", "search": "nostr"})
+        self.assertEqual(canonical, {"authors": ["aa", "bb"], "kinds": [1, 7], "limit": 20, "search": "nostr",
+                                     "since": 100})
+        self.assertEqual(list(canonical), ["authors", "kinds", "limit", "search", "since"])
+
+    def test_rejects_values_that_are_not_integers(self):
+        for subscription_filter in [{"limit": "ten"}, {"since": 1.5}, {"until": True}, {"kinds": ["x"]}]:
+            with self.subTest(subscription_filter=subscription_filter), self.assertRaises(ValueError):
+                canonical_filter(subscription_filter)
+
+
+class CompiledFilterTests(unittest.TestCase):
+    def test_matches_each_field(self):
+        event = make_event()
+        self.assertTrue(CompiledFilter({}).matches(event))
+        self.assertTrue(CompiledFilter({"ids": ["ab"], "authors": ["12" * 32], "kinds": [1]}).matches(event))
+        self.assertTrue(CompiledFilter({"#e": ["ef" * 32], "#p": ["56" * 32], "since": 100, "until": "100"}).matches(event))
+        self.assertFalse(CompiledFilter({"ids": ["ac"]}).matches(event))
+        self.assertFalse(CompiledFilter({"authors": ["13"]}).matches(event))
+        self.assertFalse(CompiledFilter({"kinds": [0]}).matches(event))
+        self.assertFalse(CompiledFilter({"#p": ["ef" * 32]}).matches(event))
+        self.assertFalse(CompiledFilter({"since": "101"}).matches(event))
+        self.assertFalse(CompiledFilter({"until": 99}).matches(event))
+
+    def test_filters_are_ored(self):
+        filters = CompiledFilters([{"kinds": [0]}, {"authors": ["12"]}])
+        self.assertTrue(filters.matches(make_event()))
+        self.assertFalse(filters.matches(make_event(pubkey="34" * 32)))
+
+
+class FilterIndexTests(unittest.TestCase):
+    def test_routes_events_to_matching_subscriptions(self):
+        index = FilterIndex()
+        index.add("by id", {"ids": ["ab"]})
+        index.add("by author", {"authors": ["12" * 32], "kinds": [0]})
+        index.add("by tag", {"#e": ["ef" * 32], "#p": ["00", "11", "22"]})
+        index.add("by kind", [{"kinds": [1]}, {"kinds": [2]}])
+        index.add("everything", {"since": 50})
+        event = make_event(tags=[["e", "ef" * 32], ["p", "11"]])
+        self.assertEqual(index.match(event), {"by id", "by tag", "by kind", "everything"})
+
+        index.remove("by kind")
+        self.assertNotIn("by kind", index.match(event))
+        self.assertEqual(len(index), 4)
+
+    def test_agrees_with_a_linear_scan(self):
+        rng = random.Random(1)
+        hex_value = lambda length: "".join(rng.choice("0123456789abcdef") for _ in range(length))
+        authors = [hex_value(64) for _ in range(20)]
+        filters = {}
+        for i in range(200):
+            choice = i % 4
+            if choice == 0:
+                filters[i] = {"authors": rng.sample(authors, 3), "kinds": [1]}
+            elif choice == 1:
+                filters[i] = {"ids": [hex_value(2)]}
+            elif choice == 2:
+                filters[i] = {"#p": rng.sample(authors, 2)}
+            else:
+                filters[i] = {"kinds": [rng.randint(0, 3)], "since": rng.randint(0, 200)}
+        index = FilterIndex()
+        for key, subscription_filter in filters.items():
+            index.add(key, subscription_filter)
+
+        for _ in range(500):
+            event = make_event(hex_value(64), rng.choice(authors), rng.randint(0, 200), rng.randint(0, 3),
+                               [["p", rng.choice(authors)]])
+            expected = {key for key, subscription_filter in filters.items()
+                        if CompiledFilter(subscription_filter).matches(event)}
+            self.assertEqual(index.match(event), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
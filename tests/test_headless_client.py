@@ -0,0 +1,142 @@
+import asyncio
+import io
+import json
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import sys
+sys.path.append("src")
+
+import cli
+from constants import KEY_PASSWORD_ENV
+from event import TextEvent
+from headless_client import HeadlessClient
+from key_pair import KeyPair, encrypt_private_key
+from mock_relay import MockRelay
+from request import Request
+
+
+class HeadlessClientTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.keys = KeyPair.create_new_key_pair()
+
+    def test_publish_and_query_on_the_callers_loop(self):
+        async def scenario():
+            relay = MockRelay(verify=True)
+            url = await relay.start()
+            try:
+                async with HeadlessClient(self.keys, [url], publish_timeout=2) as client:
+                    events = [TextEvent(self.keys.pubkey_hex_string(), str(i)) for i in range(4)]
+                    report = await client.publish(events)
+                    request = Request.setup_subscription_with_params("me", authors=[self.keys.pubkey_hex_string()])
+                    received = [event async for _, event in client.query(request, timeout=5)]
+                return report, received
+            finally:
+                await relay.stop()
+
+        report, received = asyncio.run(scenario())
+        self.assertEqual(len(report.accepted_events()), 4)
+        self.assertEqual(sorted(event["content"] for event in received), ["0", "1", "2", "3"])
+
+    def test_publishing_needs_keys(self):
+        async def scenario():
+            async with HeadlessClient(None, []) as client:
+                await client.publish([TextEvent(self.keys.pubkey_hex_string(), "hi")])
+
+        with self.assertRaises(ValueError):
+            asyncio.run(scenario())
+
+
+class CliTests(unittest.TestCase):
+    def setUp(self) -> None:
+        # The CLI runs its own event loop, so the relay gets one in another thread.
+        self.loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        thread.start()
+        self.relay = MockRelay(verify=True)
+        self.url = self.run_on_relay_loop(self.relay.start())
+        self.addCleanup(self.loop.close)
+        self.addCleanup(thread.join)
+        self.addCleanup(lambda: self.loop.call_soon_threadsafe(self.loop.stop))
+        self.addCleanup(lambda: self.run_on_relay_loop(self.relay.stop()))
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.keys = KeyPair.create_new_key_pair()
+        self.key_file = os.path.join(directory.name, "keys")
+        with open(self.key_file, "wb") as f:
+            f.write(encrypt_private_key(bytes.fromhex(self.keys.privkey_hex_string()), "secret", n=2 ** 4))
+        environment = mock.patch.dict(os.environ, {KEY_PASSWORD_ENV: "secret"})
+        environment.start()
+        self.addCleanup(environment.stop)
+        self.common = ["--relay", self.url, "--key-file", self.key_file,
+                       "--agent-socket", os.path.join(directory.name, "missing.sock"), "--timeout", "2"]
+
+    def run_on_relay_loop(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(5)
+
+    def run_cli(self, arguments, stdin=""):
+        output = io.StringIO()
+        code = cli.main(self.common + arguments, io.StringIO(stdin), output)
+        return code, [json.loads(line) for line in output.getvalue().splitlines()]
+
+    def test_publish_from_stdin_then_query(self):
+        code, published = self.run_cli(["publish", "--batch-size", "2"], "one\ntwo\n\nthree\n")
+        self.assertEqual(code, 0)
+        self.assertEqual(len(published), 3)
+        self.assertTrue(all(line["accepted"] for line in published))
+        self.assertEqual(published[0]["results"][0]["relay"], self.url)
+        self.assertEqual(published[0]["results"][0]["status"], "accepted")
+
+        code, events = self.run_cli(["query", "--author", self.keys.pubkey_hex_string(), "--kind", "1"])
+        self.assertEqual(code, 0)
+        self.assertEqual(sorted(event["content"] for event in events), ["one", "three", "two"])
+        self.assertEqual({event["id"] for event in events}, {line["id"] for line in published})
+
+    def test_publish_ndjson_input_with_tags(self):
+        note = {"content": "tagged", "kind": 30023, "tags": [["t", "nostr"]]}
+        code, published = self.run_cli(["publish", "--ndjson-input"], json.dumps(note) + "\n")
+        self.assertEqual(code, 0)
+        code, events = self.run_cli(["query", "--filter", '{"#t": ["nostr"]}', "--with-relay"])
+        self.assertEqual(events, [{"relay": self.url, "event": self.relay.events[published[0]["id"]]}])
+        self.assertEqual(events[0]["event"]["kind"], 30023)
+
+    def test_publish_ndjson_input_with_malformed_tags(self):
+        for tags in [5, ["t"], [["t", 1]]]:
+            line = json.dumps({"content": "x", "tags": tags}) + "\n"
+            with self.subTest(tags=tags), mock.patch("sys.stderr", io.StringIO()):
+                self.assertEqual(self.run_cli(["publish", "--ndjson-input"], line), (2, []))
+        self.assertEqual(self.relay.events, {})
+
+    def test_sync_prints_only_new_events(self):
+        self.run_cli(["publish"], "one\ntwo\n")
+        sync = ["sync", "--kind", "1", "--store", os.path.join(self.directory, "events.db"),
+                "--state", os.path.join(self.directory, "sync.db")]
+        code, events = self.run_cli(sync)
+        self.assertEqual((code, sorted(event["content"] for event in events)), (0, ["one", "two"]))
+        self.assertEqual(self.run_cli(sync), (0, []))
+        self.run_cli(["publish", "--content", "three"])
+        self.assertEqual([event["content"] for event in self.run_cli(sync)[1]], ["three"])
+
+    def test_metrics_file(self):
+        metrics_file = os.path.join(self.directory, "metrics.prom")
+        code, _ = self.run_cli(["--metrics-file", metrics_file, "publish", "--content", "hi"])
+        self.assertEqual(code, 0)
+        with open(metrics_file) as f:
+            self.assertIn(f'nostr_publish_results_total{{relay="{self.url}",status="accepted"}} 1', f.read())
+
+    def test_errors_are_reported_without_prompting(self):
+        with mock.patch.dict(os.environ, {KEY_PASSWORD_ENV: "wrong"}), mock.patch("sys.stderr", io.StringIO()):
+            code, output = self.run_cli(["publish", "--content", "hi"])
+        self.assertEqual(code, 2)
+        self.assertEqual(output, [])
+        code, output = self.run_cli(["pubkey"])
+        self.assertEqual(output, [{"pubkey": self.keys.pubkey_hex_string()}])
+
+
+if __name__ == "__main__":
+    unittest.main()
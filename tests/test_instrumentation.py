@@ -0,0 +1,138 @@
+import json
+import unittest
+from contextlib import contextmanager
+
+import sys
+sys.path.append("src")
+
+import instrumentation
+from event import TextEvent
+from event_builder import EventBuilder
+from instrumentation import JsonLogFormatter, NullRecorder, OpenTelemetryRecorder, PrometheusRecorder
+from key_pair import KeyPair
+from mock_relay import MockRelay
+from relay_pool import RelayPool
+from request import Request
+
+
+class FakeInstrument:
+    def __init__(self):
+        self.calls = []
+
+    def add(self, amount, attributes):
+        self.calls.append((amount, attributes))
+
+    record = add
+
+
+class FakeMeter:
+    def __init__(self):
+        self.instruments = {}
+
+    def _create(self, name, description=""):
+        return self.instruments.setdefault(name, FakeInstrument())
+
+    create_counter = create_up_down_counter = create_histogram = _create
+
+
+class FakeTracer:
+    def __init__(self):
+        self.spans = []
+
+    @contextmanager
+    def start_as_current_span(self, name, attributes=None):
+        self.spans.append((name, attributes))
+        yield
+
+
+class RecorderTests(unittest.TestCase):
+    def test_prometheus_text(self):
+        recorder = PrometheusRecorder(buckets=(0.1, 1))
+        recorder.increment("nostr_messages_sent_total", relay='wss://a"b')
+        recorder.increment("nostr_messages_sent_total", 2, relay='wss://a"b')
+        recorder.set_gauge("nostr_queue_depth", 7, subscription="s")
+        recorder.observe("nostr_ok_latency_seconds", 0.05)
+        recorder.observe("nostr_ok_latency_seconds", 3.0)
+        self.assertEqual(recorder.value("nostr_messages_sent_total", relay='wss://a"b'), 3)
+        self.assertEqual(recorder.render().splitlines(), [
+            "# HELP nostr_messages_sent_total Messages sent to relays",
+            "# TYPE nostr_messages_sent_total counter",
+            'nostr_messages_sent_total{relay="wss://a\\"b"} 3',
+            "# HELP nostr_ok_latency_seconds Time from sending an event to the relay's OK",
+            "# TYPE nostr_ok_latency_seconds histogram",
+            'nostr_ok_latency_seconds_bucket{le="0.1"} 1',
+            'nostr_ok_latency_seconds_bucket{le="1"} 1',
+            'nostr_ok_latency_seconds_bucket{le="+Inf"} 2',
+            "nostr_ok_latency_seconds_count 2",
+            "nostr_ok_latency_seconds_sum 3.05",
+            "# HELP nostr_queue_depth Events waiting to be consumed, per subscription",
+            "# TYPE nostr_queue_depth gauge",
+            'nostr_queue_depth{subscription="s"} 7',
+        ])
+
+    def test_opentelemetry_spans_and_instruments(self):
+        tracer, meter = FakeTracer(), FakeMeter()
+        recorder = OpenTelemetryRecorder(tracer, meter)
+        with recorder.time("nostr_sign_seconds", relay="r"):
+            pass
+        recorder.set_gauge("nostr_queue_depth", 5)
+        recorder.set_gauge("nostr_queue_depth", 2)
+        self.assertEqual(tracer.spans, [("nostr_sign_seconds", {"relay": "r"})])
+        self.assertEqual(len(meter.instruments["nostr_sign_seconds"].calls), 1)
+        self.assertEqual(meter.instruments["nostr_queue_depth"].calls, [(5, {}), (-3, {})])
+
+    def test_json_logs(self):
+        record = instrumentation.logger.makeRecord("nostr", 10, __file__, 1, "Signed event", (), None,
+                                                   extra={"event": {"id": "ab"}})
+        line = json.loads(JsonLogFormatter().format(record))
+        self.assertEqual((line["level"], line["message"], line["event"]), ("debug", "Signed event", {"id": "ab"}))
+
+    def test_nothing_is_kept_by_default(self):
+        recorder = PrometheusRecorder()
+        previous = instrumentation.set_recorder(recorder)
+        self.assertIs(instrumentation.set_recorder(None), recorder)
+        self.addCleanup(instrumentation.set_recorder, previous)
+        self.assertIsInstance(instrumentation.recorder, NullRecorder)
+        self.assertFalse(instrumentation.recorder.enabled)
+        keys = KeyPair.create_new_key_pair()
+        EventBuilder(keys).build(TextEvent(keys.pubkey_hex_string(), "hi"))
+        self.assertEqual(recorder.render(), "")
+
+
+class InstrumentedClientTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.recorder = PrometheusRecorder()
+        previous = instrumentation.set_recorder(self.recorder)
+        self.addCleanup(instrumentation.set_recorder, previous)
+        self.pool = RelayPool([], publish_timeout=5)
+        self.pool.start()
+        self.addCleanup(self.pool.close)
+        self.relay = MockRelay()
+        self.url = self.pool.run(self.relay.start())
+        self.addCleanup(lambda: self.pool.run(self.relay.stop()))
+        self.pool.add_relays([self.url])
+
+    def test_publish_and_subscribe_are_recorded(self):
+        keys = KeyPair.create_new_key_pair()
+        signed_events = EventBuilder(keys).build_many([TextEvent(keys.pubkey_hex_string(), str(i)) for i in range(3)])
+        self.pool.run(self.pool.publish_many(signed_events))
+        self.assertEqual(self.recorder.value("nostr_serialize_seconds"), 3)
+        self.assertEqual(self.recorder.value("nostr_sign_seconds"), 3)
+        self.assertEqual(self.recorder.value("nostr_connect_seconds", relay=self.url), 1)
+        self.assertEqual(self.recorder.value("nostr_ok_latency_seconds", relay=self.url), 3)
+        self.assertEqual(self.recorder.value("nostr_publish_results_total", relay=self.url, status="accepted"), 3)
+
+        request = Request.setup_subscription_with_params("me", event_kinds=[1])
+        subscription = self.pool.run(self.pool.subscribe(request))
+        self.pool.run(subscription.wait_for_eose(5))
+        self.assertEqual(self.recorder.value("nostr_events_received_total", relay=self.url), 3)
+        self.assertEqual(self.recorder.value("nostr_queue_depth", subscription=request.subscription_id), 3)
+        self.pool.run(subscription.__anext__())
+        self.assertEqual(self.recorder.value("nostr_queue_depth", subscription=request.subscription_id), 2)
+        self.pool.run(subscription.close())
+        # Three EVENTs, the REQ and the CLOSE.
+        self.assertEqual(self.recorder.value("nostr_messages_sent_total", relay=self.url), 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import os
+import stat
+import tempfile
+import unittest
+
+import sys
+sys.path.append("src")
+
+import codec
+from event import TextEvent
+from event_builder import EventBuilder
+from key_agent import AgentKeyPair, KeyAgent, KeyAgentError
+from key_pair import KeyPair
+from verifier import verify_event
+
+
+class KeyAgentTests(unittest.TestCase):
+    def setUp(self) -> None:
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.socket_path = os.path.join(directory.name, "agent.sock")
+        self.keys = KeyPair.create_new_key_pair()
+        self.agent = KeyAgent(self.keys, self.socket_path)
+        self.agent.start()
+        self.addCleanup(self.agent.close)
+
+    def connect(self):
+        agent_keys = AgentKeyPair(self.socket_path)
+        self.addCleanup(agent_keys.close)
+        return agent_keys
+
+    def test_signs_for_clients(self):
+        agent_keys = self.connect()
+        self.assertEqual(agent_keys.pubkey_hex_string(), self.keys.pubkey_hex_string())
+        message = bytes(range(32))
+        signature = agent_keys.sign_bytes(message)
+        self.assertTrue(self.keys.verify_signature(message.hex(), signature))
+        self.assertTrue(agent_keys.verify_signature(message.hex(), signature))
+        with self.assertRaises(KeyAgentError):
+            agent_keys.privkey_hex_string()
+
+    def test_events_built_through_the_agent_are_valid(self):
+        agent_keys = self.connect()
+        _, message = EventBuilder(agent_keys).build(TextEvent(agent_keys.pubkey_hex_string(), "signed elsewhere"))
+        self.assertTrue(verify_event(codec.loads(message)[1]))
+
+    def test_socket_is_private(self):
+        self.assertEqual(stat.S_IMODE(os.stat(self.socket_path).st_mode), 0o600)
+
+    def test_refuses_to_replace_a_running_agent(self):
+        with self.assertRaises(KeyAgentError):
+            KeyAgent(self.keys, self.socket_path).start()
+
+    def test_reconnects_after_a_restart(self):
+        agent_keys = self.connect()
+        self.agent.close()
+        with self.assertRaises(KeyAgentError):
+            agent_keys.sign_bytes(b"\x00" * 32)
+        self.agent = KeyAgent(self.keys, self.socket_path)
+        self.agent.start()
+        self.addCleanup(self.agent.close)
+        self.assertEqual(len(agent_keys.sign_raw_bytes(b"\x00" * 32)), 64)
+
+    def test_unreachable_agent(self):
+        with self.assertRaises(KeyAgentError):
+            AgentKeyPair(self.socket_path + ".missing")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,10 +1,15 @@
+import hashlib
+import os
 import unittest
+from base64 import b64encode
 from unittest.mock import patch
 
+from cryptography.fernet import Fernet, InvalidToken
+
 import sys
 sys.path.append("src")
 
-from key_pair import KeyPair
+from key_pair import KeyPair, SCRYPT_HEADER, decrypt_private_key, encrypt_private_key
 
 
 class KeyPairTests(unittest.TestCase):
@@ -31,6 +36,32 @@ class KeyPairTests(unittest.TestCase):
         self.assertEqual(public_key_str, loaded_public_key)
         self.key_pair.delete_key_file()
     
+    def test_key_files_are_salted(self):
+        password = "test123"
+        first = encrypt_private_key(b"\x01" * 32, password, n=2 ** 10)
+        second = encrypt_private_key(b"\x01" * 32, password, n=2 ** 10)
+        self.assertTrue(first.startswith(SCRYPT_HEADER + b"1024$"))
+        self.assertNotEqual(first, second)
+        self.assertEqual(decrypt_private_key(first, password), b"\x01" * 32)
+        with self.assertRaises(InvalidToken):
+            decrypt_private_key(first, "wrong")
+
+    def test_unsalted_key_files_are_upgraded(self):
+        test_file_name = "mykeys_test_upgrade"
+        password = "test123"
+        self.addCleanup(os.remove, test_file_name)
+        legacy_key = b64encode(hashlib.sha256(password.encode('utf-8')).digest())
+        with open(test_file_name, 'wb') as key_file:
+            key_file.write(Fernet(legacy_key).encrypt(self.key_pair._private_key_bytes()))
+
+        with unittest.mock.patch("base_interface.BaseInterface.get_password", return_value=password):
+            loaded_keys = KeyPair.load_key_pair(test_file_name)
+        self.assertEqual(loaded_keys.pubkey_hex_string(), self.key_pair.pubkey_hex_string())
+        with open(test_file_name, 'rb') as key_file:
+            self.assertTrue(key_file.read().startswith(SCRYPT_HEADER))
+        with unittest.mock.patch("base_interface.BaseInterface.get_password", return_value=password):
+            self.assertEqual(KeyPair.load_key_pair(test_file_name).pubkey_hex_string(), self.key_pair.pubkey_hex_string())
+
     def test_signature(self):
         content = b"Hello world, this is a test message."
         signature = self.key_pair.sign_bytes(content)
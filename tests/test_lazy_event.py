@@ -0,0 +1,82 @@
+import json
+import unittest
+
+import sys
+sys.path.append("src")
+
+from lazy_event import LazyEvent, decoded_frame, parse_frame
+from request import Request
+from subscription import Subscription
+
+
+def make_event(event_id, kind=1, content=""):
+    return {"id": event_id, "pubkey": "ab" * 32, "created_at": 100, "kind": kind, "tags": [["t", "x"]],
+            "content": content, "sig": "cd" * 64}
+
+
+def event_frame(event, subscription_id="sub"):
+    return json.dumps(["EVENT", subscription_id, event])
+
+
+class StubManager:
+    relay_urls = ["wss://relay"]
+
+
+class LazyEventTests(unittest.TestCase):
+    def test_reads_cheap_fields_without_parsing(self):
+        event = make_event("1" * 64, kind=7)
+        frame = parse_frame(event_frame(event))
+        self.assertEqual(frame[:2], ["EVENT", "sub"])
+        lazy = frame[2]
+        self.assertIsInstance(lazy, LazyEvent)
+        self.assertEqual(lazy["id"], event["id"])
+        self.assertEqual(lazy["pubkey"], event["pubkey"])
+        self.assertEqual(lazy["kind"], 7)
+        self.assertEqual(lazy["created_at"], 100)
+        self.assertFalse(lazy.is_decoded())
+        self.assertEqual(lazy["tags"], [["t", "x"]])
+        self.assertTrue(lazy.is_decoded())
+        self.assertEqual(lazy.decode(), event)
+
+    def test_content_cannot_fake_the_fields(self):
+        content = '{"id":"' + "f" * 64 + '","kind":3}'
+        event = dict(make_event("1" * 64), content=content)
+        # Put the content first so that it is seen before the real fields.
+        reordered = {"content": content, **{key: value for key, value in event.items() if key != "content"}}
+        lazy = parse_frame(event_frame(reordered))[2]
+        self.assertEqual(lazy["id"], "1" * 64)
+        self.assertEqual(lazy["kind"], 1)
+
+    def test_other_frames_are_parsed_in_full(self):
+        self.assertEqual(parse_frame('["EOSE","sub"]'), ["EOSE", "sub"])
+        self.assertEqual(parse_frame('["OK","ab",true,""]'), ["OK", "ab", True, ""])
+        escaped = parse_frame(json.dumps(["EVENT", 'quote"d', make_event("1")]))
+        self.assertEqual(escaped[2]["id"], "1")
+        self.assertEqual(decoded_frame(parse_frame(event_frame(make_event("2"))))[2], make_event("2"))
+        with self.assertRaises(ValueError):
+            parse_frame('["NOTICE", ')
+
+    def test_subscription_drops_duplicates_and_mismatches_without_parsing(self):
+        subscription = Subscription(Request("me", {"kinds": [1]}), StubManager())
+        events = [parse_frame(event_frame(make_event(event_id, kind)))[2]
+                  for event_id, kind in [("1", 1), ("1", 1), ("2", 2), ("3", 1)]]
+        for event in events:
+            subscription.deliver("wss://relay", event)
+        self.assertEqual(subscription.duplicates["wss://relay"], 1)
+        self.assertEqual(subscription.mismatches["wss://relay"], 1)
+        self.assertEqual(subscription.queue_depth, 2)
+        self.assertEqual([event.is_decoded() for event in events], [True, False, False, True])
+
+    def test_subscription_drops_malformed_events(self):
+        subscription = Subscription(Request("me", {"kinds": [1]}), StubManager())
+        broken = parse_frame('["EVENT","sub",{"id":"1","kind":1,"tags":[}]')[2]
+        subscription.deliver("wss://relay", broken)
+        # Valid JSON, but with fields of the wrong types.
+        for field, value in [("created_at", "100"), ("tags", [["t", 1]]), ("sig", None)]:
+            subscription.deliver("wss://relay", parse_frame(event_frame(dict(make_event(field), **{field: value})))[2])
+        self.assertEqual(subscription.mismatches["wss://relay"], 4)
+        self.assertEqual(subscription.queue_depth, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
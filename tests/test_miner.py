@@ -0,0 +1,77 @@
+import unittest
+
+import sys
+sys.path.append("src")
+
+import codec
+from event import TextEvent
+from event_builder import EventBuilder
+from key_pair import KeyPair
+from miner import Miner, difficulty, serialization_parts
+from verifier import verify_event
+
+
+class MinerTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.keys = KeyPair.create_new_key_pair()
+        self.event = TextEvent(self.keys.pubkey_hex_string(), "mined \"note\" é")
+        self.event.tag_user(self.keys.pubkey_hex_string())
+
+    def test_difficulty(self):
+        self.assertEqual(difficulty("f" * 64), 0)
+        self.assertEqual(difficulty("000000000e9d97a1ab09fc381030b346cdd7a142ad57e6df0b46dc9bef6c7e2d"), 36)
+        self.assertEqual(difficulty("0" * 64), 256)
+
+    def test_serialization_parts_surround_the_nonce(self):
+        prefix, suffix = serialization_parts(self.event, 1700000000, 16)
+        tags = self.event.tags + [["nonce", "12345", "16"]]
+        expected = codec.canonical_event(self.event.author, 1700000000, 1, tags, self.event.content)
+        self.assertEqual(prefix + b"12345" + suffix, expected)
+
+        untagged = TextEvent(self.keys.pubkey_hex_string(), "")
+        prefix, suffix = serialization_parts(untagged, 1, 0)
+        self.assertEqual(prefix + b"7" + suffix, codec.canonical_event(untagged.author, 1, 1, [["nonce", "7", "0"]], ""))
+
+    def check_mined(self, miner, target_difficulty):
+        result = miner.mine_event(self.event, target_difficulty, created_at=1700000000)
+        self.assertEqual(self.event.tags[-1], ["nonce", str(result.value), str(target_difficulty)])
+        event_id, message = EventBuilder(self.keys).build(self.event, result.created_at)
+        self.assertEqual(event_id, result.event_id)
+        self.assertGreaterEqual(difficulty(event_id), target_difficulty)
+        self.assertTrue(verify_event(codec.loads(message)[1]))
+        self.assertGreater(result.hashes_per_second, 0)
+
+    def test_mines_events_inline(self):
+        self.check_mined(Miner(processes=0, chunk_size=1000), 8)
+
+    def test_mines_events_in_worker_processes(self):
+        with Miner(processes=2, chunk_size=1000) as miner:
+            self.check_mined(miner, 10)
+
+    def test_mines_vanity_keys(self):
+        with Miner(processes=2, chunk_size=50) as miner:
+            keys, result = miner.mine_vanity_key("AB")
+        self.assertTrue(keys.pubkey_hex_string().startswith("ab"))
+        self.assertGreaterEqual(result.attempts, 1)
+        with self.assertRaises(ValueError):
+            Miner(processes=0).mine_vanity_key("xyz")
+
+    def test_cancel_from_progress_callback(self):
+        reports = []
+
+        def progress(attempts, rate):
+            reports.append((attempts, rate))
+            if len(reports) == 3:
+                miner.cancel()
+
+        miner = Miner(processes=0, chunk_size=100, progress=progress)
+        tags = list(self.event.tags)
+        result = miner.mine_event(self.event, 200)
+        self.assertIsNone(result.value)
+        self.assertEqual(result.attempts, 300)
+        self.assertEqual([attempts for attempts, _ in reports], [100, 200, 300])
+        self.assertEqual(self.event.tags, tags)
+
+
+if __name__ == "__main__":
+    unittest.main()
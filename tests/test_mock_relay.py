@@ -0,0 +1,83 @@
+import json
+import time
+import unittest
+
+import sys
+sys.path.append("src")
+
+from event import TextEvent
+from event_builder import EventBuilder
+from key_pair import KeyPair
+from mock_relay import MockRelay
+from publish_result import PublishStatus
+from relay_pool import RelayPool
+from request import Request
+
+
+async def collect_until_eose(pool, request):
+    subscription = await pool.subscribe(request)
+    await subscription.wait_for_eose(timeout=5)
+    await subscription.close()
+    return [event async for _, event in subscription]
+
+
+class MockRelayTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.keys = KeyPair.create_new_key_pair()
+        self.builder = EventBuilder(self.keys)
+        self.pool = RelayPool([])
+        self.pool.start()
+        self.addCleanup(self.pool.close)
+
+    def start_relay(self, relay):
+        url = self.pool.run(relay.start())
+        self.addCleanup(lambda: self.pool.run(relay.stop()))
+        self.pool.add_relays([url])
+        return url
+
+    def test_stores_events_and_answers_requests(self):
+        relay = MockRelay(verify=True)
+        self.start_relay(relay)
+        events = [TextEvent(self.keys.pubkey_hex_string(), str(i)) for i in range(5)]
+        report = self.pool.run(self.pool.publish_many(self.builder.build_many(events)))
+        self.assertEqual(len(report.accepted_events()), 5)
+        self.assertEqual(len(relay.events), 5)
+
+        request = Request.setup_subscription_with_params(
+            "subscriber", authors=[self.keys.pubkey_hex_string()[:8]], limit=3)
+        received = self.pool.run(collect_until_eose(self.pool, request))
+        self.assertEqual(len(received), 3)
+
+    def test_rejects_invalid_events_when_verifying(self):
+        self.start_relay(MockRelay(verify=True))
+        event_id, message = self.builder.build(TextEvent(self.keys.pubkey_hex_string(), "hello"))
+        tampered = message.replace('"hello"', '"goodbye"')
+        results = self.pool.run(self.pool.publish_event(event_id, tampered))
+        self.assertEqual(list(results.values())[0].status, PublishStatus.REJECTED)
+
+    def test_forwards_new_events_to_open_subscriptions(self):
+        self.start_relay(MockRelay())
+        request = Request.setup_subscription_with_params("subscriber", event_kinds=[1])
+        subscription = self.pool.run(self.pool.subscribe(request))
+        self.pool.run(subscription.wait_for_eose(timeout=5))
+        event_id, message = self.builder.build(TextEvent(self.keys.pubkey_hex_string(), "live"))
+        self.pool.run(self.pool.publish_event(event_id, message))
+        self.pool.run(subscription.close())
+        self.assertEqual([event["id"] for _, event in self.pool.iterate(subscription)], [event_id])
+
+    def test_latency_and_drops(self):
+        relay = MockRelay(latency=0.2, drop_rate=1)
+        self.start_relay(relay)
+        event_id, message = self.builder.build(TextEvent(self.keys.pubkey_hex_string(), "hello"))
+        results = self.pool.run(self.pool.publish_event(event_id, message, timeout=0.3))
+        self.assertEqual(list(results.values())[0].status, PublishStatus.TIMED_OUT)
+        self.assertEqual(relay.dropped_count, 1)
+
+        relay.drop_rate = 0
+        start = time.monotonic()
+        self.pool.run(self.pool.publish_event(event_id, message, timeout=2))
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+
+
+if __name__ == '__main__':
+    unittest.main()
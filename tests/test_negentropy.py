@@ -0,0 +1,74 @@
+import random
+import unittest
+
+import sys
+sys.path.append("src")
+
+from negentropy import Negentropy, NegentropyError, encode_varint
+
+
+def random_items(rng, count):
+    return [(rng.randrange(1000, 1100), "%064x" % rng.getrandbits(256)) for _ in range(count)]
+
+
+def run(client_items, relay_items):
+    """
+    Reconciles the two sets and returns the client, the number of round trips and the bytes exchanged.
+    """
+    client = Negentropy(client_items)
+    relay = Negentropy(relay_items, initiator=False)
+    message = client.initiate()
+    round_trips = 0
+    exchanged = 0
+    while message is not None:
+        reply = relay.reconcile(message)
+        exchanged += len(message) + len(reply)
+        message = client.reconcile(reply)
+        round_trips += 1
+    return client, round_trips, exchanged
+
+
+class NegentropyTests(unittest.TestCase):
+    def test_varint(self):
+        self.assertEqual(encode_varint(0), b"\x00")
+        self.assertEqual(encode_varint(127), b"\x7f")
+        self.assertEqual(encode_varint(128), b"\x81\x00")
+        self.assertEqual(encode_varint(16384), b"\x81\x80\x00")
+
+    def test_finds_the_differences(self):
+        rng = random.Random(0)
+        for shared_count, client_only, relay_only in [(0, 0, 0), (0, 5, 0), (0, 0, 40), (3000, 0, 0),
+                                                      (3000, 7, 12), (500, 400, 300)]:
+            with self.subTest(shared=shared_count, client_only=client_only, relay_only=relay_only):
+                shared = random_items(rng, shared_count)
+                mine = random_items(rng, client_only)
+                theirs = random_items(rng, relay_only)
+                client, _, _ = run(shared + mine, shared + theirs)
+                self.assertEqual(client.have_ids, {event_id for _, event_id in mine})
+                self.assertEqual(client.need_ids, {event_id for _, event_id in theirs})
+
+    def test_ids_sharing_a_timestamp(self):
+        rng = random.Random(1)
+        shared = [(5, "%064x" % rng.getrandbits(256)) for _ in range(1000)]
+        # Ids that only differ late in their bytes need long bound prefixes.
+        close = [(5, "ab" * 31 + "%02x" % number) for number in range(40)]
+        client, _, _ = run(shared + close[::2], shared + close[1::2])
+        self.assertEqual(client.have_ids, {event_id for _, event_id in close[::2]})
+        self.assertEqual(client.need_ids, {event_id for _, event_id in close[1::2]})
+
+    def test_data_exchanged_scales_with_the_difference(self):
+        rng = random.Random(2)
+        shared = random_items(rng, 20000)
+        _, round_trips, exchanged = run(shared + random_items(rng, 3), shared + random_items(rng, 3))
+        self.assertLess(exchanged, 20000 * 32 / 10)
+        self.assertLessEqual(round_trips, 4)
+
+    def test_rejects_malformed_messages(self):
+        relay = Negentropy([], initiator=False)
+        for message in [b"", b"\x60", b"\x61\x00\x01", b"\x61\x00\x00\x07"]:
+            with self.subTest(message=message), self.assertRaises(NegentropyError):
+                relay.reconcile(message)
+
+
+if __name__ == "__main__":
+    unittest.main()
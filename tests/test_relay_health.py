@@ -0,0 +1,62 @@
+import unittest
+
+import sys
+sys.path.append("src")
+
+from constants import PROBATION_BASE_DELAY, PROBATION_FAILURE_THRESHOLD
+from relay_health import RelayHealth
+
+
+class RelayHealthTests(unittest.TestCase):
+    def test_latency_percentiles(self):
+        health = RelayHealth()
+        self.assertIsNone(health.latency_percentile(0.5))
+        for latency in [0.01] * 8 + [0.3, 10]:
+            health.record_success(latency)
+        self.assertEqual(health.latency_percentile(0.5), 0.025)
+        self.assertEqual(health.latency_percentile(0.9), 0.5)
+        self.assertEqual(health.latency_percentile(1), 10)
+
+    def test_rates(self):
+        health = RelayHealth()
+        health.record_success(0.1, accepted=True)
+        health.record_success(0.1, accepted=False)
+        health.record_failure()
+        self.assertAlmostEqual(health.error_rate, 1 / 3)
+        self.assertEqual(health.acceptance_ratio, 0.5)
+
+    def test_probation_backs_off_exponentially(self):
+        health = RelayHealth()
+        for _ in range(PROBATION_FAILURE_THRESHOLD):
+            health.record_failure(now=0)
+        self.assertTrue(health.on_probation(now=PROBATION_BASE_DELAY - 1))
+        self.assertFalse(health.on_probation(now=PROBATION_BASE_DELAY))
+
+        for _ in range(PROBATION_FAILURE_THRESHOLD):
+            health.record_failure(now=1000)
+        self.assertTrue(health.on_probation(now=1000 + 2 * PROBATION_BASE_DELAY - 1))
+
+        health.record_success(0.1)
+        self.assertFalse(health.on_probation(now=1000))
+        self.assertEqual(health.probation_count, 0)
+
+    def test_slow_and_failing_relays_score_worse(self):
+        fast, slow, failing = RelayHealth(), RelayHealth(), RelayHealth()
+        for _ in range(10):
+            fast.record_success(0.02)
+            slow.record_success(2)
+            failing.record_success(0.02)
+            failing.record_failure()
+        self.assertLess(fast.score(), slow.score())
+        self.assertLess(fast.score(), failing.score())
+
+    def test_round_trips_through_dict(self):
+        health = RelayHealth()
+        health.record_success(0.2)
+        health.record_failure(now=0)
+        restored = RelayHealth.from_dict(health.to_dict())
+        self.assertEqual(restored.to_dict(), health.to_dict())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,193 @@
+import asyncio
+import json
+import time
+import unittest
+from unittest import mock
+
+import websockets
+
+import sys
+sys.path.append("src")
+
+from publish_result import PublishStatus
+from relay_pool import RelayPool
+
+
+async def echo_ok(websocket):
+    # Acknowledge every message, the way a relay answers an EVENT.
+    async for message in websocket:
+        frame = json.loads(message)
+        await websocket.send(json.dumps(["OK", frame[1], True, ""]))
+
+
+def ok_replier(accepted, message="", delay=0):
+    async def handler(websocket):
+        async for message_frame in websocket:
+            frame = json.loads(message_frame)
+            await asyncio.sleep(delay)
+            await websocket.send(json.dumps(["OK", frame[1]["id"], accepted, message]))
+    return handler
+
+
+async def silent(websocket):
+    async for _ in websocket:
+        pass
+
+
+async def start_server(handler):
+    return await websockets.serve(handler, "127.0.0.1", 0)
+
+
+async def stop_server(server):
+    server.close()
+    await server.wait_closed()
+
+
+class RelayPoolTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.pool = RelayPool([], publish_timeout=1)
+        self.pool.start()
+        # Cleanups run last-in first-out, so the relays are stopped before the pool is closed.
+        self.addCleanup(self.pool.close)
+        self.relay_url = self.start_relay(echo_ok)
+
+    def test_publish_returns_relay_response(self):
+        self.pool.add_relays([self.relay_url])
+        responses = self.pool.run(self.pool.publish(json.dumps(["EVENT", "abc"])))
+        self.assertEqual(responses, {self.relay_url: ["OK", "abc", True, ""]})
+
+    def test_connection_is_reused_across_publishes(self):
+        self.pool.add_relays([self.relay_url])
+        connection = self.pool.connections[self.relay_url]
+        for i in range(3):
+            self.pool.run(self.pool.publish(json.dumps(["EVENT", str(i)])))
+        self.assertIs(self.pool.connections[self.relay_url], connection)
+        self.assertEqual(connection.failures, 0)
+
+    def test_unreachable_relay_times_out(self):
+        """
+        A relay that never answers should not hold up the publish past the deadline.
+        """
+        self.pool.add_relays([self.relay_url, "ws://127.0.0.1:1"])
+        start = time.monotonic()
+        responses = self.pool.run(self.pool.publish(json.dumps(["EVENT", "abc"]), timeout=0.5))
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(responses[self.relay_url], ["OK", "abc", True, ""])
+        self.assertIsNone(responses["ws://127.0.0.1:1"])
+
+    def start_relay(self, handler):
+        server = self.pool.run(start_server(handler))
+        self.addCleanup(lambda: self.pool.run(stop_server(server)))
+        return f"ws://127.0.0.1:{server.sockets[0].getsockname()[1]}"
+
+    def test_publish_event_reports_acceptance_and_latency(self):
+        rejecting_url = self.start_relay(ok_replier(False, "blocked: spam"))
+        self.pool.add_relays([self.start_relay(ok_replier(True)), rejecting_url])
+        payload = json.dumps(["EVENT", {"id": "abc"}])
+        results = self.pool.run(self.pool.publish_event("abc", payload))
+
+        accepted = [result for result in results.values() if result.accepted]
+        self.assertEqual(len(accepted), 1)
+        self.assertIsNotNone(accepted[0].latency)
+        self.assertEqual(results[rejecting_url].status, PublishStatus.REJECTED)
+        self.assertEqual(results[rejecting_url].message, "blocked: spam")
+
+    def test_publish_event_ignores_ok_for_other_events(self):
+        async def wrong_id(websocket):
+            async for _ in websocket:
+                await websocket.send(json.dumps(["OK", "other", True, ""]))
+        relay_url = self.start_relay(wrong_id)
+        self.pool.add_relays([relay_url])
+        payload = json.dumps(["EVENT", {"id": "abc"}])
+        results = self.pool.run(self.pool.publish_event("abc", payload, timeout=0.3))
+        self.assertEqual(results[relay_url].status, PublishStatus.TIMED_OUT)
+
+    def test_publish_event_survives_an_undecodable_ok(self):
+        def decode(frame):
+            if frame[3] == "garbled":
+                raise ValueError("not JSON")
+            return frame
+        garbled_url = self.start_relay(ok_replier(True, "garbled"))
+        good_url = self.start_relay(ok_replier(True))
+        self.pool.add_relays([garbled_url, good_url])
+        payload = json.dumps(["EVENT", {"id": "abc"}])
+        with mock.patch("relay_pool.decoded_frame", side_effect=decode):
+            results = self.pool.run(self.pool.publish_event("abc", payload))
+        self.assertTrue(results[good_url].accepted)
+        self.assertEqual(results[garbled_url].status, PublishStatus.TIMED_OUT)
+
+    def test_publish_event_returns_once_quorum_is_reached(self):
+        slow_url = self.start_relay(silent)
+        fast_urls = [self.start_relay(ok_replier(True)) for _ in range(2)]
+        self.pool.add_relays(fast_urls + [slow_url])
+        payload = json.dumps(["EVENT", {"id": "abc"}])
+        start = time.monotonic()
+        results = self.pool.run(self.pool.publish_event("abc", payload, timeout=5, quorum=2))
+        self.assertLess(time.monotonic() - start, 2)
+        for url in fast_urls:
+            self.assertTrue(results[url].accepted)
+        self.assertEqual(results[slow_url].status, PublishStatus.PENDING)
+
+    def test_publish_many_reports_each_event(self):
+        rejecting_url = self.start_relay(ok_replier(False))
+        accepting_url = self.start_relay(ok_replier(True))
+        self.pool.add_relays([accepting_url, rejecting_url])
+        signed_events = [(str(i), json.dumps(["EVENT", {"id": str(i)}])) for i in range(50)]
+        report = self.pool.run(self.pool.publish_many(signed_events, window=5))
+
+        self.assertEqual(sorted(report.accepted_events()), sorted(str(i) for i in range(50)))
+        self.assertEqual(report.acknowledged_count(), 100)
+        for by_relay in report.results.values():
+            self.assertTrue(by_relay[accepting_url].accepted)
+            self.assertEqual(by_relay[rejecting_url].status, PublishStatus.REJECTED)
+
+    def test_publish_many_bounds_events_in_flight(self):
+        received = []
+
+        async def counting(websocket):
+            async for message in websocket:
+                received.append(message)
+
+        self.pool.add_relays([self.start_relay(counting)])
+        signed_events = [(str(i), json.dumps(["EVENT", {"id": str(i)}])) for i in range(10)]
+        # Nothing is ever acknowledged, so each window of 3 events has to time out before
+        # the next one is sent: 10 events take 4 rounds.
+        report = self.pool.run(self.pool.publish_many(signed_events, timeout=0.1, window=3))
+        self.assertEqual(len(received), 10)
+        self.assertGreaterEqual(report.elapsed, 0.35)
+        self.assertEqual(report.accepted_events(), [])
+
+    def test_add_relays_skips_known_urls(self):
+        self.pool.add_relays([self.relay_url, self.relay_url])
+        self.pool.add_relays([self.relay_url])
+        self.assertEqual(self.pool.relay_urls, [self.relay_url])
+
+
+    def wait_for(self, condition, timeout=5):
+        deadline = time.monotonic() + timeout
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return condition()
+
+    def test_connection_failures_are_reported(self):
+        outcomes = []
+        self.pool.on_relay_outcome = lambda *outcome: outcomes.append(outcome)
+        unreachable_url = "ws://127.0.0.1:1"
+        self.pool.add_relays([self.relay_url, unreachable_url])
+        self.assertTrue(self.wait_for(lambda: (unreachable_url, False) in outcomes))
+        self.assertTrue(self.wait_for(self.pool.connections[self.relay_url].is_connected))
+        # Connecting alone isn't an answer from the relay.
+        self.assertEqual({url for url, _ in outcomes}, {unreachable_url})
+
+    def test_remove_relays_closes_their_connections(self):
+        self.pool.add_relays([self.relay_url, "ws://127.0.0.1:1"])
+        connection = self.pool.connections["ws://127.0.0.1:1"]
+        self.pool.remove_relays(["ws://127.0.0.1:1", "ws://unknown"])
+        self.assertEqual(self.pool.relay_urls, [self.relay_url])
+        self.assertEqual(list(self.pool.connections), [self.relay_url])
+        self.assertEqual(self.pool.subscriptions.relay_urls, [self.relay_url])
+        self.assertIsNone(connection._task)
+
+
+if __name__ == '__main__':
+    unittest.main()
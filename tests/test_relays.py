@@ -5,6 +5,8 @@ sys.path.append("src")
 
 from relays import Relays
 from config import RELAY_FILE_KEY
+from constants import PROBATION_BASE_DELAY, PROBATION_FAILURE_THRESHOLD
+from publish_result import PublishResult, PublishStatus
 
 class RelaysTests(unittest.TestCase):
     def setUp(self) -> None:
@@ -127,3 +129,51 @@ class RelaysTests(unittest.TestCase):
         # Ensure that the new relay was added to the relay_urls
         self.assertIn(new_relay, relays.relay_urls)
         os.remove(test_relay_file)
+
+    def test_load_relays_keeps_file_order(self):
+        """
+        Relays should be loaded in the order of the relay file, without duplicates.
+        """
+        test_relays = ["relay3", "relay1", "relay2", "relay1"]
+        with open(self.test_relay_file, "w") as f:
+            f.write("\n".join(test_relays))
+        self.relays.load_relays_from_file()
+        self.assertEqual(self.relays.relay_urls, ["relay3", "relay1", "relay2"])
+
+    def test_select_relays_prefers_healthy_relays(self):
+        """
+        select_relays() should put fast relays first and leave out relays on probation,
+        and the health records should survive a reload.
+        """
+        with open(self.test_relay_file, "w") as f:
+            f.write("\n".join(["dead", "slow", "fast", "unknown"]))
+        self.relays.load_relays_from_file()
+        for _ in range(5):
+            self.relays.record_publish_results({
+                "dead": PublishResult("dead", PublishStatus.TIMED_OUT),
+                "slow": PublishResult("slow", PublishStatus.ACCEPTED, latency=2),
+                "fast": PublishResult("fast", PublishStatus.ACCEPTED, latency=0.01),
+            })
+        self.assertEqual(self.relays.select_relays(), ["fast", "unknown", "slow"])
+        self.assertEqual(self.relays.select_relays(2), ["fast", "unknown"])
+
+        self.relays.save_health()
+        with unittest.mock.patch("config.UserConfig.get_client_config", return_value=self.test_relay_file):
+            reloaded = Relays.get_relays()
+        os.remove(self.relays.health_file())
+        self.assertEqual(reloaded.select_relays(), ["fast", "unknown", "slow"])
+
+    def test_relay_outcomes_only_end_probation_when_the_relay_answers(self):
+        """
+        record_relay_outcome() should back off further with each round of failures,
+        and only a subscription answer should end the probation, without counting as a latency.
+        """
+        for round_start in [0, 1000]:
+            for _ in range(PROBATION_FAILURE_THRESHOLD):
+                self.relays.record_relay_outcome("relay1", False, now=round_start)
+        health = self.relays.get_health("relay1")
+        self.assertEqual(health.probation_until, 1000 + 2 * PROBATION_BASE_DELAY)
+
+        self.relays.record_relay_outcome("relay1", True)
+        self.assertEqual((health.probation_until, health.probation_count), (0, 0))
+        self.assertIsNone(health.latency_percentile(0.5))
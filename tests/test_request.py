@@ -0,0 +1,46 @@
+import json
+import unittest
+
+import sys
+sys.path.append("src")
+
+from request import Request
+
+
+class ScriptedInterface:
+    def __init__(self, answers):
+        self.answers = list(answers)
+
+    def get_input(self, prompt=">"):
+        return self.answers.pop(0)
+
+    def get_comma_sep_list(self, item_name):
+        return [item.strip() for item in self.get_input().split(",") if item.strip()]
+
+
+class RequestTests(unittest.TestCase):
+    def test_equal_filters_share_the_id_and_payloads(self):
+        first = Request("me", {"kinds": [1, 7], "authors": ["aa", "bb"], "limit": 5})
+        second = Request("me", {"limit": "5", "authors": ["bb", "aa", "aa"], "kinds": [7, 1]})
+        self.assertEqual(first.subscription_id, second.subscription_id)
+        self.assertIs(first.start_subscription_payload(), second.start_subscription_payload())
+        self.assertIs(first.stop_subscription_payload(), second.stop_subscription_payload())
+        self.assertNotEqual(first.subscription_id, Request("you", first.subscription_params).subscription_id)
+        self.assertEqual(Request.get_subscription_id("me", second.subscription_params), first.subscription_id)
+
+    def test_payloads(self):
+        request = Request("me", {"kinds": [1], "#t": ["b", "a"]})
+        self.assertEqual(json.loads(request.start_subscription_payload()),
+                         ["REQ", request.subscription_id, {"#t": ["a", "b"], "kinds": [1]}])
+        self.assertEqual(json.loads(request.stop_subscription_payload()), ["CLOSE", request.subscription_id])
+
+    def test_input_is_typed(self):
+        interface = ScriptedInterface(["", "", "1, 7", "", "", "100", "", "20"])
+        request = Request.setup_subscription_from_input("me", interface)
+        self.assertEqual(request.subscription_params, {"kinds": [1, 7], "limit": 20, "since": 100})
+        with self.assertRaises(ValueError):
+            Request.setup_subscription_from_input("me", ScriptedInterface(["", "", "", "", "", "", "", "many"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
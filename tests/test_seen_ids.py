@@ -0,0 +1,69 @@
+import secrets
+import unittest
+
+import sys
+sys.path.append("src")
+
+from seen_ids import BloomFilter, RotatingBloomFilter, SeenIdCache
+
+
+def random_id():
+    return secrets.token_hex(32)
+
+
+class SeenIdCacheTests(unittest.TestCase):
+    def test_add_reports_duplicates(self):
+        cache = SeenIdCache(10)
+        event_id = random_id()
+        self.assertTrue(cache.add(event_id))
+        self.assertFalse(cache.add(event_id))
+        self.assertIn(event_id, cache)
+
+    def test_least_recently_seen_id_is_evicted(self):
+        cache = SeenIdCache(2)
+        first, second, third = random_id(), random_id(), random_id()
+        cache.add(first)
+        cache.add(second)
+        # Seeing the first id again makes the second one the least recently seen.
+        cache.add(first)
+        cache.add(third)
+        self.assertEqual(len(cache), 2)
+        self.assertIn(first, cache)
+        self.assertNotIn(second, cache)
+
+    def test_accepts_non_hex_ids(self):
+        cache = SeenIdCache()
+        self.assertTrue(cache.add("not hex"))
+        self.assertFalse(cache.add("not hex"))
+
+
+class BloomFilterTests(unittest.TestCase):
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(1000, 0.01)
+        ids = [random_id() for _ in range(1000)]
+        for event_id in ids:
+            bloom.add(event_id)
+        for event_id in ids:
+            self.assertIn(event_id, bloom)
+            self.assertFalse(bloom.add(event_id))
+
+    def test_false_positive_rate_is_near_target(self):
+        bloom = BloomFilter(1000, 0.01)
+        for _ in range(1000):
+            bloom.add(random_id())
+        false_positives = sum(1 for _ in range(10000) if random_id() in bloom)
+        self.assertLess(false_positives / 10000, 0.03)
+
+    def test_rotating_filter_stays_bounded(self):
+        bloom = RotatingBloomFilter(100, 0.01)
+        ids = [random_id() for _ in range(1000)]
+        for event_id in ids:
+            bloom.add(event_id)
+        self.assertLessEqual(len(bloom), 200)
+        # The most recent ids are still remembered.
+        for event_id in ids[-50:]:
+            self.assertIn(event_id, bloom)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+import asyncio
+import json
+import unittest
+
+import websockets
+
+import sys
+sys.path.append("src")
+
+from relay_pool import RelayPool
+from request import Request
+
+
+def make_event(event_id, pubkey="abc"):
+    return {"id": event_id, "pubkey": pubkey, "created_at": 100, "kind": 1, "tags": [], "content": "", "sig": ""}
+
+
+def stored_events_relay(events, received):
+    """
+    Answers every REQ with the given events and an EOSE, and records all frames it receives.
+    """
+    async def handler(websocket):
+        async for message in websocket:
+            frame = json.loads(message)
+            received.append(frame)
+            if frame[0] == "REQ":
+                for event in events:
+                    await websocket.send(json.dumps(["EVENT", frame[1], event]))
+                await websocket.send(json.dumps(["EOSE", frame[1]]))
+    return handler
+
+
+async def start_server(handler):
+    return await websockets.serve(handler, "127.0.0.1", 0)
+
+
+async def stop_server(server):
+    server.close()
+    await server.wait_closed()
+
+
+async def collect(subscription, count):
+    items = []
+    async for item in subscription:
+        items.append(item)
+        if len(items) == count:
+            break
+    return items
+
+
+class SubscriptionTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.pool = RelayPool([])
+        self.pool.start()
+        self.addCleanup(self.pool.close)
+        self.request = Request.setup_subscription_with_params("subscriber", authors=["abc"])
+
+    def start_relay(self, handler):
+        server = self.pool.run(start_server(handler))
+        self.addCleanup(lambda: self.pool.run(stop_server(server)))
+        return f"ws://127.0.0.1:{server.sockets[0].getsockname()[1]}"
+
+    def test_streams_events_from_every_relay(self):
+        events_by_relay = {}
+        for relay_index in range(2):
+            events = [make_event(f"{relay_index}-{i}") for i in range(5)]
+            events_by_relay[self.start_relay(stored_events_relay(events, []))] = events
+        urls = list(events_by_relay)
+        self.pool.add_relays(urls)
+        subscription = self.pool.run(self.pool.subscribe(self.request))
+
+        items = self.pool.run(collect(subscription, 10), timeout=5)
+        for url in urls:
+            self.assertEqual([event for relay_url, event in items if relay_url == url], events_by_relay[url])
+        self.assertTrue(self.pool.run(subscription.wait_for_eose(timeout=5)))
+        self.assertEqual(subscription.eose_relays, set(urls))
+        self.pool.run(subscription.close())
+
+    def test_dedupes_events_across_relays(self):
+        events = [make_event(str(i)) for i in range(5)]
+        urls = [self.start_relay(stored_events_relay(events, [])) for _ in range(3)]
+        self.pool.add_relays(urls)
+        subscription = self.pool.run(self.pool.subscribe(self.request))
+        self.pool.run(subscription.wait_for_eose(timeout=5))
+        self.pool.run(subscription.close())
+
+        items = list(self.pool.iterate(subscription))
+        self.assertEqual(sorted(event["id"] for _, event in items), ["0", "1", "2", "3", "4"])
+        self.assertEqual(sum(subscription.duplicates.values()), 10)
+
+    def test_drops_events_not_matching_the_filter(self):
+        events = [make_event("1"), make_event("2", pubkey="def"), {"id": "3"}]
+        relay_url = self.start_relay(stored_events_relay(events, []))
+        self.pool.add_relays([relay_url])
+        subscription = self.pool.run(self.pool.subscribe(self.request))
+        self.pool.run(subscription.wait_for_eose(timeout=5))
+        self.pool.run(subscription.close())
+
+        self.assertEqual([event["id"] for _, event in self.pool.iterate(subscription)], ["1"])
+        self.assertEqual(subscription.mismatches[relay_url], 2)
+
+    def test_close_sends_close_and_ends_iteration(self):
+        received = []
+        self.pool.add_relays([self.start_relay(stored_events_relay([], received))])
+        subscription = self.pool.run(self.pool.subscribe(self.request))
+        self.pool.run(subscription.wait_for_eose(timeout=5))
+        self.pool.run(subscription.close())
+
+        self.assertEqual(list(self.pool.iterate(subscription)), [])
+        # Give the relay a moment to read the CLOSE.
+        self.pool.run(asyncio.sleep(0.2))
+        self.assertEqual(received[0], json.loads(self.request.start_subscription_payload()))
+        self.assertEqual(received[1], ["CLOSE", self.request.subscription_id])
+
+    def test_ignores_frames_for_other_subscriptions(self):
+        other_request = Request.setup_subscription_with_params("subscriber", event_kinds=[1])
+        self.pool.add_relays([self.start_relay(stored_events_relay([make_event("1")], []))])
+        subscription = self.pool.run(self.pool.subscribe(self.request))
+        other_subscription = self.pool.run(self.pool.subscribe(other_request))
+        self.pool.run(subscription.wait_for_eose(timeout=5))
+        self.pool.run(other_subscription.wait_for_eose(timeout=5))
+        self.pool.run(subscription.close())
+        self.pool.run(other_subscription.close())
+
+        self.assertEqual(len(list(self.pool.iterate(subscription))), 1)
+        self.assertEqual(len(list(self.pool.iterate(other_subscription))), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
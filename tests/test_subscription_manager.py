@@ -0,0 +1,147 @@
+import unittest
+
+import sys
+sys.path.append("src")
+
+from mock_relay import MockRelay
+from relay_pool import RelayPool
+from request import Request
+from subscription_manager import merge_key
+
+
+def make_event(event_id, pubkey, kind=1):
+    return {"id": event_id, "pubkey": pubkey, "created_at": 100, "kind": kind, "tags": [], "content": "", "sig": ""}
+
+
+async def drain(subscription):
+    await subscription.wait_for_eose(timeout=5)
+    await subscription.close()
+    return sorted([event["id"] async for _, event in subscription])
+
+
+class SubscriptionManagerTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.relay = MockRelay()
+        self.relay.events = {
+            "1": make_event("1", "aa" * 32),
+            "2": make_event("2", "bb" * 32),
+            "3": make_event("3", "cc" * 32, kind=0),
+        }
+
+    def start_pool(self, **options):
+        pool = RelayPool([], **options)
+        pool.start()
+        self.addCleanup(pool.close)
+        url = pool.run(self.relay.start())
+        self.addCleanup(lambda: pool.run(self.relay.stop()))
+        pool.add_relays([url])
+        return pool
+
+    def test_merge_key(self):
+        self.assertEqual(merge_key({"authors": ["a"], "kinds": [1]}), merge_key({"kinds": [1], "authors": ["b"]}))
+        self.assertNotEqual(merge_key({"authors": ["a"], "kinds": [1]})[0], merge_key({"authors": ["b"], "kinds": [0]})[0])
+        self.assertEqual(merge_key({"authors": ["a"], "limit": 1})[1], None)
+        self.assertEqual(merge_key({"authors": ["a"], "kinds": [7, 1]}), merge_key({"kinds": ["1", 7], "authors": ["b"]}))
+        self.assertEqual(merge_key({"ids": ["b", "a"], "limit": 1}), merge_key({"limit": 1, "ids": ["a", "b"]}))
+
+    def test_compatible_filters_share_one_req(self):
+        pool = self.start_pool()
+        first = pool.run(pool.subscribe(Request("me", {"authors": ["aa" * 32], "kinds": [1]})))
+        second = pool.run(pool.subscribe(Request("me", {"authors": ["bb" * 32], "kinds": [1]})))
+        pool.run(first.wait_for_eose(timeout=5))
+        pool.run(second.wait_for_eose(timeout=5))
+        self.assertEqual(self.relay.subscription_count(), 1)
+        self.assertEqual(len(pool.subscriptions.groups), 1)
+
+        self.assertEqual(pool.run(drain(first)), ["1"])
+        self.assertEqual(pool.run(drain(second)), ["2"])
+        self.assertEqual(pool.subscriptions.groups, {})
+
+    def test_one_listener_per_connection(self):
+        pool = self.start_pool()
+        for kind in range(10):
+            pool.run(pool.subscribe(Request("me", {"kinds": [kind], "limit": 5})))
+        connection = list(pool.connections.values())[0]
+        self.assertEqual(len(connection.listeners), 1)
+
+    def test_subscriptions_beyond_the_limit_wait_for_a_free_slot(self):
+        pool = self.start_pool(max_subscriptions_per_relay=1)
+        url = pool.relay_urls[0]
+        first = pool.run(pool.subscribe(Request("me", {"kinds": [1], "limit": 5})))
+        second = pool.run(pool.subscribe(Request("me", {"kinds": [0], "limit": 5})))
+        self.assertEqual(pool.subscriptions.open_count(url), (1, 1))
+        self.assertFalse(pool.run(second.wait_for_eose(timeout=0.3)))
+
+        self.assertEqual(pool.run(drain(first)), ["1", "2"])
+        self.assertEqual(pool.run(drain(second)), ["3"])
+        self.assertEqual(pool.subscriptions.open_count(url), (0, 0))
+
+    def test_requeues_subscriptions_the_relay_refuses(self):
+        self.relay.max_subscriptions = 1
+        pool = self.start_pool(max_subscriptions_per_relay=5)
+        url = pool.relay_urls[0]
+        first = pool.run(pool.subscribe(Request("me", {"kinds": [1], "limit": 5})))
+        pool.run(first.wait_for_eose(timeout=5))
+        second = pool.run(pool.subscribe(Request("me", {"kinds": [0], "limit": 5})))
+        self.assertFalse(pool.run(second.wait_for_eose(timeout=0.3)))
+        self.assertEqual(pool.subscriptions.open_count(url), (1, 1))
+
+        pool.run(first.close())
+        self.assertEqual(pool.run(drain(second)), ["3"])
+
+        # Each EOSE lets the lowered limit grow back towards the configured one.
+        self.assertEqual(pool.subscriptions.relays[url].max_subscriptions, 2)
+
+    def test_limit_is_restored_on_reconnect(self):
+        pool = self.start_pool(max_subscriptions_per_relay=5)
+        relay = pool.subscriptions.relays[pool.relay_urls[0]]
+        relay.max_subscriptions = 1
+
+        async def reconnect():
+            relay._on_connect()
+
+        pool.run(reconnect())
+        self.assertEqual(relay.max_subscriptions, 5)
+
+    def test_joining_a_req_keeps_the_others_eose(self):
+        pool = self.start_pool()
+        url = pool.relay_urls[0]
+        first = pool.run(pool.subscribe(Request("me", {"authors": ["aa" * 32], "kinds": [1]})))
+        pool.run(first.wait_for_eose(timeout=5))
+        second = pool.run(pool.subscribe(Request("me", {"authors": ["bb" * 32], "kinds": [1]})))
+        self.assertEqual(first.eose_relays, {url})
+        self.assertEqual(second.eose_relays, set())
+        self.assertTrue(pool.run(second.wait_for_eose(timeout=5)))
+        pool.run(second.close())
+        self.assertEqual(first.eose_relays, {url})
+        self.assertEqual(pool.run(drain(first)), ["1"])
+
+    def test_restricted_and_unrestricted_reqs_for_one_filter_are_kept_apart(self):
+        pool = self.start_pool()
+        url = pool.relay_urls[0]
+        everywhere = pool.run(pool.subscribe(Request("me", {"kinds": [1]})))
+        restricted = pool.run(pool.subscribe(Request("me", {"kinds": [1]}), relay_urls=[url]))
+        self.assertEqual(len(pool.subscriptions.groups), 2)
+        self.assertEqual(pool.subscriptions.open_count(url), (2, 0))
+        self.assertEqual(pool.run(drain(restricted)), ["1", "2"])
+        self.assertEqual(pool.run(drain(everywhere)), ["1", "2"])
+
+    def test_eose_is_reported(self):
+        outcomes = []
+        pool = self.start_pool(on_relay_outcome=lambda *outcome: outcomes.append(outcome))
+        url = pool.relay_urls[0]
+        subscription = pool.run(pool.subscribe(Request("me", {"kinds": [1]})))
+        pool.run(subscription.wait_for_eose(timeout=5))
+        self.assertEqual(outcomes, [(url, True)])
+
+    def test_removed_relays_are_not_waited_for(self):
+        pool = self.start_pool()
+        pool.add_relays(["ws://127.0.0.1:1"])
+        subscription = pool.run(pool.subscribe(Request("me", {"kinds": [1]})))
+        self.assertFalse(pool.run(subscription.wait_for_eose(timeout=0.3)))
+        pool.remove_relays(["ws://127.0.0.1:1"])
+        self.assertTrue(pool.run(subscription.wait_for_eose(timeout=5)))
+
+
+if __name__ == '__main__':
+    unittest.main()
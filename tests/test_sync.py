@@ -0,0 +1,137 @@
+import unittest
+
+import sys
+sys.path.append("src")
+
+from event_store import EventStore
+from mock_relay import MockRelay
+from relay_pool import RelayPool
+from sync import SyncState, Synchronizer, filter_key
+
+FILTER = {"kinds": [1]}
+
+
+def make_event(number, created_at):
+    return {"id": "%064x" % number, "pubkey": "ab" * 32, "created_at": created_at, "kind": 1, "tags": [],
+            "content": str(number), "sig": "cd" * 64}
+
+
+class SyncTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.pool = RelayPool([])
+        self.pool.start()
+        self.addCleanup(self.pool.close)
+        self.relays = [MockRelay(), MockRelay()]
+        self.urls = [self.start_relay(relay) for relay in self.relays]
+        self.state = SyncState(":memory:")
+        self.store = EventStore(":memory:")
+        self.addCleanup(self.state.close)
+        self.addCleanup(self.store.close)
+
+    def start_relay(self, relay):
+        url = self.pool.run(relay.start())
+        self.addCleanup(lambda: self.pool.run(relay.stop()))
+        self.pool.add_relays([url])
+        return url
+
+    def add_events(self, relay, numbers, created_at=None):
+        for number in numbers:
+            event = make_event(number, created_at if created_at is not None else 1000 + number)
+            relay.events[event["id"]] = event
+
+    def synchronizer(self, **kwargs):
+        return Synchronizer(self.pool, self.state, self.store, window=3, timeout=5, **kwargs)
+
+    def test_backfill_pages_every_relay_and_records_high_water_marks(self):
+        self.add_events(self.relays[0], range(10))
+        self.add_events(self.relays[1], range(5, 12))
+        results = self.pool.run(self.synchronizer().backfill("me", FILTER))
+        # Events both relays have are only new from whichever sent them first.
+        self.assertEqual(sum(kept for kept, _ in results.values()), 12)
+        self.assertTrue(all(done for _, done in results.values()))
+        self.assertEqual(len(self.store), 12)
+        key = filter_key(FILTER)
+        self.assertEqual(self.state.high_water_mark(key, self.urls[0]), (1009, True))
+        self.assertEqual(self.state.checkpoint(key, self.urls[1]), (None, True))
+        # A finished backfill isn't repeated.
+        self.assertEqual(self.pool.run(self.synchronizer().backfill("me", FILTER))[self.urls[0]], (0, True))
+
+    def test_sync_only_fetches_events_past_the_high_water_mark(self):
+        self.add_events(self.relays[0], range(4))
+        synchronizer = self.synchronizer()
+        self.assertEqual(self.pool.run(synchronizer.sync("me", FILTER))[self.urls[0]], (4, True))
+        self.assertEqual(synchronizer.resume_filter(FILTER, self.urls[0]), {"kinds": [1], "since": 1003})
+        self.add_events(self.relays[0], range(4, 11))
+        received = []
+        synchronizer.on_event = lambda relay_url, event: received.append(event["content"])
+        self.pool.run(synchronizer.sync("me", FILTER))
+        self.assertEqual(sorted(received, key=int), [str(number) for number in range(4, 11)])
+        self.assertEqual(self.state.high_water_mark(filter_key(FILTER), self.urls[0]), (1010, True))
+
+    def test_interrupted_backfill_resumes_from_its_checkpoint(self):
+        self.add_events(self.relays[0], range(12))
+        fetched = []
+
+        def crash_after_four(relay_url, event):
+            fetched.append(event["id"])
+            if len(fetched) == 4:
+                raise RuntimeError("worker died")
+
+        with self.assertRaises(RuntimeError):
+            self.pool.run(self.synchronizer(on_event=crash_after_four).backfill("me", FILTER, [self.urls[0]]))
+        until, done = self.state.checkpoint(filter_key(FILTER), self.urls[0])
+        self.assertFalse(done)
+        self.assertLess(until, 1011)
+
+        resumed = []
+        results = self.pool.run(self.synchronizer(on_event=lambda _, event: resumed.append(event)).backfill(
+            "me", FILTER, [self.urls[0]]))
+        self.assertEqual(results[self.urls[0]][1], True)
+        self.assertEqual(len(self.store), 12)
+        # Only the windows after the checkpoint were fetched again.
+        self.assertLess(len(resumed), 12)
+
+    def test_windows_move_past_a_second_with_too_many_events(self):
+        self.add_events(self.relays[0], range(5), created_at=2000)
+        self.add_events(self.relays[0], range(5, 8))
+        results = self.pool.run(self.synchronizer().backfill("me", FILTER, [self.urls[0]]))
+        self.assertEqual(results[self.urls[0]][1], True)
+        self.assertEqual({event["content"] for event in self.store.query({"until": 1999})}, {"5", "6", "7"})
+
+    def test_reconcile_only_fetches_the_missing_events(self):
+        self.add_events(self.relays[0], range(200))
+        held = [make_event(number, 1000 + number) for number in range(200) if number % 40]
+        only_here = make_event(500, 1500)
+        self.store.add_many(held + [only_here])
+        synchronizer = self.synchronizer()
+        results = self.pool.run(synchronizer.reconcile("me", FILTER, [self.urls[0]]))
+        self.assertEqual(results[self.urls[0]], (5, True))
+        self.assertEqual(self.relays[0].sent_count, 5)
+        self.assertEqual(len(self.store), 201)
+        self.assertEqual(synchronizer.missing_on_relay[self.urls[0]], {only_here["id"]})
+        self.assertEqual(self.relays[0].subscription_count(), 0)
+        self.assertEqual(self.state.high_water_mark(filter_key(FILTER), self.urls[0]), (1500, True))
+
+    def test_reconcile_falls_back_to_sync_without_nip_77(self):
+        relay = MockRelay(negentropy=False)
+        url = self.start_relay(relay)
+        self.add_events(relay, range(4))
+        synchronizer = self.synchronizer()
+        self.assertEqual(self.pool.run(synchronizer.reconcile("me", FILTER, [url]))[url], (4, True))
+        self.assertNotIn(url, synchronizer.missing_on_relay)
+
+    def test_equivalent_filters_share_their_key(self):
+        self.assertEqual(filter_key({"authors": ["b", "a"], "kinds": [1], "since": 5}),
+                         filter_key({"kinds": ["1"], "authors": ["a", "b", "a"]}))
+        self.assertNotEqual(filter_key({"kinds": [1]}), filter_key({"kinds": [1, 7]}))
+
+    def test_unfinished_sync_keeps_the_previous_mark(self):
+        self.state.record_sync("key", "wss://relay", 50, True)
+        self.state.record_sync("key", "wss://relay", 90, False)
+        self.assertEqual(self.state.high_water_mark("key", "wss://relay"), (50, False))
+        self.state.record_sync("key", "wss://relay", 40, True)
+        self.assertEqual(self.state.high_water_mark("key", "wss://relay"), (50, True))
+
+
+if __name__ == "__main__":
+    unittest.main()
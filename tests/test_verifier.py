@@ -0,0 +1,80 @@
+import json
+import time
+import unittest
+
+import sys
+sys.path.append("src")
+
+from event import BaseEvent, TextEvent
+from key_pair import KeyPair
+from verifier import EventVerifier, verify_event
+
+
+def signed_event(keys, content):
+    created_at = int(time.time())
+    fields = [0, keys.pubkey_hex_string(), created_at, 1, [], content]
+    serialized = json.dumps(fields, separators=(',', ':'), ensure_ascii=False).encode()
+    event_id = BaseEvent.get_id_from_stamped_event(serialized)
+    return {
+        "id": event_id,
+        "pubkey": keys.pubkey_hex_string(),
+        "created_at": created_at,
+        "kind": 1,
+        "tags": [],
+        "content": content,
+        "sig": keys.sign_bytes(bytes.fromhex(event_id)),
+    }
+
+
+class VerifierTests(unittest.TestCase):
+    def setUp(self) -> None:
+        self.keys = KeyPair.create_new_key_pair()
+
+    def test_valid_event(self):
+        self.assertTrue(verify_event(signed_event(self.keys, "Hello there")))
+
+    def test_non_ascii_content(self):
+        self.assertTrue(verify_event(signed_event(self.keys, "Selam, ሰላም")))
+
+    def test_tampered_content(self):
+        event = signed_event(self.keys, "Hello there")
+        event["content"] = "Goodbye"
+        self.assertFalse(verify_event(event))
+
+    def test_signature_by_other_key(self):
+        event = signed_event(self.keys, "Hello there")
+        other_keys = KeyPair.create_new_key_pair()
+        event["sig"] = other_keys.sign_bytes(bytes.fromhex(event["id"]))
+        self.assertFalse(verify_event(event))
+
+    def test_malformed_event(self):
+        self.assertFalse(verify_event({"id": "abc"}))
+        event = signed_event(self.keys, "Hello there")
+        event["sig"] = "zz"
+        self.assertFalse(verify_event(event))
+
+    def test_verify_many_keeps_order(self):
+        events = [signed_event(self.keys, str(i)) for i in range(20)]
+        events[7]["content"] = "tampered"
+        expected = [i != 7 for i in range(20)]
+        with EventVerifier(processes=2, batch_size=3) as verifier:
+            self.assertEqual(verifier.verify_many(events), expected)
+        self.assertEqual(EventVerifier(processes=0).verify_many(events), expected)
+
+    def test_text_event_from_base_event_verifies(self):
+        event = TextEvent(self.keys.pubkey_hex_string(), "Hello there")
+        timestamp, serialized = event.stamped_event()
+        event_id = BaseEvent.get_id_from_stamped_event(serialized)
+        self.assertTrue(verify_event({
+            "id": event_id,
+            "pubkey": event.author,
+            "created_at": timestamp,
+            "kind": event.get_kind(),
+            "tags": event.tags,
+            "content": event.content,
+            "sig": self.keys.sign_bytes(bytes.fromhex(event_id)),
+        }))
+
+
+if __name__ == '__main__':
+    unittest.main()